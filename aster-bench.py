@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+aster-bench.py  (benchmark suite)
+- grid : เทียบ hot path แบบ Decimal เดิม กับ Grid (จำนวนเต็ม tick/step) ของ aster-maker15.py
+         ก่อนจับเวลา ตรวจว่าผลตรงกันทุกหลักบนค่าสุ่ม (format คำสั่ง, ปัดจำนวนจากทุน/เงินสด, แปลง step ข้ามกริด, notional)
+         ถ้าไม่ตรงแม้แต่ค่าเดียว → exit 1
+- micro: _quant_floor, _fmt, sign, depth() (parse response), est_open/est_close, guards_ok_for_close
+- macro: รอบเต็ม attach_or_open_pair (วาง → ถูกเติม → คู่พร้อม) + close_pair_maker_first ผ่าน transport ปลอม
+         ในโปรเซสเดียวกัน (matching engine ของ aster-sim.py, ไม่มี socket) หน่วง --latency-ms ต่อคำขอ
+- รายงาน throughput, p50/p99 ต่อครั้ง, หน่วยความจำที่จองสูงสุดต่อครั้ง (tracemalloc)
+  --save เก็บ baseline เป็น JSON; --baseline เทียบแล้วติดธง REGRESSION (ช้าลง/จองมากขึ้นเกิน --tolerance) → exit 2
+
+ตัวอย่าง:
+python3 aster-bench.py --n 100000
+python3 aster-bench.py --suite micro,macro --save bench-base.json
+python3 aster-bench.py --suite micro,macro --baseline bench-base.json --latency-ms 2 --maker-args="--parallel"
+"""
+
+import os, sys, time, json, shlex, random, argparse, platform, tracemalloc, importlib.util
+from urllib.parse import urlsplit, parse_qsl
+
+def _load(name, fname):
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), fname)
+    spec = importlib.util.spec_from_file_location(name, path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+os.environ.setdefault("ASTERDEX_API_KEY", "bench")  # คำขอ signed ถูกเซ็นจริง (transport ปลอมไม่ตรวจ)
+os.environ.setdefault("ASTERDEX_API_SECRET", "bench")
+mk = _load("aster_maker15", "aster-maker15.py")
+sim = _load("aster_sim", "aster-sim.py")
+D, _fmt, _quant_floor = mk.D, mk._fmt, mk._quant_floor
+
+# ---------- reference: Decimal path (ก่อนมี Grid) ----------
+def dec_levels(rows): return [(D(p), D(q)) for p,q in rows]
+
+def dec_target(capital, px, step, whole=False):
+    if px <= 0: return D("0")
+    qty = D(capital)/px
+    if whole: qty = D(int(qty))
+    return _quant_floor(qty, step)
+
+def dec_est_close(qty, s_px, f_px, a, b, c):
+    fee = qty*s_px*D(a)/D(10000) + qty*f_px*D(b)/D(10000)
+    slip = qty*(s_px+f_px)/D(2) * D(c)/D(10000)
+    return -(f_px - s_px)*qty - fee - slip
+
+# ---------- bit-exact check ----------
+TICKS = ["0.0001", "0.00010000", "0.01", "0.1", "1", "0.5", "0.00000100", "10"]
+STEPS = ["0.01", "0.00100000", "1", "0.1", "0.001", "0.05", "1.00000000", "10"]
+
+def _rnd_dec(r, hi=10**7, dmax=10):
+    d = r.randint(0, dmax)
+    v = r.randint(0, hi*10**d)
+    return f"{v//10**d}.{v%10**d:0{d}d}" if d else str(v)
+
+def verify(n, seed):
+    r = random.Random(seed)
+    bad = []
+    def chk(name, got, want, *ctx):
+        if got != want: bad.append((name, got, want) + ctx)
+    for _ in range(n):
+        tick, step, step2 = r.choice(TICKS), r.choice(STEPS), r.choice(STEPS)
+        mn = r.choice(["5", "0", "1", "5.5", "100"])
+        g, g2 = mk.Grid(tick, step, mn), mk.Grid(tick, step2)
+        x = _rnd_dec(r)
+        chk("fmt_px", g.fmt_px(g.px(x)), _fmt(D(x), D(tick)), x, tick)
+        chk("fmt_qty", g.fmt_qty(g.qty(x)), _fmt(D(x), D(step)), x, step)
+        chk("qty_float", g.fmt_qty(g.qty(float(x))), _fmt(D(float(x)), D(step)), x, step)
+        t = g.px(_rnd_dec(r, 10**4, 8))
+        if t > 0:
+            px = D(tick)*t
+            cap = r.choice([_rnd_dec(r, 10**5, 6), r.uniform(0, 1e5)])
+            for whole in (False, True):
+                chk("qty_for", g.fmt_qty(g.qty_for(cap, t, whole)), _fmt(dec_target(cap, px, D(step), whole), D(step)),
+                    cap, t, tick, step, whole)
+        k = g.qty(x)
+        chk("notional", g.notional_ok(k, t), k > 0 and D(step)*k*D(tick)*t >= D(mn), x, t, mn)
+        chk("steps_from", g.fmt_qty(g.steps_from(g2, g2.qty(x))), _fmt(_quant_floor(D(x), D(step2)), D(step)), x, step, step2)
+        chk("p", g.p(t), float(D(tick)*t), t, tick)
+        onp = _fmt(D(x), D(tick))
+        chk("ticks", g.ticks(onp + ("0000" if "." in onp else "")), g.px(onp), onp, tick)  # สตริง exchange เติม 0 ท้าย
+    return bad
+
+# ---------- timing ----------
+def bench(fn, n):
+    t0 = time.perf_counter()
+    for _ in range(n): fn()
+    return (time.perf_counter() - t0)/n*1e9
+
+def alloc_peak(fn):
+    """หน่วยความจำที่จองสูงสุดระหว่างเรียก fn() หนึ่งครั้ง (byte, หลัง warm-up)"""
+    fn()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        cur, _ = tracemalloc.get_traced_memory()
+        fn()
+        return tracemalloc.get_traced_memory()[1] - cur
+    finally:
+        tracemalloc.stop()
+
+def summarize(per_ns, total_s, n, alloc):
+    per = sorted(per_ns)
+    return {"ops_s": n/max(total_s, 1e-12), "p50_ns": per[len(per)//2],
+            "p99_ns": per[min(len(per) - 1, int(len(per)*0.99))], "alloc_b": alloc, "n": n}
+
+def measure(fn, n, batch=100):
+    """n ครั้งแบ่งเป็นชุดละ batch → p50/p99 ของเวลาเฉลี่ยต่อครั้งในแต่ละชุด (เลี่ยง overhead ของ timer ต่อครั้ง)"""
+    fn()
+    rounds, per = max(1, n//batch), []
+    t = time.perf_counter()
+    for _ in range(rounds):
+        t0 = time.perf_counter_ns()
+        for _ in range(batch): fn()
+        per.append((time.perf_counter_ns() - t0)/batch)
+    return summarize(per, time.perf_counter() - t, rounds*batch, alloc_peak(fn))
+
+def _t(ns):
+    return f"{ns:.0f}ns" if ns < 1e4 else f"{ns/1e3:.1f}us" if ns < 1e7 else f"{ns/1e6:.1f}ms"
+
+def cases():
+    sg, fg = mk.Grid("0.0001", "0.01", "5"), mk.Grid("0.0001", "1", "5")
+    rows = [(f"{1.0234 - i*0.0001:.8f}", f"{500 + 13*i:.8f}") for i in range(20)]
+    qs, ps = D("1234.56"), D("1.0234")
+    qn, pt = sg.qty("1234.56"), sg.px("1.0234")
+    sd, fd = D("1.0230"), D("1.0055")
+    st, fm = sg.px("1.0230"), 1.0055
+    return [
+        ("depth 20 levels", lambda: dec_levels(rows),
+                            lambda: [(sg.ticks(p), sg.steps(q)) for p,q in rows]),
+        ("order format",    lambda: (_fmt(qs, sg.step), _fmt(ps, sg.tick)),
+                            lambda: (sg.fmt_qty(qn), sg.fmt_px(pt))),
+        ("size from capital", lambda: dec_target(120.0, ps, sg.step),
+                              lambda: mk.target_qty_from_capital(120.0, pt, sg)),
+        ("notional check",  lambda: qs*ps >= D("5"),
+                            lambda: mk.meets_notional(qn, pt, sg)),
+        ("cross-grid qty",  lambda: _fmt(_quant_floor(qs, D("0.01")), D("1")),
+                            lambda: fg.fmt_qty(fg.steps_from(sg, qn))),
+        ("est close",       lambda: dec_est_close(qs, sd, fd, 4.0, 4.0, 2.0),
+                            lambda: mk.est_close_gain_minus_fee_slip(sg.q(qn), sg.p(st), fm, 4.0, 4.0, 2.0)),
+    ]
+
+# ---------- fake transport (aster-sim ในโปรเซสเดียวกัน) ----------
+SYM = "ASTERUSDT"
+
+class FakeResponse:
+    __slots__ = ("status_code", "headers", "text")
+    def __init__(self, status, text):
+        self.status_code, self.headers, self.text = status, {}, text
+    def json(self): return json.loads(self.text)
+
+class FakeHttp:
+    """แทน mk.HTTP: คำขอเข้า Handler._route ของ aster-sim.py โดยตรง (ไม่มี socket/ตรวจลายเซ็น)
+    body ถูก encode/decode เป็น JSON เหมือนของจริง + หน่วง latency_ms ต่อคำขอ"""
+    def __init__(self, ex, cfg, latency_ms=0.0):
+        self.h = object.__new__(sim.Handler)
+        self.h.ex, self.h.cfg = ex, cfg
+        self.latency = latency_ms/1000.0
+        self.requests = 0
+
+    def request(self, base, method, url, headers=None, params=None, timeout=None, **kw):
+        u = urlsplit(url)
+        q = dict(parse_qsl(u.query))
+        q.update({k: str(v) for k, v in (params or {}).items()})
+        self.requests += 1
+        if self.latency: time.sleep(self.latency)
+        try:
+            return FakeResponse(200, json.dumps(self.h._route(method, u.path, q)))
+        except sim.ApiError as e:
+            return FakeResponse(e.status, json.dumps({"code": e.code, "msg": e.msg}))
+
+    def stats(self): return {}
+    def stats_line(self): return f"fake={self.requests}"
+    def close(self): pass
+
+def fill_resting(ex):
+    """เติมออเดอร์ที่พักอยู่ทั้งหมดที่ราคาของมัน (maker ถูกกินทันที) → รอบ macro ไม่ขึ้นกับ random walk"""
+    with ex.lock:
+        for oid, o in list(ex.orders.items()):
+            ex._fill(o, o["origQty"] - o["executedQty"], o["price"])
+            o["status"] = "FILLED"
+            del ex.orders[oid]
+
+def make_env(p):
+    """exchange จำลอง + global ของ maker ชี้ไปที่ transport ปลอม → (args, ex, sg, fg, qg)"""
+    cfg = sim.parse_args(["--symbols", SYM, "--usdt", "1000000", "--fut-usdt", "1000000"])
+    random.seed(p.seed)
+    ex = sim.Exchange(cfg)
+    args = mk.build_parser().parse_args(
+        ["--sapi", "http://sim-spot", "--fapi", "http://sim-fut", "--symbol", SYM, "--asset", SYM[:-4],
+         "--capital", "100", "--filters-cache", "", "--state-file", "",
+         "--weight-limit", "1000000000", "--order-limit", "1000000000"] + shlex.split(p.maker_args))
+    mk.configure_endpoints(args)
+    mk.configure_limits(args)
+    mk.configure_parallel(args)
+    mk.configure_batch(args)
+    mk.configure_filters(args)
+    mk.HTTP = FakeHttp(ex, cfg, p.latency_ms)
+    mk.start_order_manager(args)
+    sf, ff = mk.FILTERS.get(mk.SAPI, SYM), mk.FILTERS.get(mk.FAPI, SYM)
+    return args, ex, sf.grid, ff.grid, mk.Grid(sf.tick, min(sf.step, ff.step))
+
+# ---------- micro ----------
+def micro_cases(env):
+    args, ex, sg, fg, qg = env
+    qd, sd = D("1234.5678"), D("0.01")
+    order = {"symbol": SYM, "side": "BUY", "type": "LIMIT", "timeInForce": "GTX", "quantity": "100.05",
+             "price": "0.9995", "newClientOrderId": "am15123456789-1", "recvWindow": 20000, "timestamp": 1792199000000}
+    books = (mk.depth(mk.SAPI, SYM, args.close_depth), mk.depth(mk.FAPI, SYM, args.close_depth))
+    qty = qg.qty("100")
+    return [
+        ("_quant_floor", lambda: _quant_floor(qd, sd)),
+        ("_fmt", lambda: _fmt(qd, sd)),
+        ("sign", lambda: mk.sign(order)),
+        ("depth() 20 levels", lambda: mk.depth(mk.SAPI, SYM, 20)),
+        ("est_open_basis", lambda: mk.est_open_basis_minus_fee(100.0, 0.9995, 1.0028, 0.0, 0.0)),
+        ("est_close_gain", lambda: mk.est_close_gain_minus_fee_slip(100.0, 1.0001, 1.0031, 5.0, 5.0, 3.0)),
+        ("guards_ok_for_close", lambda: mk.guards_ok_for_close(args, qty, sg, fg, qg, books)),
+    ]
+
+def run_micro(env, n):
+    lat, mk.HTTP.latency = mk.HTTP.latency, 0.0  # depth(): วัดเวลา parse/overhead ของ _req ไม่ใช่ network
+    try:
+        return {f"micro:{name}": measure(fn, n) for name, fn in micro_cases(env)}
+    finally:
+        mk.HTTP.latency = lat
+
+# ---------- macro ----------
+def cycle(env):
+    """เปิดคู่ (วาง maker → ถูกเติม → attach เห็นคู่พร้อม) แล้วปิด → (ns ขาเปิด, ns ขาปิด)"""
+    args, ex, sg, fg, qg = env
+    t0 = time.perf_counter_ns()
+    mk.attach_or_open_pair(args, sg, fg, qg)
+    fill_resting(ex)
+    qty = mk.attach_or_open_pair(args, sg, fg, qg)[0]
+    t1 = time.perf_counter_ns()
+    if qty <= 0: raise RuntimeError("pair not ready after fill")
+    if not mk.close_pair_maker_first(args, qty, sg, fg, qg): raise RuntimeError("close failed")
+    fill_resting(ex)
+    t2 = time.perf_counter_ns()
+    ex.step()  # ขยับราคาให้รอบถัดไป (นอกเวลาที่จับ)
+    return t1 - t0, t2 - t1
+
+def run_macro(env, cycles, alloc_cycles=3):
+    cycle(env)  # warm-up: filters/ORDERS sync
+    opens, closes, full = [], [], []
+    req0 = mk.HTTP.requests
+    t = time.perf_counter()
+    for _ in range(cycles):
+        a, b = cycle(env)
+        opens.append(a); closes.append(b); full.append(a + b)
+    total = time.perf_counter() - t
+    reqs = (mk.HTTP.requests - req0)/cycles
+    peaks = []
+    for _ in range(alloc_cycles):
+        tracemalloc.start()
+        try:
+            cur, _ = tracemalloc.get_traced_memory()
+            cycle(env)
+            peaks.append(tracemalloc.get_traced_memory()[1] - cur)
+        finally:
+            tracemalloc.stop()
+    alloc = sorted(peaks)[len(peaks)//2]
+    out = {"macro:cycle": summarize(full, total, cycles, alloc),
+           "macro:open": summarize(opens, sum(opens)/1e9, cycles, None),
+           "macro:close": summarize(closes, sum(closes)/1e9, cycles, None)}
+    out["macro:cycle"]["requests"] = reqs
+    return out
+
+# ---------- baseline ----------
+def compare(results, base, tol):
+    """→ {name: [เหตุผลที่ถือว่าแย่ลง]} เทียบกับ baseline (p50/throughput/หน่วยความจำ)"""
+    flags = {}
+    for name, r in results.items():
+        b = base.get(name)
+        if not b: continue
+        why = []
+        if r["p50_ns"] > b["p50_ns"]*(1 + tol): why.append(f"p50 +{(r['p50_ns']/b['p50_ns'] - 1)*100:.0f}%")
+        if r["ops_s"] < b["ops_s"]*(1 - tol): why.append(f"ops/s -{(1 - r['ops_s']/b['ops_s'])*100:.0f}%")
+        if r["alloc_b"] is not None and b.get("alloc_b") is not None and r["alloc_b"] > b["alloc_b"]*(1 + tol) + 64:
+            why.append(f"alloc {b['alloc_b']}→{r['alloc_b']}B")
+        if why: flags[name] = why
+    return flags
+
+def report(results, base, flags):
+    print(f"{'benchmark':<28} {'ops/s':>10} {'p50':>9} {'p99':>9} {'alloc':>9} {'vs base':>8}")
+    for name, r in results.items():
+        b = base.get(name)
+        delta = f"{(r['p50_ns']/b['p50_ns'] - 1)*100:+.0f}%" if b else ""
+        alloc = f"{r['alloc_b']}B" if r["alloc_b"] is not None else "-"
+        extra = f" ({r['requests']:.0f} req/cycle)" if "requests" in r else ""
+        mark = "  REGRESSION: " + ", ".join(flags[name]) if name in flags else ""
+        print(f"{name:<28} {r['ops_s']:>10.0f} {_t(r['p50_ns']):>9} {_t(r['p99_ns']):>9} {alloc:>9} {delta:>8}{extra}{mark}")
+
+# ---------- CLI ----------
+def run_grid(p):
+    bad = verify(p.verify, p.seed)
+    print(f"bit-exact: {p.verify - len(bad)}/{p.verify} ok")
+    for b in bad[:10]: print("  MISMATCH", b)
+    if bad: sys.exit(1)
+
+    print(f"{'case':<20} {'decimal':>10} {'grid':>10} {'speedup':>8}")
+    for name, dec_fn, grid_fn in cases():
+        a, b = bench(dec_fn, p.n), bench(grid_fn, p.n)
+        print(f"{name:<20} {a:>8.0f}ns {b:>8.0f}ns {a/b:>7.1f}x")
+
+def main():
+    ap = argparse.ArgumentParser(description="AsterDex Maker v15 benchmark suite")
+    ap.add_argument("--suite", default="grid,micro,macro", help="grid/micro/macro คั่นด้วย ,")
+    ap.add_argument("--n", type=int, default=100000, help="จำนวนรอบต่อเคส (grid/micro)")
+    ap.add_argument("--verify", type=int, default=20000, help="จำนวนค่าสุ่มที่ตรวจ bit-exact")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--cycles", type=int, default=50, help="จำนวนรอบเปิด+ปิดของ macro")
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="หน่วงต่อคำขอของ transport ปลอม (macro)")
+    ap.add_argument("--maker-args", default="", help='flag เพิ่มให้ maker (ใช้รูป =) เช่น --maker-args="--parallel --close-model flat"')
+    ap.add_argument("--save", default="", help="เขียนผล micro/macro เป็น baseline JSON")
+    ap.add_argument("--baseline", default="", help="เทียบกับ baseline JSON แล้วติดธง regression")
+    ap.add_argument("--tolerance", type=float, default=0.15, help="สัดส่วนที่ยอมให้แย่ลงก่อนนับเป็น regression")
+    p = ap.parse_args()
+    suites = {x.strip() for x in p.suite.split(",") if x.strip()}
+    unknown = suites - {"grid", "micro", "macro"}
+    if unknown: raise SystemExit(f"ไม่รู้จัก suite: {','.join(sorted(unknown))}")
+
+    if "grid" in suites: run_grid(p)
+    results = {}
+    if suites & {"micro", "macro"}:
+        env = make_env(p)
+        if "micro" in suites: results.update(run_micro(env, p.n))
+        if "macro" in suites: results.update(run_macro(env, p.cycles))
+    if not results: return
+
+    base = {}
+    if p.baseline:
+        with open(p.baseline) as fh: base = json.load(fh).get("results", {})
+    flags = compare(results, base, p.tolerance)
+    print()
+    report(results, base, flags)
+    if p.save:
+        meta = {"ts": time.time(), "python": platform.python_version(), "machine": platform.machine(),
+                "latency_ms": p.latency_ms, "maker_args": p.maker_args, "n": p.n, "cycles": p.cycles}
+        with open(p.save + ".tmp", "w") as fh: json.dump({"meta": meta, "results": results}, fh, indent=1, sort_keys=True)
+        os.replace(p.save + ".tmp", p.save)
+        print(f"baseline → {p.save}")
+    if flags:
+        print(f"{len(flags)} regression(s) เทียบกับ {p.baseline} (tolerance {p.tolerance:.0%})")
+        sys.exit(2)
+
+if __name__=="__main__":
+    main()
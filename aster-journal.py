@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+aster-journal.py  (journal reader)
+- อ่าน journal จาก `aster-maker15.py --journal DIR` (รวมไฟล์ .jsonl.gz ที่หมุนแล้ว)
+- กรองตาม kind / symbol / ช่วงเวลา แล้วพิมพ์เป็น JSONL (ส่งต่อให้ jq ได้) หรือสรุปผลต่อคู่ (--summary)
+
+ตัวอย่าง:
+python3 aster-journal.py journal --kind close --symbol ASTERUSDT
+python3 aster-journal.py journal --summary --since 2026-10-01
+"""
+
+import os, sys, json, argparse, importlib.util, datetime as dt
+
+def _load_maker():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "aster-maker15.py")
+    spec = importlib.util.spec_from_file_location("aster_maker15", path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+mk = _load_maker()
+
+def _when(s):
+    """epoch วินาที หรือวันที่/เวลา ISO (UTC) → epoch"""
+    if not s: return None
+    try: return float(s)
+    except ValueError: pass
+    t = dt.datetime.fromisoformat(s)
+    if t.tzinfo is None: t = t.replace(tzinfo=dt.timezone.utc)
+    return t.timestamp()
+
+def summarize(rows):
+    """ต่อ symbol: จำนวนรอบที่ปิดได้/ไม่ได้, net ประมาณ vs กำไรจริงจาก fill (record "trip"), เวลาถือเฉลี่ย, ออเดอร์/fill/error"""
+    out = {}
+    for r in rows:
+        sym = r.get("symbol") or r.get("params", {}).get("symbol") or "?"
+        a = out.setdefault(sym, {"trips": 0, "failed": 0, "est": 0.0, "realized": 0.0, "held": 0.0,
+                                 "orders": 0, "rejected": 0, "fills": 0, "errors": 0})
+        k = r.get("kind")
+        if k == "close":
+            if r.get("ok"):
+                a["trips"] += 1
+                a["est"] += r.get("est", 0.0)
+                a["held"] += r.get("held_sec", 0.0)
+            else:
+                a["failed"] += 1
+        elif k == "trip":
+            if r.get("realized") is not None: a["realized"] += r["realized"]
+        elif k == "order":
+            a["orders"] += 1
+            if r.get("error"): a["rejected"] += 1
+        elif k == "fill": a["fills"] += 1
+        elif k == "error": a["errors"] += 1
+    return out
+
+def main():
+    ap = argparse.ArgumentParser(description="AsterDex Maker v15 journal reader")
+    ap.add_argument("path", help="โฟลเดอร์ --journal หรือไฟล์ journal-*.jsonl[.gz]")
+    ap.add_argument("--kind", action="append", default=[],
+                    help="decision/ready/order/fill/cancel/close/trip/hedge/error (ระบุซ้ำได้)")
+    ap.add_argument("--symbol", default="")
+    ap.add_argument("--since", default="", help="epoch หรือ ISO เช่น 2026-10-01T00:00")
+    ap.add_argument("--until", default="")
+    ap.add_argument("--summary", action="store_true", help="สรุปต่อคู่แทนการพิมพ์ทุก record")
+    p = ap.parse_args()
+
+    rows = mk.read_journal(p.path, p.kind or None, p.symbol.upper() or None, _when(p.since), _when(p.until))
+    if not p.summary:
+        try:
+            for r in rows: sys.stdout.write(json.dumps(r, ensure_ascii=False) + "\n")
+        except BrokenPipeError:
+            pass
+        return
+    print(f"{'symbol':<14} {'trips':>5} {'fail':>4} {'est':>10} {'realized':>10} {'hold':>7} {'orders':>6} {'rej':>4} {'fills':>5} {'err':>4}")
+    for sym, a in sorted(summarize(rows).items()):
+        hold = a["held"]/a["trips"] if a["trips"] else 0.0
+        print(f"{sym:<14} {a['trips']:>5} {a['failed']:>4} {a['est']:>10.4f} {a['realized']:>10.4f} {hold:>6.0f}s "
+              f"{a['orders']:>6} {a['rejected']:>4} {a['fills']:>5} {a['errors']:>4}")
+
+if __name__=="__main__":
+    main()
@@ -5,25 +5,46 @@ aster-maker15.py  (Clean & Full)
 - เปิดคู่แบบ Maker: BUY Spot + SELL Futures (short) ด้วย GTX (ไม่กินคิว)
 - แนบโพสิชันที่มี (attach-existing): เติม/ตัดให้เข้าเป้าทุน (target qty) พร้อมกันสองฝั่ง
 - วัด 'กำไรสุทธิหลังปิด' = open_basis - open_fee + close_gain - close_fee - slippage
+  (ค่าเริ่มต้น --close-model depth = VWAP กินเด็ปธ์จริงทั้งสองขา + หา qty ใหญ่สุดที่ยังถึงเป้า;
+   --close-model flat = last/mark + slippage คงที่ ตรงกับ aster-replay/sweep)
 - ถึงเป้า → ปิดคู่ (maker-first, มี IOC/MARKET fallback) แล้วเปิดใหม่อัตโนมัติ (ถ้า --always-reopen)
 - บังคับกริดทุกคำสั่ง (qty ตาม LOT_SIZE.step, price ตาม tick) เพื่อกัน "-1111 Precision"
 - ตรวจ notional ขั้นต่ำ 5 USDT ทั้ง Spot/Futures ก่อนยิง
 - ป้องกันปิดในตลาดบาง (สเปรด/เด็ปธ์) + ยืนยันกำไรต่อเนื่อง (confirm-hits)
-- มี retry/backoff/cooldown + reset state อัตโนมัติเมื่อ error
+- มี retry/backoff/cooldown; error → state ถูกตรวจกับ qty จริงรอบถัดไป (ไม่ทิ้ง open_basis/t0 ถ้าคู่ยังเท่าเดิม)
+- checkpoint (--state-file ไฟล์ละโปรเซส): state คู่ + margin + ออเดอร์ค้าง เขียนแบบ atomic → รีสตาร์ทแล้วทำงานต่อหลัง reconcile
+- ติดตามออเดอร์ตาม clientOrderId: ไม่วาง maker ซ้ำ, ราคาเปลี่ยน → cancel แล้ววางใหม่, นับจำนวนที่ค้างเข้า sizing
+- --journal DIR: บันทึก decision/order/fill/close เป็น JSONL ผ่านคิว (หมุนไฟล์ + gzip), อ่านด้วย read_journal()/aster-journal.py
+- --metrics-port/--metrics-json: latency ต่อ endpoint, เวลารอบ, tick-to-order, skew ขา, net ประมาณ vs จริง
+- --batch-orders: ออเดอร์ Futures ของคู่ที่รันรอบพร้อมกัน (--pairs) ถูกรวมเป็น batchOrders (≤5 ต่อครั้ง) ใช้ rate limit น้อยลง
+- โหมด portfolio (--pairs): หลายคู่ในโปรเซสเดียว แชร์ HTTP pool / account snapshot / market data + แบ่ง USDT ตามสัดส่วน
 - Log สี: ฟ้า(ข้อมูล), เขียว(ซื้อ/กำไร), แดง(ขาย/ขาดทุน/ข้อผิดพลาด), ส้ม(เตือน)
 
 ENV ที่ต้องมี: ASTERDEX_API_KEY, ASTERDEX_API_SECRET
 """
 
-import os, time, hmac, hashlib, argparse, logging, requests, math, datetime as dt
+import os, sys, time, hmac, hashlib, argparse, logging, requests, math, threading, json, heapq, random, struct, bisect, gzip, glob, queue, shutil, signal, datetime as dt
 from decimal import Decimal, ROUND_DOWN, getcontext
 from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor, Future
+from collections import namedtuple, deque
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import websocket  # websocket-client (ใช้เมื่อเปิด --ws เท่านั้น)
+except ImportError:
+    websocket = None
 
 getcontext().prec = 28
 
 # ---------- endpoints ----------
-SAPI = "https://sapi.asterdex.com"
-FAPI = "https://fapi.asterdex.com"
+SAPI = os.environ.get("ASTERDEX_SAPI", "https://sapi.asterdex.com")
+FAPI = os.environ.get("ASTERDEX_FAPI", "https://fapi.asterdex.com")
+SPOT_WS = os.environ.get("ASTERDEX_SPOT_WS", "wss://sstream.asterdex.com")
+FUT_WS  = os.environ.get("ASTERDEX_FUT_WS",  "wss://fstream.asterdex.com")
 
 # ---------- ENV ----------
 API_KEY    = os.environ.get("ASTERDEX_API_KEY")
@@ -61,6 +82,84 @@ def _fmt(value: Decimal, step: Decimal) -> str:
     q = _quant_floor(value, step)
     return f"{q:.{d}f}"
 
+# ---------- integer grid (fixed-point hot path) ----------
+_P10 = [10**i for i in range(48)]
+
+def _dec_parts(x):
+    """เลขฐานสิบ (str/Decimal/float) → (u, k) โดย x = u/10^k พอดี ไม่ผ่าน Decimal ถ้าไม่ใช่รูป exponent"""
+    s = x if isinstance(x, str) else str(x)
+    if "e" in s or "E" in s: s = f"{Decimal(s):f}"
+    ip, _, fp = s.partition(".")
+    return int(ip + fp or "0"), len(fp)
+
+def _units(x, d, up=False):
+    """x → จำนวนเต็มหน่วย 10^-d ตัดเศษทิ้ง (up=True ปัดขึ้น) — ใช้กับค่าที่ไม่ติดลบ"""
+    u, k = _dec_parts(x)
+    if k <= d: return u*_P10[d-k]
+    q, r = divmod(u, _P10[k-d])
+    return q + 1 if up and r else q
+
+class Grid:
+    """กริดราคา/จำนวนของหนึ่ง symbol ต่อ venue: ราคาเก็บเป็นจำนวน tick, จำนวนเก็บเป็นจำนวน step (int)
+    สเกล 10^d คำนวณครั้งเดียว → ปัดลง/format/notional เป็น int ล้วน ผลตรงกับ _quant_floor/_fmt ทุกหลัก"""
+    __slots__ = ("tick","step","pd","qd","tick_u","step_u","p_scale","q_scale","mn_u","_tpu","_spu")
+
+    def __init__(self, tick, step, min_notional=0):
+        self.tick, self.step = D(tick), D(step)
+        if self.tick <= 0 or self.step <= 0:
+            raise RuntimeError(f"tick/step ต้อง > 0 (tick={tick} step={step})")
+        self.pd, self.qd = _decimals(self.tick), _decimals(self.step)
+        self.tick_u, self.step_u = _units(self.tick, self.pd), _units(self.step, self.qd)
+        self.p_scale, self.q_scale = _P10[self.pd], _P10[self.qd]
+        self.mn_u = _units(min_notional, self.pd+self.qd, up=True)  # notional ขั้นต่ำ หน่วย 10^-(pd+qd)
+        self._tpu, self._spu = self.p_scale/self.tick_u, self.q_scale/self.step_u  # tick/step ต่อ 1.0
+
+    # exact: ค่าใดก็ได้ → ปัดลงเข้ากริด (แทน _quant_floor)
+    def px(self, x): return _units(x, self.pd)//self.tick_u
+
+    def qty(self, x, up=False):
+        u = _units(x, self.qd, up)
+        return -(-u//self.step_u) if up else u//self.step_u
+
+    # fast: สตริงจาก exchange ที่อยู่บนกริดอยู่แล้ว (ราคา/จำนวนใน book, ราคาเทรด) — float→round ตรงเมื่อ < 2^52 หน่วย
+    def ticks(self, s): return round(float(s)*self._tpu)
+    def steps(self, s): return round(float(s)*self._spu)
+
+    # int → float (หาร int/int ปัดถูกต้อง = float(Decimal) ของค่าเดียวกัน) สำหรับคิด economics
+    def p(self, t): return t*self.tick_u/self.p_scale
+    def q(self, n): return n*self.step_u/self.q_scale
+
+    # int → สตริงส่งคำสั่ง (แทน _fmt)
+    def fmt_px(self, t): return self._fmtu(t*self.tick_u, self.pd)
+    def fmt_qty(self, n): return self._fmtu(n*self.step_u, self.qd)
+
+    @staticmethod
+    def _fmtu(u, d):
+        if d == 0: return str(u)
+        ip, fp = divmod(u, _P10[d])
+        return "%d.%0*d" % (ip, d, fp)
+
+    def steps_from(self, other, n, up=False):
+        """จำนวน step ของกริดอื่น → step ของกริดนี้ (ปัดลง / up=True ปัดขึ้น)"""
+        num = n*other.step_u*_P10[max(0, self.qd-other.qd)]
+        den = self.step_u*_P10[max(0, other.qd-self.qd)]
+        return -(-num//den) if up else num//den
+
+    def qty_for(self, amount, t, whole=False):
+        """floor(amount / ราคา t) เป็น step — ใช้กับทุน/เงินสด USDT; whole=True ตัดเป็นจำนวนเต็มหน่วยก่อน"""
+        if t <= 0: return 0
+        u, k = _dec_parts(amount)
+        den = _P10[k]*t*self.tick_u
+        if whole: return (u*self.p_scale//den)*self.q_scale//self.step_u
+        return u*_P10[self.pd+self.qd]//(den*self.step_u)
+
+    def value(self, n, t):
+        """n step × t tick → Decimal ตรงทุกหลัก"""
+        return Decimal(n*self.step_u*t*self.tick_u).scaleb(-(self.pd+self.qd))
+
+    def notional_ok(self, n, t):
+        return n > 0 and n*self.step_u*t*self.tick_u >= self.mn_u
+
 # ---------- time & signing ----------
 def now_ms(): return int(time.time()*1000)
 def now_utc_str(): return dt.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
@@ -71,52 +170,566 @@ def sign(q: dict) -> str:
     return f"{s}&signature={sig}"
 
 def _hdr():
-    if not API_KEY: raise RuntimeError("Missing ASTERDEX_API_KEY")
-    return {"X-MBX-APIKEY": API_KEY, "User-Agent": "AsterMaker15/1.0"}
+    """ส่ง X-MBX-APIKEY เมื่อมีคีย์เท่านั้น (market data/recorder ใช้ได้โดยไม่มีคีย์; signed เช็คใน _req)"""
+    h = {"User-Agent": "AsterMaker15/1.0"}
+    if API_KEY: h["X-MBX-APIKEY"] = API_KEY
+    return h
+
+# ---------- metrics (Prometheus text / JSON dump) ----------
+MS_BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+class Histogram:
+    __slots__ = ("counts", "sum", "n")
+    def __init__(self):
+        self.counts = [0]*(len(MS_BUCKETS)+1)
+        self.sum = 0.0
+        self.n = 0
+
+    def observe(self, v):
+        self.counts[bisect.bisect_left(MS_BUCKETS, v)] += 1
+        self.sum += v
+        self.n += 1
+
+    def quantile(self, q):
+        """ค่าประมาณจากขอบบนของ bucket (พอสำหรับดู p50/p99 ใน JSON)"""
+        if not self.n: return 0.0
+        k, acc = q*self.n, 0
+        for i, c in enumerate(self.counts):
+            acc += c
+            if acc >= k: return float(MS_BUCKETS[i]) if i < len(MS_BUCKETS) else float("inf")
+        return float("inf")
+
+class Metrics:
+    """counter/gauge/histogram แบบมี label (key = (name, ((label, value),...)))
+    call site เช็ค `METRICS is not None` ก่อนเสมอ → ปิดอยู่ = ไม่มีต้นทุนนอกจาก if เดียว"""
+    HELP = {
+        "aster_http_request_ms": "REST latency per attempt (ms)",
+        "aster_http_responses_total": "REST responses by HTTP status",
+        "aster_http_api_errors_total": "exchange error codes",
+        "aster_http_retries_total": "REST retries",
+        "aster_http_weight_total": "request weight spent",
+        "aster_loop_ms": "decision loop iteration (ms)",
+        "aster_loop_errors_total": "decision loop errors",
+        "aster_tick_to_order_ms": "price change → first order leg sent (ms)",
+        "aster_leg_skew_ms": "spot/futures leg skew (ms)",
+        "aster_net_estimate": "current estimated net_total",
+        "aster_trip_profit_total": "sum of positive net per closed trip (kind=estimated at close | realized from fills)",
+        "aster_trip_loss_total": "sum of |negative net| per closed trip (kind=estimated|realized)",
+        "aster_trips_total": "closed trips",
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hist, self.ctr, self.gauge = {}, {}, {}
+        self.collectors = []  # fn() → [(name, labels dict, value)] อ่านตอน scrape (stats ที่มีอยู่แล้ว)
+        self.t0 = time.time()
+
+    @staticmethod
+    def _key(name, labels): return (name, tuple(sorted(labels.items())))
+
+    def observe(self, name, v, **labels):
+        k = self._key(name, labels)
+        with self.lock:
+            h = self.hist.get(k)
+            if h is None: h = self.hist[k] = Histogram()
+            h.observe(v)
+
+    def inc(self, name, v=1, **labels):
+        k = self._key(name, labels)
+        with self.lock: self.ctr[k] = self.ctr.get(k, 0) + v
+
+    def set(self, name, v, **labels):
+        with self.lock: self.gauge[self._key(name, labels)] = v
+
+    def http(self, venue, path, method, t0, status, code=None):
+        ms = (time.perf_counter() - t0)*1000
+        self.observe("aster_http_request_ms", ms, venue=venue, path=path, method=method)
+        self.inc("aster_http_responses_total", venue=venue, path=path, status=str(status))
+        if code is not None: self.inc("aster_http_api_errors_total", venue=venue, path=path, code=code)
+
+    def trip(self, symbol, kind, net):
+        """counter ห้ามลด → แยกกำไร/ขาดทุนเป็นคนละตัว (net = profit - loss)"""
+        name = "aster_trip_profit_total" if net >= 0 else "aster_trip_loss_total"
+        self.inc(name, round(abs(net), 6), symbol=symbol, kind=kind)
+
+    def _collected(self):
+        out = []
+        for fn in self.collectors:
+            try: out.extend(fn())
+            except Exception as e: logging.debug(f"metrics collector fail: {e}")
+        return out
+
+    def prometheus(self):
+        def lbl(labels, extra=()):
+            items = list(labels) + list(extra)
+            return "{" + ",".join(f'{k}="{str(v).replace(chr(34), chr(39))}"' for k,v in items) + "}" if items else ""
+        lines, typed = [], set()
+        def head(name, kind):
+            if name in typed: return
+            typed.add(name)
+            if name in self.HELP: lines.append(f"# HELP {name} {self.HELP[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+        with self.lock:
+            hist = {k: (list(h.counts), h.sum, h.n) for k,h in self.hist.items()}
+            ctr, gauge = dict(self.ctr), dict(self.gauge)
+        for (name, labels), (counts, total, n) in sorted(hist.items()):
+            head(name, "histogram")
+            acc = 0
+            for b, c in zip(MS_BUCKETS + ("+Inf",), counts):
+                acc += c
+                lines.append(f"{name}_bucket{lbl(labels, [('le', b)])} {acc}")
+            lines.append(f"{name}_sum{lbl(labels)} {total:.3f}")
+            lines.append(f"{name}_count{lbl(labels)} {n}")
+        for (name, labels), v in sorted(ctr.items()):
+            head(name, "counter")
+            lines.append(f"{name}{lbl(labels)} {v}")
+        for (name, labels), v in sorted(gauge.items()):
+            head(name, "gauge")
+            lines.append(f"{name}{lbl(labels)} {v}")
+        for name, labels, v in self._collected():
+            head(name, "gauge")
+            lines.append(f"{name}{lbl(sorted(labels.items()))} {v}")
+        lines.append(f"aster_uptime_seconds {time.time() - self.t0:.0f}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """dict สำหรับ JSON dump (histogram สรุปเป็น count/avg/p50/p99)"""
+        def name_of(name, labels): return name + "".join(f"|{k}={v}" for k,v in labels)
+        with self.lock:
+            hist = {name_of(*k): {"count": h.n, "avg": h.sum/h.n if h.n else 0.0,
+                                  "p50": h.quantile(0.5), "p99": h.quantile(0.99)} for k,h in self.hist.items()}
+            ctr = {name_of(*k): v for k,v in self.ctr.items()}
+            gauge = {name_of(*k): v for k,v in self.gauge.items()}
+        for name, labels, v in self._collected(): gauge[name_of(name, sorted(labels.items()))] = v
+        return {"ts": time.time(), "uptime": time.time() - self.t0, "histograms": hist, "counters": ctr, "gauges": gauge}
+
+    def dump(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f: json.dump(self.snapshot(), f, indent=1, sort_keys=True)
+        os.replace(tmp, path)
+
+METRICS = None  # Metrics เมื่อเปิด --metrics-port / --metrics-json
+_DECISION = threading.local()  # เวลาเริ่มรอบตัดสินใจ (ต่อ thread) สำหรับ tick-to-order
+TICK_AT = {}  # symbol -> perf_counter ของการเปลี่ยนราคาครั้งแรกที่ยังไม่ถูกประเมิน (--ws เท่านั้น)
+
+def _venue(base): return "spot" if base==SAPI else "fut"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] in ("/", "/metrics"):
+            body, ctype = METRICS.prometheus().encode(), "text/plain; version=0.0.4"
+        elif self.path.startswith("/metrics.json"):
+            body, ctype = json.dumps(METRICS.snapshot(), sort_keys=True).encode(), "application/json"
+        else:
+            self.send_error(404); return
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *a): pass
+
+def _metrics_dumper(path, interval):
+    while True:
+        time.sleep(interval)
+        try: METRICS.dump(path)
+        except Exception as e: logging.warning(cwarn(f"metrics dump fail: {e}"))
+
+def _std_collectors():
+    out = [("aster_http_reused", {"host": b.split("//")[-1]}, v["reused"]) for b,v in HTTP.stats().items()]
+    if ORDERS is not None: out += [("aster_orders", {"kind": k}, v) for k,v in ORDERS.stats.items()]
+    if BATCHER is not None: out += [("aster_batch", {"kind": k}, v) for k,v in BATCHER.stats.items()]
+    if MD is not None: out.append(("aster_book_resyncs", {}, MD.resyncs))
+    if TICKERS is not None:
+        out.append(("aster_ticker_fetches", {}, TICKERS.fetches))
+        out += [("aster_ticker_age_seconds", {"venue": _venue(b)}, round(TICKERS.age(b), 3)) for b in (SAPI, FAPI) if TICKERS.ts[b]]
+    return out
+
+def configure_metrics(args):
+    """--metrics-port: Prometheus text ที่ 127.0.0.1:PORT/metrics (+ /metrics.json); --metrics-json: dump เป็นระยะ"""
+    global METRICS
+    if not (args.metrics_port or args.metrics_json) or METRICS is not None: return METRICS
+    METRICS = Metrics()
+    METRICS.collectors.append(_std_collectors)
+    if args.metrics_port:
+        srv = ThreadingHTTPServer((args.metrics_host, args.metrics_port), _MetricsHandler)
+        srv.daemon_threads = True
+        threading.Thread(target=srv.serve_forever, name="metrics", daemon=True).start()
+        logging.info(cinfo(f"metrics: http://{args.metrics_host}:{args.metrics_port}/metrics"))
+    if args.metrics_json:
+        threading.Thread(target=_metrics_dumper, args=(args.metrics_json, max(args.metrics_interval, 1.0)),
+                         name="metrics-dump", daemon=True).start()
+    return METRICS
+
+# ---------- trade journal (JSONL) ----------
+class Journal:
+    """บันทึก decision/order/fill/close เป็น JSONL: thread เทรดแค่ put ลงคิว (ไม่มี I/O)
+    thread เขียนดึงเป็นชุด → เขียน/flush, หมุนไฟล์ตามขนาด/เวลา แล้ว gzip ไฟล์เก่า; คิวเต็ม = ทิ้ง record (นับ dropped)"""
+    def __init__(self, path, max_bytes=64<<20, max_sec=86400, compress=True, queue_max=100000):
+        self.dir = path
+        self.max_bytes, self.max_sec, self.compress = max_bytes, max_sec, compress
+        self.q = queue.Queue(queue_max)
+        self.written = self.dropped = 0
+        self.fh = None
+        self.fname = None
+        self.opened = 0.0
+        os.makedirs(path, exist_ok=True)
+        self.thread = threading.Thread(target=self._run, name="journal", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def write(self, kind, **fields):
+        fields["ts"] = time.time()
+        fields["kind"] = kind
+        try: self.q.put_nowait(fields)
+        except queue.Full: self.dropped += 1
+
+    def close(self, timeout=5.0):
+        try: self.q.put(None, timeout=timeout)
+        except queue.Full: pass
+        self.thread.join(timeout)
+
+    def _open(self):
+        stamp = dt.datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+        n = 0
+        while True:
+            name = os.path.join(self.dir, f"journal-{stamp}-{n:03d}.jsonl")
+            if not (os.path.exists(name) or os.path.exists(name + ".gz")): break
+            n += 1
+        self.fname, self.fh, self.opened = name, open(name, "a", encoding="utf-8"), time.time()
+
+    def _rotate(self):
+        self.fh.close()
+        old, self.fh = self.fname, None
+        if self.compress:
+            try:
+                with open(old, "rb") as src, gzip.open(old + ".gz", "wb") as dst: shutil.copyfileobj(src, dst)
+                os.remove(old)
+            except OSError as e:
+                logging.warning(cwarn(f"journal gzip fail {old}: {e}"))
+
+    def _run(self):
+        while True:
+            try: rec = self.q.get(timeout=1.0)
+            except queue.Empty: rec = ()
+            batch = [rec] if rec else []
+            while len(batch) < 1000:
+                try: batch.append(self.q.get_nowait())
+                except queue.Empty: break
+            stop = None in batch or rec is None
+            try:
+                if self.fh is not None and (self.fh.tell() >= self.max_bytes or
+                                            (self.max_sec > 0 and time.time() - self.opened >= self.max_sec)):
+                    self._rotate()
+                recs = [r for r in batch if r]
+                if recs:
+                    if self.fh is None: self._open()
+                    self.fh.write("".join(json.dumps(r, separators=(",",":"), default=str) + "\n" for r in recs))
+                    self.fh.flush()
+                    self.written += len(recs)
+            except Exception as e:
+                logging.warning(cwarn(f"journal write fail: {e}"))
+            if stop:
+                if self.fh is not None: self.fh.close()
+                return
+
+JOURNAL = None  # Journal เมื่อเปิด --journal DIR
+
+def jot(kind, **fields):
+    if JOURNAL is not None: JOURNAL.write(kind, **fields)
+
+def configure_journal(args):
+    global JOURNAL
+    if not args.journal or JOURNAL is not None: return JOURNAL
+    JOURNAL = Journal(args.journal, int(args.journal_max_mb*(1<<20)), args.journal_rotate_sec,
+                      not args.journal_no_gzip).start()
+    logging.info(cinfo(f"journal: {args.journal}"))
+    return JOURNAL
+
+def read_journal(path, kinds=None, symbol=None, since=None, until=None):
+    """อ่าน journal (ไฟล์เดียวหรือทั้งโฟลเดอร์ รวม .gz) เรียงตามไฟล์ → generator ของ dict
+    kinds = ชุดของ kind ที่ต้องการ; since/until = epoch วินาที"""
+    files = sorted(glob.glob(os.path.join(path, "journal-*.jsonl*"))) if os.path.isdir(path) else [path]
+    kinds = set(kinds) if kinds else None
+    for fn in files:
+        opener = gzip.open if fn.endswith(".gz") else open
+        with opener(fn, "rt", encoding="utf-8") as fh:
+            for line in fh:
+                try: r = json.loads(line)
+                except ValueError: continue  # บรรทัดสุดท้ายที่เขียนไม่จบ
+                if kinds and r.get("kind") not in kinds: continue
+                if symbol and r.get("symbol") != symbol: continue
+                if since is not None and r.get("ts", 0) < since: continue
+                if until is not None and r.get("ts", 0) > until: continue
+                yield r
+
+# ---------- http client (pooled keep-alive) ----------
+class HttpClient:
+    """Session ถาวรหนึ่งตัวต่อ base URL (keep-alive + connection pool) แทนการเปิด TCP/TLS ใหม่ทุกคำขอ"""
+    def __init__(self, pool_size=4, retries=2, keepalive=True, backoff=0.1):
+        self.pool_size = max(1, int(pool_size))
+        self.retries = max(0, int(retries))
+        self.keepalive = keepalive
+        self.backoff = backoff
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _new_session(self):
+        s = requests.Session()
+        # retry เฉพาะตอน connect ไม่ติด (คำขอยังไม่ถูกส่ง) → ไม่มีทางยิงออเดอร์ซ้ำ
+        retry = Retry(total=self.retries, connect=self.retries, read=0, status=0, other=0,
+                      backoff_factor=self.backoff, allowed_methods=None, raise_on_status=False)
+        ad = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+        s.mount("https://", ad)
+        s.mount("http://", ad)
+        if not self.keepalive:
+            s.headers["Connection"] = "close"
+        return s
+
+    def session(self, base):
+        s = self._sessions.get(base)
+        if s is None:
+            with self._lock:
+                s = self._sessions.get(base)
+                if s is None:
+                    s = self._sessions[base] = self._new_session()
+        return s
+
+    def request(self, base, method, url, **kw):
+        return self.session(base).request(method, url, **kw)
+
+    def stats(self):
+        """{base: {requests, connections, reused}} นับจาก urllib3 pool ของแต่ละ host"""
+        out = {}
+        for base, s in list(self._sessions.items()):
+            pm = s.get_adapter(base).poolmanager
+            pools = [pm.pools[k] for k in pm.pools.keys()]
+            n = sum(p.num_requests for p in pools)
+            c = sum(p.num_connections for p in pools)
+            out[base] = {"requests": n, "connections": c, "reused": max(0, n - c)}
+        return out
+
+    def stats_line(self):
+        return " ".join(f"{b.split('//')[-1]}={v['reused']}/{v['requests']}" for b,v in self.stats().items())
+
+    def close(self):
+        with self._lock:
+            for s in self._sessions.values(): s.close()
+            self._sessions.clear()
+
+HTTP = HttpClient()
+
+def configure_endpoints(args):
+    """--sapi/--fapi/--spot-ws/--fut-ws (เช่น ชี้ไป aster-sim.py)"""
+    global SAPI, FAPI, SPOT_WS, FUT_WS
+    SAPI, FAPI = args.sapi.rstrip("/"), args.fapi.rstrip("/")
+    if SAPI == FAPI: raise RuntimeError("--sapi กับ --fapi ต้องต่างกัน (ใช้ base URL แยก venue)")
+    SPOT_WS, FUT_WS = args.spot_ws.rstrip("/"), args.fut_ws.rstrip("/")
+
+def configure_http(args):
+    global HTTP
+    HTTP.close()
+    HTTP = HttpClient(args.http_pool, args.http_retries, not args.no_keepalive)
+
+# ---------- rate limit / backoff scheduler ----------
+ORDER_PATHS = {"/api/v1/order", "/fapi/v1/order", "/fapi/v1/batchOrders"}
+WEIGHTS = {
+    "/api/v1/account": 5, "/fapi/v2/positionRisk": 5, "/fapi/v2/account": 5,
+    "/api/v1/exchangeInfo": 1, "/fapi/v1/exchangeInfo": 1,
+    "/fapi/v1/batchOrders": 5,
+}
+ALL_SYMBOL_WEIGHTS = {"/api/v1/ticker/price": 2, "/fapi/v1/ticker/price": 2, "/fapi/v1/premiumIndex": 1}  # ไม่ระบุ symbol
+RETRY_CODES = {"-1000", "-1001", "-1007"}  # สถานะไม่แน่นอน → retry เฉพาะคำขอ idempotent
+
+def req_weight(path, params):
+    """น้ำหนักต่อคำขอ (ตามตาราง Binance-compatible; depth ขึ้นกับ limit)"""
+    if path.endswith("/depth"):
+        lim = int((params or {}).get("limit", 100))
+        return 2 if lim<=50 else 5 if lim<=100 else 10 if lim<=500 else 20
+    if path in ALL_SYMBOL_WEIGHTS and not (params or {}).get("symbol"): return ALL_SYMBOL_WEIGHTS[path]
+    return WEIGHTS.get(path, 1)
+
+def req_orders(path, params):
+    """จำนวนออเดอร์ที่คำขอนี้กินจาก limit ออเดอร์/10s (batch = จำนวนในชุด)"""
+    if path not in ORDER_PATHS: return 0
+    if path.endswith("/batchOrders"): return len(json.loads(params.get("batchOrders", "[]")))
+    return 1
+
+class TokenBucket:
+    def __init__(self, capacity, per_sec):
+        self.capacity = float(capacity)
+        self.rate = float(per_sec)
+        self.tokens = float(capacity)
+        self.t = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.t)*self.rate)
+        self.t = now
+
+    def wait_for(self, n, floor, now):
+        """วินาทีที่ต้องรอจนมี token ≥ n โดยยังเหลือ ≥ floor (0 = พร้อม)"""
+        self._refill(now)
+        lack = n + floor - self.tokens
+        return 0.0 if lack <= 0 else lack/self.rate
+
+    def take(self, n): self.tokens -= n
+
+    def sync_used(self, used):
+        self.tokens = min(self.tokens, self.capacity - used)
+
+class RateLimiter:
+    """token bucket ต่อ venue (น้ำหนัก/นาที + จำนวนออเดอร์/10s) พร้อมช่องทางด่วนให้คำสั่ง order/cancel
+    market-data ใช้ได้เฉพาะ token ส่วนที่เกิน reserve และต้องหลีกทางเมื่อมีคำสั่งรออยู่"""
+    def __init__(self, weight_1m=1200, orders_10s=50, reserve=0.2):
+        self.weight_1m = weight_1m
+        self.orders_10s = orders_10s
+        self.reserve = reserve
+        self.cv = threading.Condition()
+        self.buckets = {}
+        self.blocked_until = {}
+        self.hi_waiting = 0
+
+    def _bucket(self, base, kind):
+        b = self.buckets.get((base,kind))
+        if b is None:
+            b = self.buckets[(base,kind)] = (TokenBucket(self.weight_1m, self.weight_1m/60.0) if kind=="weight"
+                                             else TokenBucket(self.orders_10s, self.orders_10s/10.0))
+        return b
+
+    def acquire(self, base, weight, order=0):
+        """order = จำนวนออเดอร์ในคำขอ (0 = ไม่ใช่คำสั่งซื้อขาย)"""
+        with self.cv:
+            if order: self.hi_waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self.blocked_until.get(base, 0) - now
+                    if wait <= 0:
+                        if not order and self.hi_waiting:
+                            wait = 0.05
+                        else:
+                            wb = self._bucket(base, "weight")
+                            floor = 0.0 if order else wb.capacity*self.reserve
+                            wait = wb.wait_for(weight, floor, now)
+                            if order: wait = max(wait, self._bucket(base, "order").wait_for(order, 0.0, now))
+                            if wait <= 0:
+                                wb.take(weight)
+                                if order: self._bucket(base, "order").take(order)
+                                return
+                    self.cv.wait(min(wait, 1.0))
+            finally:
+                if order:
+                    self.hi_waiting -= 1
+                    self.cv.notify_all()
+
+    def sync(self, base, headers):
+        used = headers.get("X-MBX-USED-WEIGHT-1M")
+        cnt  = headers.get("X-MBX-ORDER-COUNT-10S")
+        with self.cv:
+            if used is not None: self._bucket(base, "weight").sync_used(float(used))
+            if cnt is not None: self._bucket(base, "order").sync_used(float(cnt))
+
+    def penalize(self, base, seconds):
+        with self.cv:
+            self.blocked_until[base] = max(self.blocked_until.get(base, 0), time.monotonic() + seconds)
+            self.cv.notify_all()
+
+LIMITER = RateLimiter()
+
+def configure_limits(args):
+    global LIMITER
+    LIMITER = RateLimiter(args.weight_limit, args.order_limit, args.md_reserve)
+
+def _backoff(i, base=0.25, cap=8.0):
+    """exponential backoff + full jitter"""
+    return random.uniform(0, min(cap, base*(2**i)))
+
+TIME_OFFSET = {}  # base -> serverTime - localTime (ms)
 
 def _server_time(base):
     path = "/api/v1/time" if base==SAPI else "/fapi/v1/time"
     try:
-        r = requests.get(base+path, headers=_hdr(), timeout=5)
+        r = HTTP.request(base, "GET", base+path, headers=_hdr(), timeout=5)
         return int(r.json().get("serverTime"))
     except Exception:
         return None
 
+def sync_time(base):
+    t0 = now_ms()
+    st = _server_time(base)
+    if st is not None:
+        TIME_OFFSET[base] = st - (t0 + now_ms())//2
+        logging.info(cwarn(f"time resync {base}: offset={TIME_OFFSET[base]}ms"))
+
+class ApiError(RuntimeError):
+    """exchange ตอบ code error ชัดเจน (คำขอถูกปฏิเสธแน่นอน) — ต่างจาก RuntimeError อื่นที่อาจไม่รู้ผล"""
+    def __init__(self, data):
+        super().__init__(f"API error: {data}")
+        self.data = data
+        self.code = str(data.get("code")) if isinstance(data, dict) else None
+
 def _req(base, path, method="GET", params=None, signed=False, timeout=10, retries=2):
     params = params or {}
+    if signed and not API_KEY: raise RuntimeError("Missing ASTERDEX_API_KEY")
+    if signed and not API_SECRET: raise RuntimeError("Missing ASTERDEX_API_SECRET")
+    weight = req_weight(path, params)
+    order = req_orders(path, params)
+    idempotent = method in ("GET", "PUT")
     last = None
+    m = METRICS
     for i in range(retries+1):
+        LIMITER.acquire(base, weight, order)
+        if m is not None:
+            if i: m.inc("aster_http_retries_total", venue=_venue(base), path=path)
+            m.inc("aster_http_weight_total", weight, venue=_venue(base), path=path)
+        t0 = time.perf_counter()
         try:
             if signed:
-                if not API_SECRET: raise RuntimeError("Missing ASTERDEX_API_SECRET")
                 p = dict(params)
                 p.setdefault("recvWindow", 20000)
-                p["timestamp"] = now_ms()
+                p["timestamp"] = now_ms() + TIME_OFFSET.get(base, 0)
                 url = f"{base}{path}?{sign(p)}"
-                r = requests.request(method, url, headers=_hdr(), timeout=timeout)
+                r = HTTP.request(base, method, url, headers=_hdr(), timeout=timeout)
             else:
                 url = f"{base}{path}"
-                r = requests.request(method, url, headers=_hdr(), params=params, timeout=timeout)
-            last = r
-            if r.status_code == 200:
-                data = r.json()
-                if isinstance(data, dict) and "code" in data and str(data.get("code")) not in ("0","200"):
-                    code = str(data.get("code"))
-                    if code in ("-1021","-1000","-429"):
-                        time.sleep(1.0 + i)
-                        _server_time(base)
-                        continue
-                    raise RuntimeError(f"API error: {data}")
-                return data
-            else:
-                if r.status_code in (400,401,418,429,500):
-                    time.sleep(1.0 + i)
-                    continue
-                raise RuntimeError(f"{method} {url} -> HTTP {r.status_code}: {r.text}")
-        except Exception as e:
+                r = HTTP.request(base, method, url, headers=_hdr(), params=params, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if m is not None: m.http(_venue(base), path, method, t0, type(e).__name__)
             last = e
-            time.sleep(1.0 + i)
+            if not idempotent: break  # ออเดอร์อาจถึงเซิร์ฟเวอร์แล้ว → ห้ามยิงซ้ำ
+            time.sleep(_backoff(i))
+            continue
+        last = r
+        LIMITER.sync(base, r.headers)
+        if order: _SNAP.clear()  # ออเดอร์เปลี่ยนยอด/โพสิชัน → snapshot ที่แชร์ไว้ใช้ไม่ได้แล้ว
+        try:
+            data = r.json()
+        except ValueError:
+            data = None
+        code = None
+        if isinstance(data, dict) and "code" in data and str(data.get("code")) not in ("0","200"):
+            code = str(data.get("code"))
+        if m is not None: m.http(_venue(base), path, method, t0, r.status_code, code)
+        if r.status_code == 200 and code is None:
+            return data
+        if r.status_code in (418, 429) or code == "-1003":
+            wait = float(r.headers.get("Retry-After") or 0) or _backoff(i, 1.0, 30.0)
+            LIMITER.penalize(base, wait)
+            logging.warning(cbad(f"rate limited {r.status_code} {path} → pause {base} {wait:.1f}s"))
+            if r.status_code == 418: break  # IP ban: ไม่ retry ในคำขอนี้
             continue
+        if code == "-1021":
+            sync_time(base)
+            continue
+        if (code in RETRY_CODES or r.status_code >= 500) and idempotent:
+            time.sleep(_backoff(i))
+            continue
+        if code is not None:
+            raise ApiError(data)
+        raise RuntimeError(f"{method} {url} -> HTTP {r.status_code}: {r.text}")
     if isinstance(last, requests.Response):
         raise RuntimeError(f"{method} {base}{path} -> HTTP {last.status_code}: {last.text}")
     raise RuntimeError(f"request failed: {last}")
@@ -126,68 +739,478 @@ def _exinfo(base):
     path = "/api/v1/exchangeInfo" if base==SAPI else "/fapi/v1/exchangeInfo"
     return _req(base, path)
 
-def exinfo_spot(symbol):
-    d = _exinfo(SAPI)
-    for s in d.get("symbols", []):
-        if s.get("symbol")==symbol: return s
-    raise RuntimeError(f"Spot symbol not found: {symbol}")
-
-def exinfo_fut(symbol):
-    d = _exinfo(FAPI)
-    for s in d.get("symbols", []):
-        if s.get("symbol")==symbol: return s
-    raise RuntimeError(f"Futures symbol not found: {symbol}")
-
-def _flt(info, key):
-    for f in info.get("filters", []):
-        if f.get("filterType")==key: return f
-    return {}
-
 def get_tick_lot_notional(info):
-    tick = D(_flt(info,"PRICE_FILTER").get("tickSize","0.0001"))
-    lot  = _flt(info,"LOT_SIZE")
+    fl   = {f.get("filterType"): f for f in info.get("filters", [])}
+    tick = D(fl.get("PRICE_FILTER", {}).get("tickSize","0.0001"))
+    lot  = fl.get("LOT_SIZE", {})
     step = D(lot.get("stepSize","0.01"))
     minq = D(lot.get("minQty","0.01"))
-    fmn  = _flt(info,"MIN_NOTIONAL")
+    fmn  = fl.get("MIN_NOTIONAL", {})
     min_notional = D(fmn.get("minNotional", fmn.get("notional", "5")))
     if min_notional <= 0: min_notional = D("5")
     return tick, step, minq, min_notional
 
+# ---------- filter registry (exchangeInfo cache) ----------
+SymbolFilters = namedtuple("SymbolFilters", "tick step minq min_notional grid")
+
+class FilterRegistry:
+    """exchangeInfo แบบ index ตาม symbol + TTL + ไฟล์ cache; หมดอายุแล้วยังตอบจาก cache และ refresh เบื้องหลัง"""
+    def __init__(self, path=None, ttl=3600):
+        self.path = path
+        self.ttl = ttl
+        self.tables = {}    # base URL -> {"ts": epoch, "symbols": {symbol: info}} (ไฟล์เดียวใช้ร่วมหลาย endpoint ได้ เช่น sim/จริง)
+        self.filters = {}   # (base, symbol) -> SymbolFilters
+        self.lock = threading.Lock()
+        self._refreshing = set()
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path): return
+        try:
+            with open(self.path, "r", encoding="utf-8") as fh:
+                self.tables = json.load(fh)
+            logging.info(cinfo(f"filters cache loaded: {self.path}"))
+        except Exception as e:
+            logging.warning(cwarn(f"filters cache unreadable ({e}) → refetch"))
+            self.tables = {}
+
+    def _save(self):
+        if not self.path: return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.tables, fh, separators=(",",":"))
+        os.replace(tmp, self.path)
+
+    def refresh(self, base):
+        d = _exinfo(base)
+        syms = {s["symbol"]: {"symbol": s["symbol"], "status": s.get("status"), "filters": s.get("filters", [])}
+                for s in d.get("symbols", []) if s.get("symbol")}
+        with self.lock:
+            self.tables[base] = {"ts": time.time(), "symbols": syms}
+            self.filters = {k:v for k,v in self.filters.items() if k[0]!=base}
+            try:
+                self._save()
+            except Exception as e:
+                logging.warning(cwarn(f"filters cache write fail: {e}"))
+
+    def _refresh_bg(self, base):
+        def job():
+            try:
+                self.refresh(base)
+            except Exception as e:
+                logging.warning(cwarn(f"filters refresh fail (keep cache): {e}"))
+            finally:
+                self._refreshing.discard(base)
+        if base in self._refreshing: return
+        self._refreshing.add(base)
+        threading.Thread(target=job, name="filters-refresh", daemon=True).start()
+
+    def info(self, base, symbol):
+        t = self.tables.get(base)
+        if t is None or symbol not in t["symbols"]:
+            self.refresh(base)
+            t = self.tables[base]
+        elif self.ttl > 0 and time.time() - t["ts"] > self.ttl:
+            self._refresh_bg(base)
+        info = t["symbols"].get(symbol)
+        if info is None:
+            raise RuntimeError(f"{'Spot' if base==SAPI else 'Futures'} symbol not found: {symbol}")
+        return info
+
+    def get(self, base, symbol):
+        f = self.filters.get((base,symbol))
+        if f is None:
+            tick, step, minq, mn = get_tick_lot_notional(self.info(base, symbol))
+            f = self.filters[(base,symbol)] = SymbolFilters(tick, step, minq, mn, Grid(tick, step, mn))
+        return f
+
+FILTERS = FilterRegistry()
+
+def configure_filters(args):
+    global FILTERS
+    FILTERS = FilterRegistry(args.filters_cache or None, args.filters_ttl)
+
 # ---------- market data ----------
-def depth(base, symbol, limit=5):
+# ราคา/จำนวนคืนเป็น int บน Grid ของ symbol (tick/step); mark price ไม่อยู่บนกริด tick → float
+def depth_snapshot(base, symbol, limit=5):
     path = "/api/v1/depth" if base==SAPI else "/fapi/v1/depth"
-    d = _req(base, path, params={"symbol":symbol,"limit":limit})
-    def conv(key): return [(D(px), D(q)) for px,q in d.get(key,[])]
+    return _req(base, path, params={"symbol":symbol,"limit":limit})
+
+def depth(base, symbol, limit=5):
+    if MD is not None:
+        book = MD.depth(base, symbol, limit)
+        if book is not None: return book
+    d = depth_snapshot(base, symbol, limit)
+    g = FILTERS.get(base, symbol).grid
+    def conv(key): return [(g.ticks(px), g.steps(q)) for px,q in d.get(key,[])]
     return conv("bids"), conv("asks")
 
 def spot_last(symbol):
+    if MD is not None:
+        px = MD.spot_last(symbol)
+        if px is not None: return px
+    if TICKERS is not None:
+        px = TICKERS.spot_last(symbol)
+        if px is not None: return px
     d = _req(SAPI,"/api/v1/ticker/price",params={"symbol":symbol})
-    return D(d.get("price","0"))
+    return FILTERS.get(SAPI, symbol).grid.ticks(d.get("price","0"))
 
 def mark_price(symbol):
+    if MD is not None:
+        px = MD.mark_price(symbol)
+        if px is not None: return px
+    if TICKERS is not None:
+        px = TICKERS.mark_price(symbol)
+        if px is not None: return px
     d = _req(FAPI,"/fapi/v1/premiumIndex",params={"symbol":symbol})
-    return D(d.get("markPrice","0"))
+    return float(d.get("markPrice","0"))
+
+# ---------- ticker snapshot (all symbols, one request per venue) ----------
+class TickerTable:
+    """last (Spot, tick) และ mark (Futures) ของทุกคู่ที่ดูอยู่ จากคำขอแบบไม่ระบุ symbol ครั้งเดียวต่อ venue
+    เก็บเป็น array ตาม index ของ symbol + เวลาที่ดึง (ts ต่อ venue); อายุเกิน ttl → คนแรกที่ถามดึงใหม่ คนอื่นรอผลเดียวกัน
+    weight ต่อรอบจึงคงที่ไม่ว่าจะดูกี่คู่"""
+    def __init__(self, symbols, ttl=1.0):
+        self.symbols = [s.upper() for s in symbols]
+        self.index = {s: i for i, s in enumerate(self.symbols)}
+        self.grids = [FILTERS.get(SAPI, s).grid for s in self.symbols]
+        self.last = array("q", [0])*len(self.symbols)    # tick ของ Spot (0 = ไม่มีใน response)
+        self.mark = array("d", [0.0])*len(self.symbols)  # 0.0 = ไม่มี
+        self.ttl = ttl
+        self.ts = {SAPI: 0.0, FAPI: 0.0}
+        self.locks = {SAPI: threading.Lock(), FAPI: threading.Lock()}
+        self.fetches = 0
+
+    def age(self, base):
+        return time.time() - self.ts[base]
+
+    def _load(self, base):
+        with self.locks[base]:
+            if self.age(base) < self.ttl: return  # thread อื่นเพิ่งดึงให้แล้ว
+            if base == SAPI:
+                for r in _req(SAPI, "/api/v1/ticker/price"):
+                    i = self.index.get(r.get("symbol"))
+                    if i is not None: self.last[i] = self.grids[i].ticks(r.get("price") or "0")
+            else:
+                for r in _req(FAPI, "/fapi/v1/premiumIndex"):
+                    i = self.index.get(r.get("symbol"))
+                    if i is not None: self.mark[i] = float(r.get("markPrice") or 0)
+            self.ts[base] = time.time()
+            self.fetches += 1
+
+    def _get(self, base, col, symbol):
+        i = self.index.get(symbol)
+        if i is None: return None  # ไม่ได้อยู่ในตาราง → ให้ผู้เรียกถามราย symbol
+        if self.age(base) >= self.ttl: self._load(base)
+        return col[i] or None
+
+    def spot_last(self, symbol): return self._get(SAPI, self.last, symbol)
+
+    def mark_price(self, symbol): return self._get(FAPI, self.mark, symbol)
+
+TICKERS = None
+
+def start_tickers(args, symbols):
+    """ตาราง last/mark เฉพาะเมื่อดูหลายคู่ (--pairs / recorder หลาย symbol): คู่เดียวถามราย symbol ถูกกว่า
+    (ticker แบบไม่ระบุ symbol มี weight สูงกว่าและได้ข้อมูลทุกคู่ในตลาดกลับมา)"""
+    global TICKERS
+    if args.ticker_ttl <= 0 or len(set(symbols)) < 2: return None
+    TICKERS = TickerTable(symbols, args.ticker_ttl)
+    return TICKERS
+
+# ---------- streaming market data (websocket) ----------
+class WsFeed(threading.Thread):
+    """websocket หนึ่งเส้น + reconnect อัตโนมัติ (backoff สูงสุด 30s); on_open เรียกทุกครั้งที่ต่อติดใหม่
+    url เป็น callable ได้ (เช่น user stream ที่ต้องขอ listenKey ก่อนต่อทุกครั้ง)"""
+    def __init__(self, url, on_message, on_open=None, name="ws", timeout=60):
+        super().__init__(name=name, daemon=True)
+        self.url = url
+        self.on_message = on_message
+        self.on_open = on_open
+        self.timeout = timeout
+        self.connected = False
+        self._halt = threading.Event()
+        self._ws = None
+
+    def run(self):
+        delay = 1.0
+        while not self._halt.is_set():
+            try:
+                url = self.url() if callable(self.url) else self.url
+                self._ws = websocket.create_connection(url, timeout=self.timeout)
+                self.connected = True
+                delay = 1.0
+                logging.info(cinfo(f"{self.name} connected"))
+                if self.on_open: self.on_open()
+                while not self._halt.is_set():
+                    msg = self._ws.recv()
+                    if not msg: break
+                    self.on_message(json.loads(msg))
+            except Exception as e:
+                if not self._halt.is_set():
+                    logging.warning(cwarn(f"{self.name} disconnected: {e}"))
+            finally:
+                self.connected = False
+                try:
+                    if self._ws: self._ws.close()
+                except Exception:
+                    pass
+            self._halt.wait(delay)
+            delay = min(delay*2, 30.0)
 
-# ---------- balances/positions ----------
-def spot_bal(asset):
-    d = _req(SAPI,"/api/v1/account",signed=True)
-    for b in d.get("balances", []):
-        if b.get("asset")==asset:
-            return D(b.get("free","0")) + D(b.get("locked","0"))
-    return D("0")
+    def stop(self):
+        self._halt.set()
+        self.reconnect()
 
-def usdt_free():
-    d = _req(SAPI,"/api/v1/account",signed=True)
+    def reconnect(self):
+        try:
+            if self._ws: self._ws.close()
+        except Exception:
+            pass
+
+class LocalBook:
+    """order book ในหน่วยความจำ (tick → step เป็น int): snapshot REST + diff-depth; คืน False เมื่อ sequence ขาด (ต้อง resync)"""
+    def __init__(self, futures, grid):
+        self.futures = futures
+        self.grid = grid
+        self.bids = {}
+        self.asks = {}
+        self.last_id = None
+        self.synced = False
+        self._first = True
+        self.best = (None, None)   # (best bid, best ask)
+        self.top_changed = False   # ราคาดีสุดเปลี่ยนใน apply/snapshot ล่าสุด
+        self.pending = deque(maxlen=2000)  # diff ที่มาระหว่างไม่ synced → เล่นต่อหลัง snapshot
+
+    def _set_best(self):
+        best = (max(self.bids) if self.bids else None, min(self.asks) if self.asks else None)
+        self.top_changed = best != self.best
+        self.best = best
+
+    def load_snapshot(self, snap):
+        """snapshot แล้วเล่น diff ที่ค้างใน pending ต่อ (ตัวที่เก่ากว่า snapshot ถูกข้ามใน apply) → synced"""
+        t, n = self.grid.ticks, self.grid.steps
+        self.bids = {t(p):n(q) for p,q in snap.get("bids",[]) if n(q)>0}
+        self.asks = {t(p):n(q) for p,q in snap.get("asks",[]) if n(q)>0}
+        self.last_id = int(snap["lastUpdateId"])
+        self.synced = True
+        self._first = True
+        self._set_best()
+        top = self.top_changed
+        while self.pending and self.synced:
+            self.synced = self.apply(self.pending.popleft())
+            top |= self.top_changed
+        self.pending.clear()
+        self.top_changed = top
+        return self.synced
+
+    def apply(self, ev):
+        if not self.synced: return False
+        U, u = int(ev["U"]), int(ev["u"])
+        if u <= self.last_id: return True  # เก่ากว่า snapshot
+        if self._first:
+            # event แรกหลัง snapshot ต้องคร่อม lastUpdateId
+            if U > self.last_id + (0 if self.futures else 1): return False
+            self._first = False
+        elif self.futures:
+            if int(ev.get("pu", -1)) != self.last_id: return False
+        elif U != self.last_id + 1:
+            return False
+        bb, ba = self.best
+        t, n = self.grid.ticks, self.grid.steps
+        touched = False
+        for side, key in ((self.bids,"b"), (self.asks,"a")):
+            for p,q in ev.get(key, []):
+                px, qty = t(p), n(q)
+                if qty > 0: side[px] = qty
+                else: side.pop(px, None)
+                if key=="b": touched |= bb is None or px >= bb
+                else: touched |= ba is None or px <= ba
+        self.last_id = u
+        if touched: self._set_best()
+        else: self.top_changed = False
+        return True
+
+    def top(self, n):
+        bids = heapq.nlargest(n, self.bids.items())
+        asks = heapq.nsmallest(n, self.asks.items())
+        return bids, asks
+
+class MarketData:
+    """รวม stream depth/aggTrade (Spot) และ depth/markPrice (Futures) → depth()/spot_last()/mark_price() อ่านจาก memory"""
+    def __init__(self, symbols, snapshot_limit=100):
+        if websocket is None:
+            raise RuntimeError("--ws ต้องติดตั้ง websocket-client (pip install websocket-client)")
+        self.symbols = [s.upper() for s in symbols]
+        self.snapshot_limit = snapshot_limit
+        self.books = {(b,s): LocalBook(b==FAPI, FILTERS.get(b, s).grid) for b in (SAPI,FAPI) for s in self.symbols}
+        self.last = {}
+        self.mark = {}
+        self.resyncs = 0
+        self.lock = threading.Lock()
+        self._resyncing = set()  # (base, symbol) ที่มี thread ดึง snapshot อยู่
+        self._resync_at = {}     # (base, symbol) -> monotonic ของการดึง snapshot ครั้งล่าสุด
+        sstreams = "/".join(f"{s.lower()}@depth@100ms/{s.lower()}@aggTrade" for s in self.symbols)
+        fstreams = "/".join(f"{s.lower()}@depth@100ms/{s.lower()}@markPrice@1s" for s in self.symbols)
+        self.feeds = {
+            SAPI: WsFeed(f"{SPOT_WS}/stream?streams={sstreams}",
+                         lambda m: self._on_msg(SAPI, m), lambda: self._resync_all(SAPI), "spot-md"),
+            FAPI: WsFeed(f"{FUT_WS}/stream?streams={fstreams}",
+                         lambda m: self._on_msg(FAPI, m), lambda: self._resync_all(FAPI), "fut-md"),
+        }
+
+    def start(self):
+        for f in self.feeds.values(): f.start()
+        return self
+
+    def stop(self):
+        for f in self.feeds.values(): f.stop()
+
+    RESYNC_SEC = 2.0  # ดึง snapshot ใหม่ไม่ถี่กว่านี้ต่อ book (ระหว่างรอ diff ถูกเก็บใน pending)
+
+    def _resync(self, base, symbol):
+        self._resync_at[(base,symbol)] = time.monotonic()
+        snap = depth_snapshot(base, symbol, self.snapshot_limit)
+        with self.lock:
+            book = self.books[(base,symbol)]
+            ok = book.load_snapshot(snap)
+            self.resyncs += 1
+        if ok and book.top_changed: signal_change(symbol)
+        if not ok: logging.info(cwarn(f"book {symbol} ({'FUT' if base==FAPI else 'SPOT'}) snapshot ไม่ต่อกับ diff → รอ resync รอบถัดไป"))
+
+    def _resync_bg(self, base, symbol):
+        """resync นอก thread ของ websocket (ไม่บล็อกการรับ diff) — ทีละตัวต่อ book และไม่ถี่กว่า RESYNC_SEC"""
+        key = (base, symbol)
+        with self.lock:
+            if key in self._resyncing or time.monotonic() - self._resync_at.get(key, 0.0) < self.RESYNC_SEC: return
+            self._resyncing.add(key)
+        def job():
+            try:
+                self._resync(base, symbol)
+            except Exception as e:
+                logging.warning(cwarn(f"book resync fail {symbol}: {e}"))
+            finally:
+                with self.lock: self._resyncing.discard(key)
+        threading.Thread(target=job, name="book-resync", daemon=True).start()
+
+    def _resync_all(self, base):
+        for s in self.symbols:
+            with self.lock:
+                self.books[(base,s)].synced = False
+                self.books[(base,s)].pending.clear()
+            try:
+                self._resync(base, s)
+            except Exception as e:
+                logging.warning(cwarn(f"book resync fail {s}: {e}"))
+
+    def _on_msg(self, base, msg):
+        d = msg.get("data", msg)
+        e, sym = d.get("e"), d.get("s")
+        if e == "depthUpdate":
+            book = self.books.get((base,sym))
+            if book is None: return
+            with self.lock:
+                gap = book.synced and not book.apply(d)
+                if gap: book.synced = False
+                if not book.synced: book.pending.append(d)
+                ok = book.synced
+            if ok and book.top_changed: signal_change(sym)
+            if not ok:
+                if gap: logging.info(cwarn(f"book gap {sym} ({'FUT' if base==FAPI else 'SPOT'}) → resync"))
+                self._resync_bg(base, sym)
+        elif e == "aggTrade":
+            book = self.books.get((SAPI,sym))
+            if book is None: return
+            px = book.grid.ticks(d["p"])
+            if self.last.get(sym) != px: signal_change(sym)
+            self.last[sym] = px
+        elif e == "markPriceUpdate":
+            px = float(d["p"])
+            if self.mark.get(sym) != px: signal_change(sym)
+            self.mark[sym] = px
+
+    def depth(self, base, symbol, limit):
+        book = self.books.get((base,symbol))
+        if book is None or not self.feeds[base].connected: return None
+        with self.lock:
+            if not book.synced: return None
+            return book.top(limit)
+
+    def spot_last(self, symbol):
+        return self.last.get(symbol) if self.feeds[SAPI].connected else None
+
+    def mark_price(self, symbol):
+        return self.mark.get(symbol) if self.feeds[FAPI].connected else None
+
+MD = None
+
+# ---------- change events (event-driven loop) ----------
+WAKE = threading.Condition()  # ปลุก loop เมื่อราคาดีสุด/last/mark เปลี่ยน หรือเมื่อคู่ใน portfolio ทำรอบเสร็จ
+CHANGED = set()               # symbol ที่ราคาเปลี่ยนตั้งแต่ครั้งก่อนที่ loop ดึงไป
+
+def signal_change(symbol):
+    if METRICS is not None and symbol not in TICK_AT: TICK_AT[symbol] = time.perf_counter()
+    with WAKE:
+        CHANGED.add(symbol)
+        WAKE.notify_all()
+
+def take_changes(timeout):
+    """รอ (ไม่เกิน timeout วินาที) จนมี symbol เปลี่ยน → set ของ symbol (ว่าง = หมดเวลา)"""
+    with WAKE:
+        if not CHANGED and (timeout is None or timeout > 0): WAKE.wait(timeout)
+        out = set(CHANGED)
+        CHANGED.clear()
+    return out
+
+def start_market_data(args, symbols):
+    global MD
+    if not args.ws: return None
+    MD = MarketData(symbols, args.ws_snapshot_limit).start()
+    return MD
+
+# ---------- balances/positions ----------
+SNAPSHOT_TTL = 0.0  # >0 (portfolio): แชร์ผล /account และ positionRisk ระหว่างคู่ภายในช่วงเวลานี้
+_SNAP = {}
+CASH_LOCK = threading.Lock()  # คุม CASH_HOLDS เท่านั้น (ไม่คร่อม REST/การวางออเดอร์)
+CASH_HOLDS = []  # [symbol, USDT, released_at | None]: เงินที่ BUY กำลังวางจองไว้ กันหลายคู่ใช้ USDT ก้อนเดียวกัน
+
+def cash_held(symbol, t_read):
+    """USDT ที่คู่อื่นจองไว้ซึ่งเงินสดที่อ่านตอน t_read (monotonic) อาจยังไม่หักออก — เรียกขณะถือ CASH_LOCK
+    ยังวางไม่เสร็จ = หักเสมอ; วางเสร็จแล้วแต่ยอดที่อ่านเก่ากว่านั้น (รวม snapshot ที่แชร์อายุ SNAPSHOT_TTL) = หัก"""
+    fresh = t_read - SNAPSHOT_TTL
+    CASH_HOLDS[:] = [h for h in CASH_HOLDS if h[2] is None or h[2] > fresh - 60]
+    return sum((h[1] for h in CASH_HOLDS if h[0] != symbol and (h[2] is None or h[2] > fresh)), D("0"))
+
+def _snapshot(key, fn):
+    if SNAPSHOT_TTL <= 0: return fn()
+    hit = _SNAP.get(key)
+    if hit is not None and time.time() - hit[0] < SNAPSHOT_TTL: return hit[1]
+    d = fn()
+    _SNAP[key] = (time.time(), d)
+    return d
+
+def spot_account():
+    return _snapshot("account", lambda: _req(SAPI,"/api/v1/account",signed=True))
+
+def _asset_row(d, asset):
     for b in d.get("balances", []):
-        if b.get("asset")=="USDT":
-            return D(b.get("free","0"))
-    return D("0")
+        if b.get("asset")==asset: return b
+    return {}
 
-def fut_pos(symbol):
-    d = _req(FAPI,"/fapi/v2/positionRisk",params={"symbol":symbol},signed=True)
-    rows = d if isinstance(d,list) else [d]
-    p = next((x for x in rows if x.get("symbol")==symbol), None)
-    if not p: return None
+def spot_bal(asset):
+    if ACCOUNT is not None and ACCOUNT.live(SAPI): return ACCOUNT.spot_total(asset)
+    b = _asset_row(spot_account(), asset)
+    return D(b.get("free","0")) + D(b.get("locked","0"))
+
+def spot_bal_and_cash(asset):
+    """(ยอด asset ทั้งหมด, USDT free) จาก /account ครั้งเดียว"""
+    if ACCOUNT is not None and ACCOUNT.live(SAPI):
+        return ACCOUNT.spot_total(asset), ACCOUNT.spot_free("USDT")
+    d = spot_account()
+    b = _asset_row(d, asset)
+    return D(b.get("free","0")) + D(b.get("locked","0")), D(_asset_row(d, "USDT").get("free","0"))
+
+def _pos_row(p):
     return {
         "qty": D(p.get("positionAmt","0") or "0"),
         "entry": D(p.get("entryPrice","0") or "0"),
@@ -196,47 +1219,790 @@ def fut_pos(symbol):
         "liq": D(p.get("liquidationPrice","0") or "0")
     }
 
+def fut_pos(symbol):
+    if ACCOUNT is not None and ACCOUNT.live(FAPI): return ACCOUNT.position(symbol)
+    if SNAPSHOT_TTL > 0:
+        d = _snapshot("positions", lambda: _req(FAPI,"/fapi/v2/positionRisk",signed=True))
+    else:
+        d = _req(FAPI,"/fapi/v2/positionRisk",params={"symbol":symbol},signed=True)
+    rows = d if isinstance(d,list) else [d]
+    p = next((x for x in rows if x.get("symbol")==symbol), None)
+    if not p: return None
+    return _pos_row(p)
+
+# ---------- user data stream (account cache) ----------
+class AccountState:
+    """ยอด Spot/โพสิชัน Futures/fill จาก listenKey user data stream; ต่อใหม่ทุกครั้ง → reconcile ด้วย REST"""
+    KEEPALIVE_SEC = 30*60
+
+    def __init__(self, fill_maxlen=1000):
+        self.balances = {}   # asset -> (free, locked)
+        self.positions = {}  # symbol -> dict แบบเดียวกับ fut_pos()
+        self.fills = deque(maxlen=fill_maxlen)
+        self.keys = {}
+        self.lock = threading.Lock()
+        self._synced = {SAPI: False, FAPI: False}
+        self._stop = threading.Event()
+        self.feeds = {
+            SAPI: WsFeed(lambda: self._url(SAPI), lambda m: self._on_msg(SAPI, m),
+                         lambda: self._reconcile(SAPI), "spot-user"),
+            FAPI: WsFeed(lambda: self._url(FAPI), lambda m: self._on_msg(FAPI, m),
+                         lambda: self._reconcile(FAPI), "fut-user"),
+        }
+
+    @staticmethod
+    def _key_path(base): return "/api/v1/listenKey" if base==SAPI else "/fapi/v1/listenKey"
+
+    def _url(self, base):
+        # POST คืน key เดิมถ้ายังไม่หมดอายุ → ขอใหม่ทุกครั้งที่ต่อ ปลอดภัยกว่าใช้ key ค้าง
+        self.keys[base] = _req(base, self._key_path(base), "POST")["listenKey"]
+        ws = SPOT_WS if base==SAPI else FUT_WS
+        return f"{ws}/ws/{self.keys[base]}"
+
+    def _keepalive(self):
+        while not self._stop.wait(self.KEEPALIVE_SEC):
+            for base, key in list(self.keys.items()):
+                try:
+                    _req(base, self._key_path(base), "PUT", {"listenKey": key})
+                except Exception as e:
+                    logging.warning(cwarn(f"listenKey keepalive fail → reconnect: {e}"))
+                    self.feeds[base].reconnect()
+
+    def start(self):
+        for f in self.feeds.values(): f.start()
+        threading.Thread(target=self._keepalive, name="listenkey-keepalive", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for f in self.feeds.values(): f.stop()
+
+    def live(self, base):
+        return self._synced[base] and self.feeds[base].connected
+
+    def _reconcile(self, base):
+        self._synced[base] = False
+        if ORDERS is not None: ORDERS.on_reconnect(base)  # event ระหว่างหลุดหายไป → refresh ออเดอร์จาก REST
+        if base == SAPI:
+            d = spot_account()
+            bal = {b["asset"]: (D(b.get("free","0")), D(b.get("locked","0"))) for b in d.get("balances", [])}
+            with self.lock:
+                self.balances = bal
+        else:
+            rows = _req(FAPI,"/fapi/v2/positionRisk",signed=True)
+            pos = {p["symbol"]: _pos_row(p) for p in (rows if isinstance(rows,list) else [rows])
+                   if p.get("positionSide","BOTH")=="BOTH"}
+            with self.lock:
+                self.positions = pos
+        self._synced[base] = True
+        logging.info(cinfo(f"{'spot' if base==SAPI else 'fut'} account reconciled via REST"))
+
+    def _on_msg(self, base, d):
+        e = d.get("e")
+        if e == "outboundAccountPosition":
+            with self.lock:
+                for b in d.get("B", []):
+                    self.balances[b["a"]] = (D(b["f"]), D(b["l"]))
+        elif e == "ACCOUNT_UPDATE":
+            with self.lock:
+                for p in d.get("a", {}).get("P", []):
+                    if p.get("ps","BOTH") != "BOTH": continue
+                    row = self.positions.setdefault(p["s"], _pos_row({}))
+                    row["qty"], row["entry"] = D(p["pa"]), D(p["ep"])
+        elif e in ("executionReport", "ORDER_TRADE_UPDATE"):
+            o = d["o"] if e == "ORDER_TRADE_UPDATE" else d  # Spot: "o" คือชนิดออเดอร์ ไม่ใช่ตัวออเดอร์
+            if ORDERS is not None: ORDERS.on_event(base, o)
+            if D(o.get("l","0")) > 0:
+                self.fills.append({"venue": "spot" if base==SAPI else "fut", "symbol": o["s"], "side": o["S"],
+                                   "qty": D(o["l"]), "price": D(o["L"]), "status": o.get("X"),
+                                   "client_id": o.get("c"), "order_id": o.get("i"), "ts": d.get("E")})
+        elif e == "listenKeyExpired":
+            logging.warning(cwarn(f"listenKey expired ({'spot' if base==SAPI else 'fut'}) → reconnect"))
+            self._synced[base] = False
+            self.feeds[base].reconnect()
+
+    def spot_total(self, asset):
+        f, l = self.balances.get(asset, (D("0"), D("0")))
+        return f + l
+
+    def spot_free(self, asset):
+        return self.balances.get(asset, (D("0"), D("0")))[0]
+
+    def position(self, symbol):
+        p = self.positions.get(symbol)
+        return dict(p) if p is not None else None
+
+ACCOUNT = None
+
+def start_account_stream(args):
+    global ACCOUNT
+    if not args.user_stream: return None
+    if websocket is None:
+        raise RuntimeError("--user-stream ต้องติดตั้ง websocket-client (pip install websocket-client)")
+    ACCOUNT = AccountState().start()
+    return ACCOUNT
+
+# ---------- futures batch orders ----------
+class FutBatcher:
+    """รวมออเดอร์ Futures ของรอบตัดสินใจที่กำลังรันพร้อมกัน (หลายคู่ใน --pairs) เป็น POST /fapi/v1/batchOrders ครั้งละ ≤5
+    แต่ละรอบเรียก begin()/end(); ออเดอร์ถูกเก็บไว้จนทุกรอบที่ยังรันอยู่มีออเดอร์รอ (หรือจบรอบไปแล้ว) ครบ 5 ตัว
+    หรือรอครบ wait วินาที (กันรอบที่ไม่ได้วางอะไรถ่วงนาน) แล้วคนที่พบเงื่อนไขเป็นผู้ส่ง แจกผลกลับตามลำดับ
+    รันคู่เดียว = รอบละไม่เกิน 1 ออเดอร์ Futures → ส่งทันที (ไม่มีอะไรให้รวม)
+    ทั้งชุดถูกปฏิเสธ (ApiError) → ส่งทีละออเดอร์แทน; ถูกปฏิเสธติดกันหลายครั้ง → เลิกใช้ batch"""
+    MAX = 5
+    MAX_REJECTS = 3
+
+    def __init__(self, wait=0.025):
+        self.wait = wait
+        self.cv = threading.Condition()
+        self.pending = []  # [(params, Future)] — Future ที่ถูกหยิบเข้าชุดแล้วเป็น running
+        self.active = 0    # รอบตัดสินใจที่ยังไม่จบ
+        self.enabled = True
+        self.rejects = 0
+        self.stats = {"batches": 0, "batched": 0, "single": 0, "fallback": 0}
+
+    def begin(self):
+        with self.cv: self.active += 1
+
+    def end(self):
+        with self.cv:
+            self.active -= 1
+            self.cv.notify_all()  # รอบที่จบแล้วไม่ต้องรอ → ชุดที่ค้างอาจครบเงื่อนไข
+
+    def _ready(self):
+        return len(self.pending) >= min(self.MAX, max(self.active, 1))
+
+    def submit(self, params):
+        if not self.enabled: return self._single(params)
+        fut = Future()
+        deadline = time.monotonic() + self.wait
+        with self.cv:
+            self.pending.append((params, fut))
+            self.cv.notify_all()
+        while True:
+            with self.cv:
+                while not (fut.running() or fut.done()) and not self._ready():
+                    left = deadline - time.monotonic()
+                    if left <= 0: break
+                    self.cv.wait(left)
+                if fut.running() or fut.done(): break  # ผู้ส่งคนอื่นหยิบไปแล้ว
+                chunk, self.pending = self.pending[:self.MAX], self.pending[self.MAX:]
+                for _, f in chunk: f.set_running_or_notify_cancel()
+                self.cv.notify_all()
+            self._flush(chunk)
+            if fut.done(): break
+        return fut.result()
+
+    def _single(self, params):
+        self.stats["single"] += 1
+        return _req(FAPI,"/fapi/v1/order","POST",params,True)
+
+    def _flush(self, chunk):
+        if len(chunk) == 1:
+            p, f = chunk[0]
+            try: f.set_result(self._single(p))
+            except Exception as e: f.set_exception(e)
+            return
+        try:
+            rows = _req(FAPI,"/fapi/v1/batchOrders","POST",
+                        {"batchOrders": json.dumps([p for p,_ in chunk], separators=(",",":"))},True)
+            self.rejects = 0
+        except ApiError as e:
+            # ทั้งชุดถูกปฏิเสธแน่นอน (ยังไม่มีออเดอร์ไหนเข้า) → ยิงเดี่ยวได้อย่างปลอดภัย
+            self.rejects += 1
+            if self.rejects >= self.MAX_REJECTS:
+                self.enabled = False
+                logging.warning(cwarn(f"batchOrders rejected {self.rejects}x → single orders from now on"))
+            logging.info(cwarn(f"batchOrders rejected ({e}) → {len(chunk)} single orders"))
+            self.stats["fallback"] += 1
+            for p, f in chunk:
+                try: f.set_result(self._single(p))
+                except Exception as e2: f.set_exception(e2)
+            return
+        except Exception as e:
+            for _, f in chunk: f.set_exception(e)  # ไม่รู้ว่าเข้าไปกี่ตัว → ห้ามยิงซ้ำ ให้ order manager refresh
+            return
+        self.stats["batches"] += 1
+        self.stats["batched"] += len(chunk)
+        rows = rows if isinstance(rows, list) else []
+        for i, (p, f) in enumerate(chunk):
+            row = rows[i] if i < len(rows) else None
+            if row is None: f.set_exception(RuntimeError(f"batchOrders: no result for order {i}"))
+            elif isinstance(row, dict) and "code" in row and str(row["code"]) not in ("0","200"): f.set_exception(ApiError(row))
+            else: f.set_result(row)
+
+BATCHER = None  # FutBatcher เมื่อเปิด --batch-orders
+
+def configure_batch(args):
+    global BATCHER
+    BATCHER = FutBatcher(args.batch_window_ms/1000.0) if args.batch_orders else None
+
+def _placed(venue, p, send):
+    """ยิงออเดอร์ผ่าน send() แล้วบันทึกผล (หรือ error) ลง journal"""
+    if JOURNAL is None: return send()
+    t0 = time.time()
+    try:
+        row = send()
+    except Exception as e:
+        JOURNAL.write("order", venue=venue, params=p, error=str(e), ms=round((time.time()-t0)*1000, 1))
+        raise
+    r = row if isinstance(row, dict) else {}
+    JOURNAL.write("order", venue=venue, params=p, status=r.get("status"), order_id=r.get("orderId"),
+                  executed=r.get("executedQty"), avg_price=r.get("avgPrice"), ms=round((time.time()-t0)*1000, 1))
+    return row
+
+def _spot_order(p):
+    return _placed("spot", p, lambda: _req(SAPI,"/api/v1/order","POST",p,True))
+
+def _fut_order(p):
+    return _placed("fut", p, lambda: BATCHER.submit(p) if BATCHER is not None else _req(FAPI,"/fapi/v1/order","POST",p,True))
+
 # ---------- orders (ทุกคำสั่งบังคับกริดก่อนส่ง) ----------
-def spot_limit_gtx(symbol, side, qty, px, s_step, s_tick):
+# qty = จำนวน step, px = จำนวน tick บน Grid ของ venue นั้น → format เป็นสตริงครั้งเดียว
+def spot_limit_gtx(symbol, side, qty, px, g, cid=None):
+    qs, ps = g.fmt_qty(qty), g.fmt_px(px)
     p = {"symbol":symbol,"side":side,"type":"LIMIT","timeInForce":"GTX",
-         "quantity":_fmt(qty, s_step),"price":_fmt(px, s_tick),"newOrderRespType":"RESULT"}
-    logging.info(cgood(f"SPOT {side} {_fmt(qty,s_step)} @ {_fmt(px,s_tick)} (LIMIT/GTX)"))
-    return _req(SAPI,"/api/v1/order","POST",p,True)
+         "quantity":qs,"price":ps,"newOrderRespType":"RESULT"}
+    if cid: p["newClientOrderId"] = cid
+    logging.info(cgood(f"SPOT {side} {qs} @ {ps} (LIMIT/GTX)"))
+    return _spot_order(p)
 
-def fut_limit_gtx(symbol, side, qty, px, f_step, f_tick, reduce_only=True):
+def fut_limit_gtx(symbol, side, qty, px, g, reduce_only=True, cid=None):
+    qs, ps = g.fmt_qty(qty), g.fmt_px(px)
     p = {"symbol":symbol,"side":side,"type":"LIMIT","timeInForce":"GTX",
-         "quantity":_fmt(qty, f_step),"price":_fmt(px, f_tick),
+         "quantity":qs,"price":ps,
          "reduceOnly":"true" if reduce_only else "false","newOrderRespType":"RESULT"}
-    logging.info(cgood(f"FUT  {side} {_fmt(qty,f_step)} @ {_fmt(px,f_tick)} (LIMIT/GTX, ro={reduce_only})"))
-    return _req(FAPI,"/fapi/v1/order","POST",p,True)
+    if cid: p["newClientOrderId"] = cid
+    logging.info(cgood(f"FUT  {side} {qs} @ {ps} (LIMIT/GTX, ro={reduce_only})"))
+    return _fut_order(p)
 
-def spot_limit_ioc(symbol, side, qty, px, s_step, s_tick):
+def spot_limit_ioc(symbol, side, qty, px, g, cid=None):
+    qs, ps = g.fmt_qty(qty), g.fmt_px(px)
     p = {"symbol":symbol,"side":side,"type":"LIMIT","timeInForce":"IOC",
-         "quantity":_fmt(qty, s_step),"price":_fmt(px, s_tick),"newOrderRespType":"RESULT"}
-    logging.warning(cwarn(f"SPOT {side} {_fmt(qty,s_step)} @ {_fmt(px,s_tick)} (IOC)"))
-    return _req(SAPI,"/api/v1/order","POST",p,True)
+         "quantity":qs,"price":ps,"newOrderRespType":"RESULT"}
+    if cid: p["newClientOrderId"] = cid
+    logging.warning(cwarn(f"SPOT {side} {qs} @ {ps} (IOC)"))
+    return _spot_order(p)
 
-def fut_limit_ioc(symbol, side, qty, px, f_step, f_tick, reduce_only=True):
+def fut_limit_ioc(symbol, side, qty, px, g, reduce_only=True, cid=None):
+    qs, ps = g.fmt_qty(qty), g.fmt_px(px)
     p = {"symbol":symbol,"side":side,"type":"LIMIT","timeInForce":"IOC",
-         "quantity":_fmt(qty, f_step),"price":_fmt(px, f_tick),
+         "quantity":qs,"price":ps,
          "reduceOnly":"true" if reduce_only else "false","newOrderRespType":"RESULT"}
-    logging.warning(cwarn(f"FUT  {side} {_fmt(qty,f_step)} @ {_fmt(px,f_tick)} (IOC, ro={reduce_only})"))
-    return _req(FAPI,"/fapi/v1/order","POST",p,True)
+    if cid: p["newClientOrderId"] = cid
+    logging.warning(cwarn(f"FUT  {side} {qs} @ {ps} (IOC, ro={reduce_only})"))
+    return _fut_order(p)
 
-def spot_market_sell(symbol, qty, s_step):
+def spot_market_sell(symbol, qty, g, cid=None):
+    qs = g.fmt_qty(qty)
     p = {"symbol":symbol,"side":"SELL","type":"MARKET",
-         "quantity":_fmt(qty, s_step),"newOrderRespType":"ACK"}
-    logging.warning(cbad(f"SPOT SELL {_fmt(qty,s_step)} (MARKET)"))
-    return _req(SAPI,"/api/v1/order","POST",p,True)
-
-def fut_market_close(symbol, qty, side, f_step):
-    p = {"symbol":symbol,"side":side,"type":"MARKET","quantity":_fmt(qty, f_step),
+         "quantity":qs,"newOrderRespType":"ACK"}
+    if cid: p["newClientOrderId"] = cid
+    logging.warning(cbad(f"SPOT SELL {qs} (MARKET)"))
+    return _spot_order(p)
+
+def fut_market_close(symbol, qty, side, g, cid=None):
+    qs = g.fmt_qty(qty)
+    p = {"symbol":symbol,"side":side,"type":"MARKET","quantity":qs,
          "reduceOnly":"true","newOrderRespType":"RESULT"}
-    logging.warning(cbad(f"FUT  {side} {_fmt(qty,f_step)} (MARKET ro=true)"))
-    return _req(FAPI,"/fapi/v1/order","POST",p,True)
+    if cid: p["newClientOrderId"] = cid
+    logging.warning(cbad(f"FUT  {side} {qs} (MARKET ro=true)"))
+    return _fut_order(p)
+
+# ---------- order manager (open-order index) ----------
+WORKING = ("NEW", "PARTIALLY_FILLED")
+
+class OrderManager:
+    """index ออเดอร์ตาม clientOrderId (สถานะจาก response / user stream / REST openOrders)
+    quote() = ออเดอร์ maker ค้างได้ตัวเดียวต่อ (venue, symbol, side, tag): ตรงกับที่ต้องการ → คงไว้ไม่ยิงซ้ำ,
+    ราคา/จำนวนเปลี่ยน → cancel ตัวเก่าแล้ววางใหม่; qty/filled/px เก็บเป็น step/tick ของ Grid
+    ออเดอร์ค้างที่ไม่รู้จัก: clientOrderId ขึ้นต้นด้วย PREFIX (ของบอทก่อนรีสตาร์ท) → "adopted" (quote แทนที่ได้),
+    อื่น ๆ (วางมือ/โปรเซสอื่น) → "foreign": นับเป็นงานค้างแต่ไม่ยกเลิก/แทนที่เด็ดขาด"""
+    KEEP_DONE = 500  # จำนวนออเดอร์ที่จบแล้วที่เก็บไว้ดูย้อนหลัง
+    PREFIX = "am15"
+
+    def __init__(self, requote_ticks=0):
+        self.requote_ticks = requote_ticks
+        self.orders = {}     # clientOrderId -> dict
+        self.synced = set()  # (base, symbol) ที่ index ตรงกับ exchange แล้ว (REST หรือ stream)
+        self.lock = threading.RLock()
+        self.stats = {"placed": 0, "kept": 0, "replaced": 0, "canceled": 0}
+        self.ledger = {}     # symbol -> fill ของบอทตั้งแต่ ledger_take ครั้งก่อน (ดู _book)
+        self._prefix = f"{self.PREFIX}{now_ms()%10**9:09d}"
+        self._seq = 0
+
+    @staticmethod
+    def _path(base): return "/api/v1/order" if base==SAPI else "/fapi/v1/order"
+
+    def _new_cid(self):
+        with self.lock:
+            self._seq += 1
+            return f"{self._prefix}-{self._seq}"
+
+    def _apply(self, o, status, filled, order_id=None, quote=None):
+        """quote = มูลค่าที่เติมสะสม (USDT) ตามที่ exchange รายงาน → ราคาเติมจริงของส่วนที่เพิ่ม (ไม่ใช่ราคา limit)"""
+        if order_id is not None: o["order_id"] = order_id
+        if filled > o["filled"]:
+            g = o["grid"]
+            px = None
+            if quote is not None and o["quote"] is not None and quote > o["quote"]:
+                px = (quote - o["quote"])/g.q(filled - o["filled"])
+            if JOURNAL is not None:
+                JOURNAL.write("fill", venue=_venue(o["base"]), symbol=o["symbol"], side=o["side"], tag=o["tag"], cid=o["cid"],
+                              qty=g.fmt_qty(filled - o["filled"]), filled=g.fmt_qty(filled),
+                              price=None if px is None else round(px, 10), limit_px=g.fmt_px(o["px"]), status=status)
+            if HEDGER is not None: HEDGER.on_fill(o, filled - o["filled"])
+            if o["tag"] != "foreign": self._book(o, g.q(filled - o["filled"]), px)
+            if quote is None: o["quote"] = None  # ไม่รู้มูลค่าส่วนที่เพิ่ม → ราคาเติมครั้งถัดไปคิดไม่ได้
+        if quote is not None and filled >= o["filled"]: o["quote"] = quote
+        o["filled"] = max(o["filled"], filled)
+        if o["status"] in WORKING: o["status"] = status  # สถานะจบแล้วไม่ย้อนกลับ (event มาไม่เรียงลำดับ)
+        o["ts"] = time.time()
+
+    def _book(self, o, q, px):
+        """fill → ledger ของ symbol: เงินสดสุทธิ (USDT), ยอดที่ขยับต่อ venue (BUY +), จำนวนฝั่งเปิด (Spot BUY/Fut SELL)
+        และมูลค่าซื้อขายแยก venue_maker/venue_taker สำหรับคิดค่าธรรมเนียม; ไม่รู้ราคาเติม → ใช้ราคา limit และนับ unpriced"""
+        led = self.ledger.get(o["symbol"])
+        if led is None:
+            led = self.ledger[o["symbol"]] = {"cash": 0.0, "spot": 0.0, "fut": 0.0, "spot_in": 0.0, "fut_in": 0.0,
+                                              "vol": {}, "unpriced": 0}
+        venue = _venue(o["base"])
+        if px is None:
+            px = o["grid"].p(o["px"])
+            led["unpriced"] += 1
+        sign = 1 if o["side"] == "BUY" else -1
+        led["cash"] -= sign*q*px
+        led[venue] += sign*q
+        if (venue == "spot") == (o["side"] == "BUY"): led[venue + "_in"] += q
+        k = f"{venue}_{'taker' if o.get('taker') else 'maker'}"
+        led["vol"][k] = led["vol"].get(k, 0.0) + q*px
+
+    def ledger_take(self, symbol):
+        """ledger ของ symbol แล้วเริ่มนับใหม่ (None = ยังไม่มี fill)"""
+        with self.lock: return self.ledger.pop(symbol, None)
+
+    def _apply_row(self, o, row):
+        self._apply(o, row.get("status", o["status"]), o["grid"].qty(row.get("executedQty") or "0"), row.get("orderId"),
+                    self._row_quote(row))
+
+    @staticmethod
+    def _row_quote(row):
+        """มูลค่าที่เติมสะสมจาก REST: Spot cummulativeQuoteQty / Futures cumQuote (หรือ avgPrice × executedQty)"""
+        for k in ("cummulativeQuoteQty", "cumQuote"):
+            if row.get(k) not in (None, ""): return float(row[k])
+        if row.get("avgPrice") not in (None, ""): return float(row["avgPrice"])*float(row.get("executedQty") or 0)
+        return None
+
+    def _adopt(self, base, symbol, g, row):
+        """ออเดอร์ค้างที่ไม่รู้จัก → เข้า index: ของบอทเอง (PREFIX) = "adopted" ยกเลิกได้, ของคนอื่น = "foreign" นับอย่างเดียว"""
+        cid = row.get("clientOrderId") or ""
+        tag = "adopted" if cid.startswith(self.PREFIX) else "foreign"
+        o = {"cid": cid, "base": base, "symbol": symbol, "side": row.get("side"), "tag": tag,
+             "grid": g, "qty": g.qty(row.get("origQty") or "0"), "px": g.px(row.get("price") or "0"),
+             "filled": 0, "quote": 0.0, "status": "NEW", "order_id": None, "ts": time.time()}
+        self._apply_row(o, row)
+        self.orders[o["cid"]] = o
+        logging.info(cwarn(f"order {tag} {symbol} {o['side']} {g.fmt_qty(o['qty'])} @ {g.fmt_px(o['px'])} ({o['cid']})"))
+
+    def _prune(self):
+        done = [c for c,o in self.orders.items() if o["status"] not in WORKING]
+        for c in sorted(done, key=lambda c: self.orders[c]["ts"])[:max(0, len(done) - self.KEEP_DONE)]:
+            del self.orders[c]
+
+    def working(self, base, symbol, side=None, tag=None):
+        with self.lock:
+            return [o for o in self.orders.values() if o["status"] in WORKING and o["base"]==base
+                    and o["symbol"]==symbol and (side is None or o["side"]==side) and (tag is None or o["tag"]==tag)]
+
+    def working_qty(self, base, symbol, side, tag=None):
+        """จำนวน (step) ที่ยังค้างอยู่ในออเดอร์ที่ทำงาน"""
+        return sum(o["qty"] - o["filled"] for o in self.working(base, symbol, side, tag))
+
+    def working_notional(self, base, symbol, side, tag=None):
+        """มูลค่า (Decimal) ที่ถูกล็อกในออเดอร์ที่ทำงาน — เงินที่ได้คืนถ้ายกเลิกเพื่อวางใหม่"""
+        return sum((o["grid"].value(o["qty"] - o["filled"], o["px"]) for o in self.working(base, symbol, side, tag)), D("0"))
+
+    # ----- sync -----
+    def refresh(self, base, symbol, g):
+        """ดึง openOrders (REST): รับออเดอร์ที่ไม่รู้จักเข้า index, ตัวที่หายไปจาก open → ถามสถานะสุดท้าย"""
+        rows = _req(base, "/api/v1/openOrders" if base==SAPI else "/fapi/v1/openOrders",
+                    params={"symbol":symbol}, signed=True)
+        gone = []
+        with self.lock:
+            seen = set()
+            for row in rows:
+                cid = row.get("clientOrderId")
+                seen.add(cid)
+                if cid in self.orders: self._apply_row(self.orders[cid], row)
+                else: self._adopt(base, symbol, g, row)
+            gone = [o for o in self.orders.values() if o["base"]==base and o["symbol"]==symbol
+                    and o["status"] in WORKING and o["cid"] not in seen]
+            self.synced.add((base, symbol))
+        for o in gone: self._query(o)
+
+    def _query(self, o):
+        try:
+            row = _req(o["base"], self._path(o["base"]), params={"symbol":o["symbol"],"origClientOrderId":o["cid"]}, signed=True)
+        except Exception as e:
+            logging.warning(cwarn(f"order query fail {o['cid']}: {e}"))
+            if isinstance(e, ApiError):  # exchange ไม่รู้จักออเดอร์นี้ → ไม่นับเป็นงานค้าง
+                with self.lock: self._apply(o, "EXPIRED", o["filled"])
+            return
+        with self.lock: self._apply_row(o, row)
+
+    def ensure_synced(self, base, symbol, g):
+        """ไม่มี user stream → ต้อง refresh ทุกครั้งที่ยังมีงานค้าง; มี stream → REST ครั้งแรก/หลังต่อใหม่เท่านั้น"""
+        live = ACCOUNT is not None and ACCOUNT.live(base)
+        if (base, symbol) not in self.synced or (not live and self.working(base, symbol)):
+            self.refresh(base, symbol, g)
+
+    def on_event(self, base, ev):
+        """executionReport (Spot) / ORDER_TRADE_UPDATE.o (Futures)"""
+        cid = ev.get("C") or ev.get("c")  # Spot: C = id เดิมของออเดอร์ที่ถูกยกเลิก
+        with self.lock:
+            o = self.orders.get(cid)
+            if o is None: return
+            # มูลค่าเติมสะสม: Spot Z / Futures ap × z
+            quote = float(ev["Z"]) if ev.get("Z") not in (None, "") else \
+                    float(ev["ap"])*float(ev.get("z") or 0) if ev.get("ap") not in (None, "") else None
+            self._apply(o, ev.get("X", o["status"]), o["grid"].qty(ev.get("z") or "0"), ev.get("i"), quote)
+
+    def on_reconnect(self, base):
+        with self.lock:
+            self.synced = {k for k in self.synced if k[0]!=base}
+
+    # ----- checkpoint -----
+    def export(self):
+        """ออเดอร์ที่ยังทำงาน → list ของ dict (สตริงตามกริด) สำหรับ checkpoint"""
+        with self.lock:
+            return [{"cid": o["cid"], "venue": _venue(o["base"]), "symbol": o["symbol"], "side": o["side"], "tag": o["tag"],
+                     "qty": o["grid"].fmt_qty(o["qty"]), "px": o["grid"].fmt_px(o["px"]),
+                     "filled": o["grid"].fmt_qty(o["filled"]), "quote": o["quote"], "order_id": o["order_id"]}
+                    for o in sorted(self.orders.values(), key=lambda o: o["cid"]) if o["status"] in WORKING]
+
+    def restore(self, rows):
+        """ออเดอร์จาก checkpoint กลับเข้า index (tag เดิม) — ยังไม่ synced จึงถูก refresh จาก REST ก่อนใช้"""
+        n = 0
+        with self.lock:
+            for r in rows:
+                if r["cid"] in self.orders: continue
+                base = SAPI if r["venue"]=="spot" else FAPI
+                g = FILTERS.get(base, r["symbol"]).grid
+                self.orders[r["cid"]] = {"cid": r["cid"], "base": base, "symbol": r["symbol"], "side": r["side"],
+                                         "tag": r["tag"], "grid": g, "qty": g.qty(r["qty"]), "px": g.px(r["px"]),
+                                         "filled": g.qty(r["filled"]), "quote": r.get("quote"), "status": "NEW",
+                                         "order_id": r.get("order_id"),
+                                         "ts": time.time()}
+                self.synced.discard((base, r["symbol"]))
+                n += 1
+        return n
+
+    # ----- actions -----
+    def cancel(self, o):
+        """ยกเลิก → คืนจำนวนที่เพิ่งรู้ว่าถูกเติมเพิ่มระหว่างนั้น (step)"""
+        before = o["filled"]
+        try:
+            row = _req(o["base"], self._path(o["base"]), "DELETE",
+                       {"symbol":o["symbol"],"origClientOrderId":o["cid"]}, True)
+            with self.lock: self._apply_row(o, row)
+            self.stats["canceled"] += 1
+            jot("cancel", venue=_venue(o["base"]), symbol=o["symbol"], side=o["side"], tag=o["tag"], cid=o["cid"],
+                status=o["status"], filled=o["grid"].fmt_qty(o["filled"]))
+        except Exception as e:
+            logging.info(cwarn(f"cancel {o['cid']} fail ({e}) → query"))
+            self._query(o)
+        return o["filled"] - before
+
+    def quote(self, base, symbol, side, qty, px, g, place, tag):
+        """ให้ออเดอร์ค้างของ (base, symbol, side, tag) = qty@px; place(qty, cid) ยิงออเดอร์จริง
+        qty = จำนวนที่ยังต้องการทั้งหมด (รวมส่วนที่ค้างอยู่) → คืนจำนวนที่วางใหม่ (0 = คงของเดิม/ไม่ได้วาง)"""
+        self.ensure_synced(base, symbol, g)
+        live = [o for o in self.working(base, symbol, side) if o["tag"] in (tag, "adopted")]  # ไม่แตะ "foreign"
+        if len(live)==1 and live[0]["qty"] - live[0]["filled"]==qty and abs(live[0]["px"] - px) <= self.requote_ticks:
+            self.stats["kept"] += 1
+            logging.debug(cinfo(f"quote kept {symbol} {side} {g.fmt_qty(qty)} @ {g.fmt_px(live[0]['px'])}"))
+            return 0
+        for o in live:
+            qty -= self.cancel(o)
+            self.stats["replaced"] += 1
+        return self.submit(base, symbol, side, qty, px, g, place, tag)
+
+    def submit(self, base, symbol, side, qty, px, g, place, tag, taker=False):
+        """วางออเดอร์ใหม่ที่ถูกติดตามใน index (ไม่ดูของที่ค้าง) → จำนวนที่วาง (0 = ต่ำกว่า notional ขั้นต่ำ)
+        taker = IOC/MARKET (ค่าธรรมเนียม taker ใน ledger); quote() วาง GTX จึงเป็น maker เสมอ"""
+        if not meets_notional(qty, px, g): return 0
+        cid = self._new_cid()
+        o = {"cid": cid, "base": base, "symbol": symbol, "side": side, "tag": tag, "grid": g, "qty": qty, "px": px,
+             "filled": 0, "quote": 0.0, "status": "NEW", "order_id": None, "ts": time.time(), "taker": taker}
+        with self.lock:
+            self.orders[cid] = o
+            self._prune()
+        try:
+            row = place(qty, cid)
+        except Exception as e:
+            with self.lock:
+                if isinstance(e, ApiError): self._apply(o, "REJECTED", 0)
+                else: self.synced.discard((base, symbol))  # ไม่รู้ว่าถึงเซิร์ฟเวอร์ไหม → refresh รอบหน้า
+            raise
+        with self.lock: self._apply_row(o, row or {})
+        self.stats["placed"] += 1
+        return qty
+
+ORDERS = None
+
+def start_order_manager(args):
+    global ORDERS
+    ORDERS = OrderManager(args.requote_ticks)
+    return ORDERS
+
+# ---------- checkpoint (warm restart) ----------
+class Checkpoint:
+    """state ของแต่ละคู่ (qty/open_basis/t0) + margin ที่ตั้งแล้ว + ออเดอร์ที่ค้าง → JSON ไฟล์เดียว
+    เขียนแบบ atomic (tmp + fsync + os.replace) เฉพาะเมื่อเนื้อหาเปลี่ยน; ไฟล์ของ endpoint อื่นถูกข้าม
+    โหลดเฉพาะ symbol ที่โปรเซสนี้เทรด (ไฟล์ต้องไม่ใช้ร่วมกันหลายโปรเซส — ตัวที่เขียนทีหลังทับของอีกตัว)"""
+    VERSION = 1
+
+    def __init__(self, path, symbols):
+        self.path = path
+        self.symbols = set(symbols)
+        self.lock = threading.Lock()
+        self.pairs, self.margin, self.orders = {}, {}, []
+        self._last = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path): return
+        try:
+            with open(self.path, "r", encoding="utf-8") as fh:
+                d = json.load(fh)
+        except Exception as e:
+            logging.warning(cwarn(f"checkpoint unreadable ({e}) → cold start"))
+            return
+        if d.get("version") != self.VERSION or d.get("sapi") != SAPI or d.get("fapi") != FAPI:
+            logging.info(cwarn(f"checkpoint {self.path} เป็นของ endpoint/เวอร์ชันอื่น → cold start"))
+            return
+        mine = lambda sym: sym in self.symbols
+        self.pairs = {k: v for k, v in d.get("pairs", {}).items() if mine(k)}
+        self.margin = {k: v for k, v in d.get("margin", {}).items() if mine(k)}
+        self.orders = [r for r in d.get("orders", []) if mine(r["symbol"])]
+        logging.info(cinfo(f"checkpoint loaded: pairs={len(self.pairs)} orders={len(self.orders)} "
+                           f"age={time.time() - d.get('ts', time.time()):.0f}s"))
+
+    def set_pair(self, symbol, row):
+        with self.lock:
+            if row is None: self.pairs.pop(symbol, None)
+            else: self.pairs[symbol] = row
+
+    def set_margin(self, symbol, isolated, lev):
+        with self.lock: self.margin[symbol] = [bool(isolated), int(lev)]
+
+    def margin_ok(self, symbol, isolated, lev):
+        return self.margin.get(symbol) == [bool(isolated), int(lev)]
+
+    def save(self):
+        orders = ORDERS.export() if ORDERS is not None else []
+        with self.lock:
+            d = {"version": self.VERSION, "sapi": SAPI, "fapi": FAPI,
+                 "pairs": self.pairs, "margin": self.margin, "orders": orders}
+            body = json.dumps(d, sort_keys=True, separators=(",",":"))
+            if body == self._last: return False
+            d["ts"] = time.time()
+            tmp = self.path + ".tmp"
+            try:
+                with open(tmp, "w", encoding="utf-8") as fh:
+                    json.dump(d, fh, sort_keys=True, separators=(",",":"))
+                    fh.flush()
+                    os.fsync(fh.fileno())
+                os.replace(tmp, self.path)
+            except OSError as e:
+                logging.warning(cwarn(f"checkpoint write fail: {e}"))
+                return False
+            self._last = body
+            return True
+
+CHECKPOINT = None  # Checkpoint เมื่อ --state-file ไม่ว่าง
+T_START = time.perf_counter()
+
+def start_checkpoint(args, symbols):
+    """โหลด checkpoint ของ symbols แล้วคืนออเดอร์ค้างเข้า OrderManager (ต้องเรียกหลัง start_order_manager)"""
+    global CHECKPOINT
+    if not args.state_file: return None
+    CHECKPOINT = Checkpoint(args.state_file, symbols)
+    if ORDERS is not None and CHECKPOINT.orders:
+        try:
+            logging.info(cinfo(f"restored {ORDERS.restore(CHECKPOINT.orders)} working orders from checkpoint"))
+        except Exception as e:
+            logging.warning(cwarn(f"checkpoint orders not restored: {e}"))
+    return CHECKPOINT
+
+# ---------- hedging engine (fill-triggered) ----------
+PAIR_LOCKS = {}  # symbol -> RLock: การวาง/แก้ออเดอร์ของคู่ (loop หลัก กับ hedger) ทำทีละฝ่าย
+
+def pair_lock(symbol):
+    return PAIR_LOCKS.get(symbol) or PAIR_LOCKS.setdefault(symbol, threading.RLock())
+
+HEDGE_TAGS = ("open", "close", "hedge")  # fill ที่ตั้งใจให้สองขาเท่ากัน (trim/adopted ตั้งใจขยับขาเดียว)
+HEDGE_LEG = {("spot","BUY"): ("fut","SELL"), ("spot","SELL"): ("fut","BUY"),
+             ("fut","SELL"): ("spot","BUY"), ("fut","BUY"): ("spot","SELL")}
+
+class Hedger:
+    """ขาหนึ่งถูกเติม → ปรับอีกขาทันที (ไม่รอรอบ --poll): resid = Spot ที่ได้ - short ที่ได้ (หน่วย asset) ต่อ symbol
+    หดออเดอร์ open/close ที่ค้างบนขาที่ตามหลัง แล้ววาง maker "hedge" ที่ touch (ไล่ราคาทุก chase_ms)
+    ค้างเกิน ioc_ms นับจากเริ่มเสีย balance → ยกเลิกแล้ว IOC ที่ฝั่งตรงข้าม; fill ของ hedge ไหลกลับมาที่ on_fill"""
+    def __init__(self, chase_ms=100, ioc_ms=1500):
+        self.chase = chase_ms/1000.0
+        self.ioc = ioc_ms/1000.0
+        self.cv = threading.Condition()
+        self.state = {}  # symbol -> {"resid": float, "leg": (venue, side) | None, "since": perf_counter | None, "fill_at": ...}
+        self.stats = {"fills": 0, "chase": 0, "ioc": 0, "hedged": 0, "reconciled": 0}
+        self.thread = threading.Thread(target=self._run, name="hedger", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def on_fill(self, o, steps):
+        """เรียกจาก OrderManager._apply (ถือ ORDERS.lock อยู่) → อัปเดต resid แล้วปลุก thread เท่านั้น"""
+        if o["tag"] not in HEDGE_TAGS + ("trim",): return
+        venue, d = _venue(o["base"]), o["grid"].q(steps)
+        sign = 1 if o["side"] == "BUY" else -1
+        with self.cv:
+            st = self.state.setdefault(o["symbol"], {"resid": 0.0, "leg": None, "since": None})
+            st["fill_at"] = time.perf_counter()
+            before = st["resid"]
+            new = before + sign*d
+            if o["tag"] == "trim":  # trim นับเฉพาะส่วนที่ดึงขาที่นำอยู่กลับมา (ส่วนเกินเดิมของบัญชีไม่ใช่งานของ hedger)
+                new = max(new, 0.0) if before > 0 > sign else min(new, 0.0) if before < 0 < sign else before
+            st["resid"] = new
+            if abs(new) > abs(before) or new*before < 0:  # fill นี้ทำให้เสีย balance → ขาที่ต้องตาม = อีก venue
+                st["leg"] = HEDGE_LEG[(venue, o["side"])]
+                if st["since"] is None: st["since"] = time.perf_counter()
+            self.stats["fills"] += 1
+            self.cv.notify()
+
+    SETTLE = 1.0  # วินาที: ยอดจาก REST/stream อาจยังไม่รวม fill ที่เพิ่งเห็น → ไม่เทียบช่วงนี้
+
+    def reconcile(self, symbol, spot, short, t_read):
+        """resid สร้างจาก fill ล้วน ๆ → fill ที่หลุด (_query ได้ ApiError แล้วถือว่า EXPIRED, prune, restart) ทำให้ตามเกิน
+        เทียบกับยอดจริง (spot - short, อ่านตอน t_read) แล้วจำกัด resid ไม่ให้เกิน/ไม่ให้สวนทิศ imbalance จริง
+        ฝั่งที่ขาดจริงแต่ resid ไม่รู้ ปล่อยให้ need/over ของ _attach_locked ตามเอง (กันแย่งกับ trim/ยอดเดิมของบัญชี)"""
+        real = float(spot - short)
+        with self.cv:
+            st = self.state.get(symbol)
+            if st is None or st.get("fill_at", 0.0) > t_read - self.SETTLE: return
+            before = st["resid"]
+            capped = 0.0 if before*real <= 0 else (min(before, real) if before > 0 else max(before, real))
+            if capped == before: return
+            st["resid"] = capped
+            self.stats["reconciled"] += 1
+            self.cv.notify()
+        logging.info(cwarn(f"hedge {symbol} resid {before:.8g} → {capped:.8g} (spot-short={real:.8g})"))
+        jot("hedge", symbol=symbol, action="reconcile", resid=round(capped, 10), was=round(before, 10), real=round(real, 10))
+
+    def residual(self, symbol):
+        with self.cv:
+            st = self.state.get(symbol)
+            return st["resid"] if st else 0.0
+
+    def _run(self):
+        while True:
+            with self.cv:
+                self.cv.wait(self.chase)
+                work = [s for s, st in self.state.items() if st["leg"] is not None]
+            for sym in work:
+                try:
+                    self._hedge(sym)
+                except Exception as e:
+                    logging.warning(cwarn(f"hedge {sym} fail: {e}"))
+
+    def _plan(self, sym):
+        """(venue, side, base, grid, step ที่ยังต้องตาม, since) จาก resid ล่าสุด — หักส่วนที่ trim ของขาที่นำกำลังดึงกลับ
+        ครบแล้ว (เหลือไม่ถึง 1 step) → ปิดรอบพร้อมบันทึกเวลาที่เสีย balance; ไม่มีงาน → None"""
+        with self.cv:
+            st = self.state[sym]
+            if st["leg"] is None: return None
+            (venue, side), resid, since = st["leg"], st["resid"], st["since"]
+        base = SAPI if venue == "spot" else FAPI
+        g = FILTERS.get(base, sym).grid
+        qty = g.qty(abs(resid)) if resid and (resid < 0) == (side == "BUY") else 0
+        lead, lside = HEDGE_LEG[(venue, side)]
+        lbase = SAPI if lead == "spot" else FAPI
+        trimming = ORDERS.working_qty(lbase, sym, "SELL" if lside == "BUY" else "BUY", "trim")
+        if qty <= 0 and not trimming:
+            with self.cv:
+                if st["resid"] == resid and st["since"] is not None:
+                    ms = (time.perf_counter() - st["since"])*1000
+                    self.stats["hedged"] += 1
+                    if METRICS is not None: METRICS.observe("aster_unhedged_ms", ms, symbol=sym)
+                    jot("hedge", symbol=sym, action="done", unhedged_ms=round(ms, 1), resid=round(resid, 10))
+                    st["leg"], st["since"] = None, None
+            return venue, side, base, g, 0, None
+        qty = max(qty - g.steps_from(FILTERS.get(lbase, sym).grid, trimming), 0)
+        return venue, side, base, g, qty, since
+
+    def _again(self, sym, venue, side):
+        """จำนวนที่ยังต้องตามหลังมี fill ระหว่างทาง; ขาเปลี่ยน/ครบแล้ว → None"""
+        p = self._plan(sym)
+        return p[4] if p and p[:2] == (venue, side) and p[5] is not None else None
+
+    def _hedge(self, sym):
+        with pair_lock(sym):
+            plan = self._plan(sym)
+            if plan is None: return
+            ORDERS.ensure_synced(plan[2], sym, plan[3])  # fill ของ hedge ที่ยังไม่รู้ → ไม่วางซ้ำ
+            venue, side, base, g, qty, since = self._plan(sym) or plan
+            if METRICS is not None: METRICS.set("aster_hedge_residual", round(self.residual(sym), 8), symbol=sym)
+            if since is None:
+                for o in ORDERS.working(base, sym, side, "hedge"): ORDERS.cancel(o)
+                return
+            ro = venue == "fut" and side == "BUY"
+            bids, asks = depth(base, sym, 5)
+            if not (bids and asks): return
+            if time.perf_counter() - since >= self.ioc:
+                for o in ORDERS.working(base, sym, side, "hedge"): ORDERS.cancel(o)
+                qty = self._again(sym, venue, side)  # cancel อาจเจอ fill เพิ่ม
+                if not qty: return
+                px = asks[0][0] if side == "BUY" else bids[0][0]
+                send = (lambda q, cid: spot_limit_ioc(sym, side, q, px, g, cid)) if venue == "spot" else \
+                       (lambda q, cid: fut_limit_ioc(sym, side, q, px, g, ro, cid))
+                if ORDERS.submit(base, sym, side, qty, px, g, send, "hedge", taker=True):
+                    self.stats["ioc"] += 1
+                    jot("hedge", symbol=sym, action="ioc", venue=venue, side=side, qty=g.fmt_qty(qty), px=g.fmt_px(px))
+                return
+            # maker ที่ touch (เข้าไปในสเปรด 1 tick ถ้ามีที่ว่าง)
+            px = min(bids[0][0] + 1, asks[0][0] - 1) if side == "BUY" else max(asks[0][0] - 1, bids[0][0] + 1)
+            px = max(px, bids[0][0]) if side == "BUY" else min(px, asks[0][0])
+            add = qty - ORDERS.working_qty(base, sym, side, "hedge")
+            if add > 0:  # ย้ายจำนวนที่ต้องตามออกจากออเดอร์ปกติของขานี้ (กันเติมซ้ำสองตัว)
+                for o in ORDERS.working(base, sym, side):
+                    if o["tag"] not in ("open", "close") or add <= 0: continue
+                    rem = o["qty"] - o["filled"]
+                    cut = min(rem, add)
+                    mk = (lambda p: lambda q, cid: spot_limit_gtx(sym, side, q, p, g, cid)) if venue == "spot" else \
+                         (lambda p: lambda q, cid: fut_limit_gtx(sym, side, q, p, g, ro, cid))
+                    ORDERS.quote(base, sym, side, rem - cut, o["px"], g, mk(o["px"]), o["tag"])
+                    add -= cut
+                qty = self._again(sym, venue, side)
+                if qty is None: return
+            send = (lambda q, cid: spot_limit_gtx(sym, side, q, px, g, cid)) if venue == "spot" else \
+                   (lambda q, cid: fut_limit_gtx(sym, side, q, px, g, ro, cid))
+            if ORDERS.quote(base, sym, side, qty, px, g, send, "hedge"):
+                self.stats["chase"] += 1
+                jot("hedge", symbol=sym, action="chase", venue=venue, side=side, qty=g.fmt_qty(qty), px=g.fmt_px(px))
+
+HEDGER = None  # Hedger เมื่อเปิด --hedge
+
+def start_hedger(args):
+    global HEDGER
+    if not args.hedge: return None
+    if not args.user_stream:
+        logging.warning(cwarn("--hedge โดยไม่มี --user-stream: รู้ว่าถูกเติมตอน refresh ออเดอร์เท่านั้น (ช้ากว่า)"))
+    HEDGER = Hedger(args.hedge_chase_ms, args.hedge_ioc_ms).start()
+    return HEDGER
 
 # ---------- margin/leverage ----------
 def set_isolated_and_leverage(symbol, isolated, lev):
+    """→ True เมื่อตั้ง leverage สำเร็จ (marginType มัก error ว่าไม่ต้องเปลี่ยน จึงไม่นับ)"""
     try:
         _req(FAPI,"/fapi/v1/marginType","POST",
              {"symbol":symbol,"marginType":"ISOLATED" if isolated else "CROSSED"},True)
@@ -244,254 +2010,781 @@ def set_isolated_and_leverage(symbol, isolated, lev):
         logging.info(cwarn(f"margin/leverage set fail (non-fatal): {e}"))
     try:
         _req(FAPI,"/fapi/v1/leverage","POST",{"symbol":symbol,"leverage":int(lev)},True)
+        return True
     except Exception as e:
         logging.info(cwarn(f"leverage set fail (non-fatal): {e}"))
+        return False
 
 # ---------- sizing / economics ----------
-def target_qty_from_capital(capital_usd: Decimal, spot_px: Decimal, s_step: Decimal, whole_qty=False)->Decimal:
-    if spot_px<=0: return D("0")
-    qty = capital_usd/spot_px
-    if whole_qty:
-        qty = D(int(qty))  # ปัดเป็นจำนวนเต็ม
-    return _quant_floor(qty, s_step)
+# ขนาด/notional คิดเป็น int บนกริด; economics รับ float (จาก Grid.p/Grid.q) เพราะเป็นค่าประมาณ ไม่ถูกส่งเป็นคำสั่ง
+def target_qty_from_capital(capital_usd, spot_px, g, whole_qty=False):
+    """ทุน USDT / ราคา (tick) → จำนวน step ปัดลง (whole_qty = ตัดเป็นจำนวนเต็มหน่วยก่อน)"""
+    return g.qty_for(capital_usd, spot_px, whole_qty)
 
-def meets_notional(qty:Decimal, px:Decimal, min_notional:Decimal)->bool:
-    return qty>0 and (qty*px)>=min_notional
+def meets_notional(qty, px, g):
+    return g.notional_ok(qty, px)
 
 def est_open_basis_minus_fee(qty, s_px, f_px, maker_spot_bps, maker_fut_bps):
-    fee = qty*s_px*D(maker_spot_bps)/D(10000) + qty*f_px*D(maker_fut_bps)/D(10000)
+    fee = qty*s_px*maker_spot_bps/1e4 + qty*f_px*maker_fut_bps/1e4
     basis = (f_px - s_px)*qty
     return basis - fee
 
 def est_close_gain_minus_fee_slip(qty, s_px, f_px, taker_spot_bps, taker_fut_bps, slippage_bps):
-    fee = qty*s_px*D(taker_spot_bps)/D(10000) + qty*f_px*D(taker_fut_bps)/D(10000)
-    slip = qty*(s_px+f_px)/D(2) * D(slippage_bps)/D(10000)
+    fee = qty*s_px*taker_spot_bps/1e4 + qty*f_px*taker_fut_bps/1e4
+    slip = qty*(s_px+f_px)/2 * slippage_bps/1e4
     basis = -(f_px - s_px)*qty
     return basis - fee - slip
 
+# ---------- close cost (full-depth VWAP) ----------
+class BookCost:
+    """ต้นทุนกินเด็ปธ์ฝั่งเดียว: levels = [(tick, step)] เรียงจากราคาดีสุด → prefix sum ครั้งเดียว
+    แล้วหา notional ของหลาย qty พร้อมกันด้วย bisect (O(levels + m·log levels)) เป็น int tick·step แม่นยำ"""
+    __slots__ = ("px", "cq", "cn")
+    def __init__(self, levels):
+        self.px, self.cq, self.cn = [], [0], [0]
+        for t, n in levels:
+            self.px.append(t)
+            self.cq.append(self.cq[-1] + n)
+            self.cn.append(self.cn[-1] + t*n)
+
+    @property
+    def depth(self): return self.cq[-1]
+
+    def cost(self, qtys):
+        """[notional (tick·step) | None ถ้าเด็ปธ์ไม่พอ] ของการกิน qty (step) แต่ละค่า"""
+        cq, cn, px, out = self.cq, self.cn, self.px, []
+        for n in qtys:
+            if n > cq[-1]: out.append(None); continue
+            k = bisect.bisect_left(cq, n)
+            out.append(cn[k-1] + (n - cq[k-1])*px[k-1] if k else 0)
+        return out
+
+def close_books(args, limit=None):
+    """(Spot (bids, asks), Futures (bids, asks)) สำหรับประเมินการปิด"""
+    sb, fb, _ = run_legs(lambda: depth(SAPI,args.symbol,limit or args.close_depth),
+                         lambda: depth(FAPI,args.symbol,limit or args.close_depth))
+    return sb, fb
+
+def close_net_curve(args, qtys, books, sg, fg, qg):
+    """net ขาปิดแบบ taker ตาม VWAP เต็มเด็ปธ์ (ขาย Spot ลง bids / ซื้อ Futures ขึ้น asks) ของหลาย qty (step ของ qg)
+    → [float | None] (None = เด็ปธ์ที่ดึงมาไม่พอสำหรับ qty นั้น)"""
+    (sbids,_), (_,fasks) = books
+    sell = BookCost(sbids).cost([sg.steps_from(qg, q) for q in qtys])
+    buy = BookCost(fasks).cost([fg.steps_from(qg, q) for q in qtys])
+    su, fu = sg.p(1)*sg.q(1), fg.p(1)*fg.q(1)  # float ต่อหนึ่งหน่วย tick·step
+    out = []
+    for a, b in zip(sell, buy):
+        if a is None or b is None:
+            out.append(None)
+            continue
+        sv, bv = a*su, b*fu
+        out.append(sv - bv - sv*args.taker_spot_bps/1e4 - bv*args.taker_fut_bps/1e4)
+    return out
+
+def max_close_qty(args, qty, open_basis, books, sg, fg, qg, n=32):
+    """qty (step ของ qg) ที่ใหญ่ที่สุด ≤ qty ที่ open_basis ตามสัดส่วน + close เต็มเด็ปธ์ ยังถึง --target-profit (0 = ไม่มี)"""
+    if qty <= 0: return 0
+    cands = sorted({max(1, qty*i//n) for i in range(1, n+1)})
+    best = 0
+    for q, c in zip(cands, close_net_curve(args, cands, books, sg, fg, qg)):
+        if c is not None and open_basis*q/qty + c >= args.target_profit: best = q
+    return best
+
 # ---------- helpers ----------
-def s_bid(sbids): return sbids[0][0] if sbids else D("0")
-def s_ask(sasks): return sasks[0][0] if sasks else D("0")
-def f_bid(fbids): return fbids[0][0] if fbids else D("0")
-def f_ask(fasks): return fasks[0][0] if fasks else D("0")
+def s_bid(sbids): return sbids[0][0] if sbids else 0
+def s_ask(sasks): return sasks[0][0] if sasks else 0
+def f_bid(fbids): return fbids[0][0] if fbids else 0
+def f_ask(fasks): return fasks[0][0] if fasks else 0
+
+# ---------- concurrent legs ----------
+POOL = None  # ThreadPoolExecutor เมื่อเปิด --parallel; None = ยิงทีละขา (Spot ก่อน Futures)
+
+def configure_parallel(args):
+    global POOL
+    if args.parallel and POOL is None:
+        POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="leg")
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    try:
+        return fn(), None, t0, time.perf_counter()
+    except Exception as e:
+        return None, e, t0, time.perf_counter()
+
+def _log_legs(label, timing):
+    logging.info(cinfo(f"{label} legs: spot={timing['spot_ms']:.0f}ms fut={timing['fut_ms']:.0f}ms "
+                       f"skew start={timing['start_skew_ms']:.0f}ms done={timing['done_skew_ms']:.0f}ms"))
+    if METRICS is not None:
+        sym = getattr(_DECISION, "symbol", "")
+        METRICS.observe("aster_leg_skew_ms", timing["start_skew_ms"], symbol=sym, label=label, edge="start")
+        METRICS.observe("aster_leg_skew_ms", timing["done_skew_ms"], symbol=sym, label=label, edge="done")
+        t0 = getattr(_DECISION, "t0", None)
+        if t0 is not None: METRICS.observe("aster_tick_to_order_ms", (timing["t0"] - t0)*1000, symbol=sym, label=label)
+
+def run_legs(spot_fn, fut_fn, label=None):
+    """รันขา Spot/Futures (พร้อมกันถ้า --parallel) → (spot_result, fut_result, timing ms)"""
+    if POOL is None:
+        rs = _timed(spot_fn)
+        if rs[1] is not None: raise rs[1]
+        rf = _timed(fut_fn)
+    else:
+        fs = POOL.submit(_timed, spot_fn)
+        ff = POOL.submit(_timed, fut_fn)
+        rs, rf = fs.result(), ff.result()
+    timing = {
+        "spot_ms": (rs[3]-rs[2])*1000, "fut_ms": (rf[3]-rf[2])*1000,
+        "start_skew_ms": abs(rs[2]-rf[2])*1000, "done_skew_ms": abs(rs[3]-rf[3])*1000,
+        "t0": min(rs[2], rf[2]),
+    }
+    if label: _log_legs(label, timing)
+    for r in (rs, rf):
+        if r[1] is not None: raise r[1]
+    return rs[0], rf[0], timing
+
+def _noop(): return None
 
 # ---------- attach/open pair ----------
-def attach_or_open_pair(args, s_step,f_step, s_tick,f_tick, s_min_notional,f_min_notional):
-    sbids,sasks = depth(SAPI,args.symbol,args.depth_limit)
-    fbids,fasks = depth(FAPI,args.symbol,args.depth_limit)
+# sg/fg = Grid ของ Spot/Futures, qg = กริดจำนวนของคู่ (step ที่ละเอียดกว่า) — qty ของคู่เป็นจำนวน step ของ qg
+def attach_or_open_pair(args, sg, fg, qg):
+    (sbids,sasks), (fbids,fasks), _ = run_legs(lambda: depth(SAPI,args.symbol,args.depth_limit),
+                                               lambda: depth(FAPI,args.symbol,args.depth_limit))
     if not (sbids and sasks and fbids and fasks):
         raise RuntimeError("orderbook empty")
     # price for maker open: BUY spot near bid (<=bid), SELL fut near ask (>=ask)
     s_px = sbids[max(0,args.nth-1)][0]
     f_px = fasks[max(0,args.nth-1)][0]
 
-    spot_now = spot_bal(args.asset)
-    pos = fut_pos(args.symbol); fut_now = abs(pos["qty"]) if pos else D("0")
-
-    target = target_qty_from_capital(D(args.capital), s_px, s_step, whole_qty=args.whole_qty)
-
-    need_s = max(target - spot_now, D("0"))
-    need_f = max(target - fut_now,  D("0"))
-    over_s = max(spot_now - target, D("0"))
-    over_f = max(fut_now  - target, D("0"))
-
-    # add spot (BUY maker)
-    cash = usdt_free()
-    add_s = min(need_s, _quant_floor(cash/s_px, s_step))
-    if add_s>0 and meets_notional(add_s,s_px,s_min_notional):
-        logging.info(cgood(f"OPEN[MKR] Spot BUY {_fmt(add_s,s_step)} @ {_fmt(s_px,s_tick)}"))
-        spot_limit_gtx(args.symbol,"BUY",add_s,s_px,s_step,s_tick)
-        cash -= add_s*s_px
-
-    # add fut (SELL maker, non-RO)
-    add_f = _quant_floor(need_f, f_step)
-    if add_f>0 and meets_notional(add_f,f_px,f_min_notional):
-        logging.info(cgood(f"OPEN[MKR] Futures SELL {_fmt(add_f,f_step)} @ {_fmt(f_px,f_tick)}"))
-        fut_limit_gtx(args.symbol,"SELL",add_f,f_px,f_step,f_tick,False)
-
-    # trim excess
+    with pair_lock(args.symbol):  # hedger แก้ออเดอร์ของคู่นี้ไม่ได้ระหว่างอ่านยอด → วาง
+        return _attach_locked(args, sg, fg, qg, sbids, sasks, fbids, fasks, s_px, f_px)
+
+def _attach_locked(args, sg, fg, qg, sbids, sasks, fbids, fasks, s_px, f_px):
+    t_read = time.monotonic()
+    (spot_now, cash), pos, _ = run_legs(lambda: spot_bal_and_cash(args.asset),
+                                        lambda: fut_pos(args.symbol))
+    fut_now = abs(pos["qty"]) if pos else D("0")
+
+    target = target_qty_from_capital(args.capital, s_px, sg, whole_qty=args.whole_qty)
+
+    # ยอดจริงอาจไม่อยู่บนกริด (ค่าธรรมเนียมหักเป็น asset): floor(target-x) = target-ceil(x)
+    need_s = max(target - sg.qty(spot_now, up=True), 0)
+    need_f = max(fg.steps_from(sg, target) - fg.qty(fut_now, up=True), 0)
+    over_s = max(sg.qty(spot_now) - target, 0)
+    over_f = max(fg.qty(fut_now) - fg.steps_from(sg, target, up=True), 0)
+
+    # add spot (BUY maker) + add fut (SELL maker, non-RO) — need รวมส่วนที่ออเดอร์ค้างอยู่แล้ว:
+    # quote() คงออเดอร์เดิมถ้าราคา/จำนวนตรง ไม่งั้นยกเลิกแล้ววางใหม่ (เงินที่ล็อกในตัวเก่าได้คืนมาใช้;
+    # "foreign" ไม่ถูกยกเลิก เงินที่มันล็อกจึงไม่นับกลับ)
+    # ส่วนที่ออเดอร์ hedge กำลังตามอยู่ไม่ต้องวาง "open" ซ้ำ
+    cash += ORDERS.working_notional(SAPI, args.symbol, "BUY", "open") + ORDERS.working_notional(SAPI, args.symbol, "BUY", "adopted")
+    with CASH_LOCK:  # จองเงินของ BUY นี้ (portfolio: คู่อื่นหักออกจนยอดที่อ่านได้รวมมันแล้ว) → วางนอก lock
+        cash -= cash_held(args.symbol, t_read)
+        add_s = min(max(need_s - ORDERS.working_qty(SAPI, args.symbol, "BUY", "hedge"), 0), sg.qty_for(max(cash, D("0")), s_px))
+        hold = [args.symbol, sg.value(add_s, s_px), None]
+        CASH_HOLDS.append(hold)
+    add_f = max(need_f - ORDERS.working_qty(FAPI, args.symbol, "SELL", "hedge"), 0)
+    try:
+        def spot_fn():
+            def place(q, cid):
+                logging.info(cgood(f"OPEN[MKR] Spot BUY {sg.fmt_qty(q)} @ {sg.fmt_px(s_px)}"))
+                return spot_limit_gtx(args.symbol,"BUY",q,s_px,sg,cid)
+            return ORDERS.quote(SAPI, args.symbol, "BUY", add_s, s_px, sg, place, "open")
+        def fut_fn():
+            def place(q, cid):
+                logging.info(cgood(f"OPEN[MKR] Futures SELL {fg.fmt_qty(q)} @ {fg.fmt_px(f_px)}"))
+                return fut_limit_gtx(args.symbol,"SELL",q,f_px,fg,False,cid)
+            return ORDERS.quote(FAPI, args.symbol, "SELL", add_f, f_px, fg, place, "open")
+        placed_s, placed_f, timing = run_legs(spot_fn, fut_fn)
+        if placed_s or placed_f: _log_legs("OPEN", timing)
+    finally:
+        with CASH_LOCK: hold[2] = time.monotonic()
+
+    # trim excess (ไม่มีส่วนเกิน → ไม่แตะออเดอร์ trim ที่ค้าง; ยอดจะตามทันเมื่อมันถูกเติม)
+    spot_fn = fut_fn = _noop
+    over_s = max(over_s - ORDERS.working_qty(SAPI, args.symbol, "SELL", "hedge"), 0)
+    over_f = max(over_f - ORDERS.working_qty(FAPI, args.symbol, "BUY", "hedge"), 0)
     if over_s>0:
-        cut = _quant_floor(over_s, s_step)
-        if cut>0:
-            px = s_ask(sasks)
-            if meets_notional(cut, px, s_min_notional):
-                logging.info(cwarn(f"TRIM[MKR] Spot SELL {_fmt(cut,s_step)} @ {_fmt(px,s_tick)}"))
-                spot_limit_gtx(args.symbol,"SELL",cut,px,s_step,s_tick)
+        px_s = s_ask(sasks)
+        def spot_fn():
+            def place(q, cid):
+                logging.info(cwarn(f"TRIM[MKR] Spot SELL {sg.fmt_qty(q)} @ {sg.fmt_px(px_s)}"))
+                return spot_limit_gtx(args.symbol,"SELL",q,px_s,sg,cid)
+            return ORDERS.quote(SAPI, args.symbol, "SELL", over_s, px_s, sg, place, "trim")
 
     if over_f>0:
-        cut = _quant_floor(over_f, f_step)
-        if cut>0:
-            px = f_bid(fbids)
-            if meets_notional(cut, px, f_min_notional):
-                logging.info(cwarn(f"TRIM[MKR] Fut BUY(ro) {_fmt(cut,f_step)} @ {_fmt(px,f_tick)}"))
-                fut_limit_gtx(args.symbol,"BUY",cut,px,f_step,f_tick,True)
+        px_f = f_bid(fbids)
+        def fut_fn():
+            def place(q, cid):
+                logging.info(cwarn(f"TRIM[MKR] Fut BUY(ro) {fg.fmt_qty(q)} @ {fg.fmt_px(px_f)}"))
+                return fut_limit_gtx(args.symbol,"BUY",q,px_f,fg,True,cid)
+            return ORDERS.quote(FAPI, args.symbol, "BUY", over_f, px_f, fg, place, "trim")
+    if spot_fn is not _noop or fut_fn is not _noop:
+        placed_s, placed_f, timing = run_legs(spot_fn, fut_fn)
+        if placed_s or placed_f: _log_legs("TRIM", timing)
 
     # ประเมินคู่ที่พร้อมใช้หลังซิงก์
-    spot_eff = spot_bal(args.asset)
-    fut_eff  = abs((fut_pos(args.symbol) or {"qty":D("0")})["qty"])
-    qty_eff  = min(spot_eff, fut_eff)
+    t_read = time.perf_counter()
+    spot_eff, pos_eff, _ = run_legs(lambda: spot_bal(args.asset), lambda: fut_pos(args.symbol))
+    fut_eff  = abs((pos_eff or {"qty":D("0")})["qty"])
+    if HEDGER is not None: HEDGER.reconcile(args.symbol, spot_eff, fut_eff, t_read)
+    qty_eff  = min(qg.qty(spot_eff), qg.qty(fut_eff))
 
-    open_basis = est_open_basis_minus_fee(qty_eff, s_px, f_px,
+    open_basis = est_open_basis_minus_fee(qg.q(qty_eff), sg.p(s_px), fg.p(f_px),
                                           args.maker_spot_bps, args.maker_fut_bps)
     return qty_eff, s_px, f_px, open_basis
 
 # ---------- guard ก่อนปิด ----------
-def guards_ok_for_close(args, qty, s_step,f_step, s_tick,f_tick):
-    sbids,sasks = depth(SAPI,args.symbol,3)
-    fbids,fasks = depth(FAPI,args.symbol,3)
+def guards_ok_for_close(args, qty, sg, fg, qg, books=None):
+    (sbids,sasks), (fbids,fasks) = books or close_books(args, 3)
     if not (sbids and sasks and fbids and fasks): return False
-    s_ask_px = s_ask(sasks); f_bid_px = f_bid(fbids)
-    mid = (s_ask_px + f_bid_px)/D(2) if s_ask_px>0 and f_bid_px>0 else D(0)
-    spread_bps = ((s_ask_px - f_bid_px)/mid*D(10000)) if mid>0 else D(99999)
-
-    sum_ask = sum([q for _,q in sasks[:2]])
-    sum_bid = sum([q for _,q in fbids[:2]])
-
-    depth_ok = (sum_ask >= qty*D(args.min_close_depth_mult)) and (sum_bid >= qty*D(args.min_close_depth_mult))
-    spread_ok = (spread_bps <= D(args.max_close_spread_bps))
+    s_ask_px = sg.p(s_ask(sasks)); f_bid_px = fg.p(f_bid(fbids))
+    mid = (s_ask_px + f_bid_px)/2 if s_ask_px>0 and f_bid_px>0 else 0.0
+    spread_bps = ((s_ask_px - f_bid_px)/mid*1e4) if mid>0 else 99999.0
+
+    # เด็ปธ์ของขาปิดแต่ละขา: depth = ทุกชั้นที่ดึงมาฝั่งที่ taker fallback ต้องกิน (Spot bids / Futures asks)
+    # flat = 2 ชั้นฝั่งที่ maker close วางอยู่ (Spot asks / Futures bids) แบบเดิม
+    if args.close_model == "depth":
+        spot_side, fut_side = "bid", "ask"
+        spot_depth = sg.q(sum([n for _,n in sbids]))
+        fut_depth  = fg.q(sum([n for _,n in fasks]))
+    else:
+        spot_side, fut_side = "ask", "bid"
+        spot_depth = sg.q(sum([n for _,n in sasks[:2]]))
+        fut_depth  = fg.q(sum([n for _,n in fbids[:2]]))
+    need = qg.q(qty)*args.min_close_depth_mult
+
+    depth_ok = (spot_depth >= need) and (fut_depth >= need)
+    spread_ok = (spread_bps <= args.max_close_spread_bps)
     if not depth_ok:
-        logging.info(cwarn(f"close-guard depth not ok: askDepth={sum_ask:.2f} bidDepth={sum_bid:.2f} need>={qty*D(args.min_close_depth_mult):.2f}"))
+        logging.info(cwarn(f"close-guard depth not ok: spot {spot_side}Depth={spot_depth:.2f} "
+                           f"fut {fut_side}Depth={fut_depth:.2f} need>={need:.2f}"))
     if not spread_ok:
         logging.info(cwarn(f"close-guard spread not ok: spread={spread_bps:.2f} bps > {args.max_close_spread_bps}"))
     return depth_ok and spread_ok
 
 # ---------- close pair ----------
-def close_pair_maker_first(args, qty, s_step,f_step, s_tick,f_tick):
-    qty = _quant_floor(qty, min(s_step,f_step))
-    if qty<=0: return False
-    sbids,sasks = depth(SAPI,args.symbol,2)
-    fbids,fasks = depth(FAPI,args.symbol,2)
-    if not (sbids and sasks and fbids and fasks): return False
-    s_px = s_ask(sasks)  # SELL spot maker
-    f_px = f_bid(fbids)  # BUY fut maker (reduceOnly)
-
-    ok = True
-    # Spot close
+def _close_spot_leg(args, qty, s_px, sg):
     try:
-        spot_limit_gtx(args.symbol,"SELL",qty,s_px,s_step,s_tick)
+        ORDERS.quote(SAPI, args.symbol, "SELL", qty, s_px, sg,
+                     lambda q, cid: spot_limit_gtx(args.symbol,"SELL",q,s_px,sg,cid), "close")
+        return "maker"
     except Exception as e:
         logging.warning(cwarn(f"spot maker close fail: {e}"))
-        if args.close_mode=="taker":
-            try:
-                spot_limit_ioc(args.symbol,"SELL",qty,s_px,s_step,s_tick)
-            except Exception as e2:
-                logging.warning(cwarn(f"spot IOC fail: {e2}"))
-                try:
-                    spot_market_sell(args.symbol,qty,s_step)
-                except Exception as e3:
-                    logging.error(cbad(f"spot market fail: {e3}"))
-                    ok = False
-        else: ok = False
-
-    # Futures close (reduceOnly)
+        if args.close_mode!="taker": return False
     try:
-        fut_limit_gtx(args.symbol,"BUY",qty,f_px,f_step,f_tick,True)
+        ORDERS.submit(SAPI, args.symbol, "SELL", qty, s_px, sg,
+                      lambda q, cid: spot_limit_ioc(args.symbol,"SELL",q,s_px,sg,cid), "close", taker=True)
+        return "ioc"
+    except Exception as e2:
+        logging.warning(cwarn(f"spot IOC fail: {e2}"))
+    try:
+        ORDERS.submit(SAPI, args.symbol, "SELL", qty, s_px, sg,
+                      lambda q, cid: spot_market_sell(args.symbol,q,sg,cid), "close", taker=True)
+        return "market"
+    except Exception as e3:
+        logging.error(cbad(f"spot market fail: {e3}"))
+        return False
+
+def _close_fut_leg(args, qty, f_px, fg):
+    try:
+        ORDERS.quote(FAPI, args.symbol, "BUY", qty, f_px, fg,
+                     lambda q, cid: fut_limit_gtx(args.symbol,"BUY",q,f_px,fg,True,cid), "close")
+        return "maker"
     except Exception as e:
         logging.warning(cwarn(f"fut maker close fail: {e}"))
-        if args.close_mode=="taker":
-            try:
-                fut_limit_ioc(args.symbol,"BUY",qty,f_px,f_step,f_tick,True)
-            except Exception as e2:
-                logging.warning(cwarn(f"fut IOC fail: {e2}"))
-                try:
-                    fut_market_close(args.symbol,qty,"BUY",f_step)
-                except Exception as e3:
-                    logging.error(cbad(f"fut market fail: {e3}"))
-                    ok = False
-        else: ok = False
-    return ok
+        if args.close_mode!="taker": return False
+    try:
+        ORDERS.submit(FAPI, args.symbol, "BUY", qty, f_px, fg,
+                      lambda q, cid: fut_limit_ioc(args.symbol,"BUY",q,f_px,fg,True,cid), "close", taker=True)
+        return "ioc"
+    except Exception as e2:
+        logging.warning(cwarn(f"fut IOC fail: {e2}"))
+    try:
+        ORDERS.submit(FAPI, args.symbol, "BUY", qty, f_px, fg,
+                      lambda q, cid: fut_market_close(args.symbol,q,"BUY",fg,cid), "close", taker=True)
+        return "market"
+    except Exception as e3:
+        logging.error(cbad(f"fut market fail: {e3}"))
+        return False
+
+def close_pair_maker_first(args, qty, sg, fg, qg):
+    """→ False หรือ {"s_px","f_px" (tick), "spot","fut" (maker/ioc/market)} เมื่อปิดได้ทั้งสองขา"""
+    if qty<=0: return False
+    (sbids,sasks), (fbids,fasks), _ = run_legs(lambda: depth(SAPI,args.symbol,2),
+                                               lambda: depth(FAPI,args.symbol,2))
+    if not (sbids and sasks and fbids and fasks): return False
+    s_px = s_ask(sasks)  # SELL spot maker
+    f_px = f_bid(fbids)  # BUY fut maker (reduceOnly)
+    qs, qf = sg.steps_from(qg, qty), fg.steps_from(qg, qty)
+
+    with pair_lock(args.symbol):
+        # open/hedge ฝั่งเปิดที่ยังค้างอาจถูกเติมหลังปิด (เหลือขาเดียวระหว่าง cooldown) → ยกเลิกก่อนวางขาปิด
+        # hedge ฝั่งปิดที่ค้างอยู่ = ส่วนที่ขาปิดไม่ต้องวางซ้ำ
+        for b, side in ((SAPI, "BUY"), (FAPI, "SELL")):
+            for o in ORDERS.working(b, args.symbol, side):
+                if o["tag"] in ("open", "hedge"): ORDERS.cancel(o)
+        qs = max(qs - ORDERS.working_qty(SAPI, args.symbol, "SELL", "hedge"), 0)
+        qf = max(qf - ORDERS.working_qty(FAPI, args.symbol, "BUY", "hedge"), 0)
+        return _close_legs(args, qs, qf, s_px, f_px, sg, fg)
+
+def _close_legs(args, qs, qf, s_px, f_px, sg, fg):
+    # Spot close / Futures close (reduceOnly) — แต่ละขาไล่ GTX→IOC→MARKET เอง
+    ok_s, ok_f, _ = run_legs(lambda: _close_spot_leg(args, qs, s_px, sg),
+                             lambda: _close_fut_leg(args, qf, f_px, fg), "CLOSE")
+    return ok_s and ok_f and {"s_px": s_px, "f_px": f_px, "spot": ok_s, "fut": ok_f}
+
+def trip_realized(args, led, s_px, f_px):
+    """กำไรจริงของรอบจาก ledger ของ fill (ราคาเติมจริง) − ค่าธรรมเนียมตาม bps maker/taker ของแต่ละ fill
+    + ยอดที่ยังไม่กลับเป็นศูนย์ (เศษ/ขาที่ปิดไม่ครบ) ตีมูลค่าที่ราคาปิด s_px/f_px (float)"""
+    bps = {"spot_maker": args.maker_spot_bps, "spot_taker": args.taker_spot_bps,
+           "fut_maker": args.maker_fut_bps, "fut_taker": args.taker_fut_bps}
+    fee = sum(v*bps[k]/1e4 for k, v in led["vol"].items())
+    return led["cash"] - fee + led["spot"]*s_px + led["fut"]*f_px
 
 # ---------- main loop ----------
-def run(args):
-    logging.info(cinfo(f"Start Maker v15 | {args.symbol} | asset={args.asset}"))
-    if not API_KEY or not API_SECRET:
-        raise RuntimeError("ต้องตั้ง ENV ASTERDEX_API_KEY / ASTERDEX_API_SECRET ก่อน")
-
-    set_isolated_and_leverage(args.symbol, args.isolated, args.leverage)
-
-    s_info = exinfo_spot(args.symbol)
-    f_info = exinfo_fut(args.symbol)
-    s_tick,s_step,s_minq,s_min_notional = get_tick_lot_notional(s_info)
-    f_tick,f_step,f_minq,f_min_notional = get_tick_lot_notional(f_info)
-
-    logging.info(cinfo(f"Spot filters  : tick={s_tick} step={s_step} minQty={s_minq} minNotional={s_min_notional}"))
-    logging.info(cinfo(f"Futures filter: tick={f_tick} step={f_step} minQty={f_minq} minNotional={f_min_notional}"))
-
-    confirm_hits = 0
-    state = None
-
-    while True:
-        try:
-            qty, s_px_open, f_px_open, open_basis = attach_or_open_pair(
-                args, s_step,f_step, s_tick,f_tick, s_min_notional,f_min_notional
-            )
-            if qty<=0:
-                logging.info("Waiting for pair to be ready…")
-                time.sleep(args.poll); continue
-
-            if state is None:
-                state = {"qty": qty, "open_basis": open_basis, "t0": time.time()}
-
+class PairBot:
+    """หนึ่งคู่ Spot/Futures: state ของรอบ + step() = หนึ่งรอบตัดสินใจ คืนวินาทีที่ควรรอก่อนรอบถัดไป"""
+    def __init__(self, args, tag=""):
+        self.args = args
+        self.tag = tag
+        self.state = None
+        self.confirm_hits = 0
+        self.hit_since = None
+        self.interruptible = True  # False = กำลัง cooldown ห้ามปลุกด้วย event ราคา
+        self.verify = False        # True = state มาจาก checkpoint/ก่อน error → ต้องตรงกับ qty จริงก่อนใช้ต่อ
+        self.first = True
+        self.trip = None           # รอบที่ปิดแล้ว รอออเดอร์ปิดจบเพื่อคิดกำไรจริง (ดู _settle)
+
+    def setup(self):
+        a = self.args
+        if CHECKPOINT is not None and CHECKPOINT.margin_ok(a.symbol, a.isolated, a.leverage):
+            logging.info(cinfo(f"{self.tag}margin/leverage ตั้งไว้แล้วตาม checkpoint → ข้าม"))
+        elif set_isolated_and_leverage(a.symbol, a.isolated, a.leverage) and CHECKPOINT is not None:
+            CHECKPOINT.set_margin(a.symbol, a.isolated, a.leverage)
+        sf, ff = FILTERS.get(SAPI, a.symbol), FILTERS.get(FAPI, a.symbol)
+        self.sg, self.fg = sf.grid, ff.grid
+        self.qg = Grid(sf.tick, min(sf.step, ff.step))  # กริดจำนวนของคู่ = step ที่ละเอียดกว่า
+        logging.info(cinfo(f"{self.tag}Spot filters  : tick={sf.tick} step={sf.step} minQty={sf.minq} minNotional={sf.min_notional}"))
+        logging.info(cinfo(f"{self.tag}Futures filter: tick={ff.tick} step={ff.step} minQty={ff.minq} minNotional={ff.min_notional}"))
+        if CHECKPOINT is not None: self._restore()
+
+    def _restore(self):
+        """state จาก checkpoint (open_basis/t0 เดิม) + reconcile ออเดอร์ค้างของคู่นี้กับ REST ทันที"""
+        a, row = self.args, CHECKPOINT.pairs.get(self.args.symbol)
+        if row:
+            self.state = {"qty": self.qg.qty(row["qty"]), "open_basis": float(row["open_basis"]), "t0": float(row["t0"])}
+            self.verify = True
+            logging.info(cinfo(f"{self.tag}resume: qty={row['qty']} open≈{self.state['open_basis']:.4f} "
+                               f"held={time.time() - self.state['t0']:.0f}s"))
+        if ORDERS is not None and ORDERS.working(SAPI, a.symbol) + ORDERS.working(FAPI, a.symbol):
+            ORDERS.refresh(SAPI, a.symbol, self.sg)
+            ORDERS.refresh(FAPI, a.symbol, self.fg)
+
+    def checkpoint(self):
+        st = self.state
+        CHECKPOINT.set_pair(self.args.symbol, None if st is None else
+                            {"qty": self.qg.fmt_qty(st["qty"]), "open_basis": st["open_basis"], "t0": st["t0"]})
+        CHECKPOINT.save()
+
+    def _settle(self):
+        """รอบที่ปิดแล้วและออเดอร์ปิดจบหมด → กำไรจริงจาก fill (ledger) เทียบกับที่ประมาณตอนปิด
+        ต้องทำก่อน attach วางขาเปิดรอบใหม่ (fill ของรอบใหม่ต้องไม่ปนใน ledger ของรอบนี้)"""
+        a, trip = self.args, self.trip
+        for b, g in ((SAPI, self.sg), (FAPI, self.fg)):
+            if ORDERS.working(b, a.symbol, tag="close"): ORDERS.ensure_synced(b, a.symbol, g)
+        if ORDERS.working(SAPI, a.symbol, tag="close") or ORDERS.working(FAPI, a.symbol, tag="close"): return
+        self.trip = None
+        led = ORDERS.ledger_take(a.symbol)
+        q = self.qg.q(trip["qty"])
+        if led is None or min(led["spot_in"], led["fut_in"]) < q*0.99:
+            # ขาเปิดไม่ได้เติมในโปรเซสนี้ (แนบโพสิชันเดิม/รีสตาร์ท) → ไม่รู้ต้นทุนจริง
+            jot("trip", symbol=a.symbol, qty=self.qg.fmt_qty(trip["qty"]), est=round(trip["est"], 6), realized=None)
+            return
+        real = trip_realized(a, led, trip["s_px"], trip["f_px"])
+        logging.info(cinfo(f"{self.tag}trip realized={real:.4f} (est≈{trip['est']:.4f})"))
+        jot("trip", symbol=a.symbol, qty=self.qg.fmt_qty(trip["qty"]), est=round(trip["est"], 6), realized=round(real, 6),
+            cash=round(led["cash"], 6), vol={k: round(v, 6) for k, v in led["vol"].items()},
+            left_spot=round(led["spot"], 10), left_fut=round(led["fut"], 10), unpriced=led["unpriced"])
+        if METRICS is not None: METRICS.trip(a.symbol, "realized", real)
+
+    def step(self):
+        args = self.args
+        sg, fg, qg = self.sg, self.fg, self.qg
+        if METRICS is not None:
+            _DECISION.symbol = args.symbol
+            _DECISION.t0 = TICK_AT.pop(args.symbol, None) or time.perf_counter()
+        if self.trip is not None: self._settle()
+        qty, s_px_open, f_px_open, open_basis = attach_or_open_pair(args, sg, fg, qg)
+        self.interruptible = True
+        if self.verify:
+            if self.state is not None and self.state["qty"] != qty:
+                logging.info(cwarn(f"{self.tag}saved state qty={qg.fmt_qty(self.state['qty'])} ≠ actual {qg.fmt_qty(qty)} → new state"))
+                self.state = None
+            self.verify = False
+        if qty<=0:
+            logging.info(f"{self.tag}Waiting for pair to be ready…")
+            return args.poll
+
+        if self.state is None:
+            self.state = {"qty": qty, "open_basis": open_basis, "t0": time.time()}
+            jot("ready", symbol=args.symbol, qty=qg.fmt_qty(qty), open_basis=round(open_basis, 6),
+                s_px=sg.fmt_px(s_px_open) if s_px_open else None, f_px=fg.fmt_px(f_px_open) if f_px_open else None)
+
+        net_if_open  = self.state["open_basis"]
+        books, net_if_close, max_q = None, None, None
+        if args.close_model == "depth":
+            # ราคาที่ขาปิดจะได้จริง = VWAP ตามเด็ปธ์ฝั่ง taker (ไม่ใช่ last/mark + slippage คงที่)
+            books = close_books(args)
+            (sbids,_), (_,fasks) = books
+            s_last, f_mark = s_bid(sbids), fg.p(f_ask(fasks))
+            net_if_close = close_net_curve(args, [qty], books, sg, fg, qg)[0]
+            max_q = max_close_qty(args, qty, net_if_open, books, sg, fg, qg)
+        else:
             s_last = spot_last(args.symbol)
             f_mark = mark_price(args.symbol)
-
-            net_if_open  = state["open_basis"]
-            net_if_close = est_close_gain_minus_fee_slip(qty, s_last, f_mark,
+        if net_if_close is None:  # flat หรือเด็ปธ์ไม่พอ (guard จะไม่ให้ปิดอยู่แล้ว) → ประมาณแบบ slippage คงที่
+            net_if_close = est_close_gain_minus_fee_slip(qg.q(qty), sg.p(s_last), f_mark,
                                                          args.taker_spot_bps, args.taker_fut_bps, args.slippage_bps)
-            net_total = net_if_open + net_if_close
-
-            line = (f"[{now_utc_str()}] Net≈{net_total:.4f} "
-                    f"(open≈{net_if_open:.4f} + close≈{net_if_close:.4f}) | "
-                    f"S={_fmt(s_last,s_tick)} F={_fmt(f_mark,f_tick)} | qty={_fmt(qty,min(s_step,f_step))} "
-                    f"| target={D(args.target_profit):.4f}")
-            print((cgood(line) if net_total>=0 else cbad(line)))
-
-            # close guards & confirm
-            if net_total >= D(args.target_profit) and guards_ok_for_close(args, qty, s_step,f_step, s_tick,f_tick):
-                confirm_hits += 1
-            else:
-                confirm_hits = 0
-
-            hold_ok = (time.time() - state["t0"]) <= args.max_hold_sec if args.max_hold_sec>0 else True
-
-            if (confirm_hits >= args.confirm_hits) or (not hold_ok):
-                logging.info(cinfo("Hit target (confirmed) or max-hold → closing…"))
-                ok = close_pair_maker_first(args, qty, s_step,f_step, s_tick,f_tick)
-                if ok:
-                    logging.info(cgood("Closed. Reopen…"))
-                    state = None
-                    if not args.always_reopen:
-                        time.sleep(args.cooldown_sec)
-                else:
-                    logging.warning(cwarn("Close failed (partial?) → reset & cooldown"))
-                    state = None
-                    time.sleep(args.cooldown_sec)
-            else:
-                time.sleep(args.poll)
+        net_total = net_if_open + net_if_close
+
+        line = (f"[{now_utc_str()}] {self.tag}Net≈{net_total:.4f} "
+                f"(open≈{net_if_open:.4f} + close≈{net_if_close:.4f}) | "
+                f"S={sg.fmt_px(s_last)} F={fg.fmt_px(fg.px(f_mark))} | qty={qg.fmt_qty(qty)} "
+                + (f"maxQ={qg.fmt_qty(max_q)} " if max_q is not None else "")
+                + f"| target={args.target_profit:.4f}")
+        print((cgood(line) if net_total>=0 else cbad(line)))
+        if METRICS is not None: METRICS.set("aster_net_estimate", round(net_total, 6), symbol=args.symbol)
+        logging.debug(cinfo(f"http reused/requests: {HTTP.stats_line()}"))
+
+        # close guards & confirm (confirm-ms>0: ต้องถึงเป้าต่อเนื่องตามเวลา แทนการนับรอบ)
+        hit = net_total >= args.target_profit and guards_ok_for_close(args, qty, sg, fg, qg, books)
+        now = time.time()
+        if args.confirm_ms > 0:
+            self.hit_since = (self.hit_since or now) if hit else None
+            confirmed = hit and (now - self.hit_since)*1000 >= args.confirm_ms
+        else:
+            self.confirm_hits = self.confirm_hits + 1 if hit else 0
+            confirmed = self.confirm_hits >= args.confirm_hits
+
+        hold_ok = (now - self.state["t0"]) <= args.max_hold_sec if args.max_hold_sec>0 else True
+        jot("decision", symbol=args.symbol, net=round(net_total, 6), open=round(net_if_open, 6),
+            close=round(net_if_close, 6), s=sg.fmt_px(s_last), f=f_mark, qty=qg.fmt_qty(qty),
+            target=args.target_profit, hit=hit, confirmed=confirmed, hold_ok=hold_ok,
+            max_qty=qg.fmt_qty(max_q) if max_q is not None else None)
+
+        if confirmed or (not hold_ok):
+            logging.info(cinfo(f"{self.tag}Hit target (confirmed) or max-hold → closing…"))
+            ok = close_pair_maker_first(args, qty, sg, fg, qg)
+            held = now - self.state["t0"]
+            self.state = None
+            self.confirm_hits = 0
+            self.hit_since = None
+            if ok:
+                logging.info(cgood(f"{self.tag}Closed. Reopen…"))
+                self.trip = {"qty": qty, "est": net_total, "s_px": sg.p(ok["s_px"]), "f_px": fg.p(ok["f_px"])}
+                jot("close", symbol=args.symbol, ok=True, reason="target" if confirmed else "max_hold",
+                    qty=qg.fmt_qty(qty), est=round(net_total, 6), held_sec=round(held, 1),
+                    s_px=sg.fmt_px(ok["s_px"]), f_px=fg.fmt_px(ok["f_px"]), spot=ok["spot"], fut=ok["fut"])
+                if METRICS is not None:
+                    METRICS.inc("aster_trips_total", symbol=args.symbol, spot=ok["spot"], fut=ok["fut"])
+                    METRICS.trip(args.symbol, "estimated", net_total)
+                self.interruptible = args.always_reopen
+                return 0 if args.always_reopen else args.cooldown_sec
+            jot("close", symbol=args.symbol, ok=False, reason="target" if confirmed else "max_hold",
+                qty=qg.fmt_qty(qty), est=round(net_total, 6), held_sec=round(held, 1))
+            logging.warning(cwarn(f"{self.tag}Close failed (partial?) → reset & cooldown"))
+            self.interruptible = False
+            return args.cooldown_sec
+        # ตื่นมาประเมินอีกครั้งตอนครบเวลายืนยัน/ครบ max-hold แม้ราคาไม่ขยับ
+        wait = args.poll
+        if self.hit_since is not None: wait = min(wait, self.hit_since + args.confirm_ms/1000 - now)
+        if args.max_hold_sec > 0: wait = min(wait, self.state["t0"] + args.max_hold_sec - now)
+        return max(wait, 0.0)
+
+    def safe_step(self):
+        t0 = time.perf_counter()
+        if BATCHER is not None: BATCHER.begin()
+        try:
+            return self.step()
+        except Exception as e:
+            logging.error(cbad(f"{self.tag}Loop error: {e}"))
+            jot("error", symbol=self.args.symbol, error=str(e))
+            if METRICS is not None: METRICS.inc("aster_loop_errors_total", symbol=self.args.symbol)
+            self.verify = True  # คง open_basis/t0 ไว้ ถ้าคู่ยังเท่าเดิมในรอบหน้า
+            self.confirm_hits = 0
+            self.hit_since = None
+            self.interruptible = False
+            return self.args.cooldown_sec
+        finally:
+            if BATCHER is not None: BATCHER.end()
+            if METRICS is not None: METRICS.observe("aster_loop_ms", (time.perf_counter()-t0)*1000, symbol=self.args.symbol)
+            if CHECKPOINT is not None: self.checkpoint()
+            if self.first:
+                self.first = False
+                logging.info(cinfo(f"{self.tag}first decision {(time.perf_counter()-T_START)*1000:.0f}ms after start"))
+
+def _start_shared(args, symbols, trading=True):
+    logging.info(cinfo(f"Start Maker v15 | {','.join(symbols)}"))
+    if trading and (not API_KEY or not API_SECRET):
+        raise RuntimeError("ต้องตั้ง ENV ASTERDEX_API_KEY / ASTERDEX_API_SECRET ก่อน")
+    configure_endpoints(args)
+    configure_metrics(args)
+    configure_journal(args)
+    configure_http(args)
+    configure_limits(args)
+    configure_parallel(args)
+    configure_batch(args)
+    configure_filters(args)
+    start_market_data(args, symbols)
+    start_tickers(args, symbols)
+    if trading:
+        start_order_manager(args)
+        start_checkpoint(args, symbols)
+        start_account_stream(args)
+        start_hedger(args)
+    if args.event:
+        if MD is None: raise RuntimeError("--event ต้องใช้คู่กับ --ws")
+        if ACCOUNT is None:
+            logging.warning(cwarn("--event โดยไม่มี --user-stream: ทุก event จะดึงยอดผ่าน REST (weight สูง)"))
+        if args.confirm_ms <= 0:
+            args.confirm_ms = 1000
+            logging.info(cinfo("--event: ใช้ confirm-ms=1000 แทน confirm-hits"))
 
+def run(args):
+    if args.record:
+        return run_recorder(args)
+    if args.pairs:
+        return run_portfolio(args)
+    _start_shared(args, [args.symbol])
+    logging.info(cinfo(f"asset={args.asset}"))
+    bot = PairBot(args)
+    bot.setup()
+    while True:
+        try:
+            wait = bot.safe_step()
+            if not (args.event and bot.interruptible):
+                time.sleep(wait)
+                continue
+            # event-driven: ตื่นเมื่อราคาเปลี่ยน (หรือครบ wait = idle fallback) แล้วรอ debounce ให้ event ชุดเดียวกันรวมกัน
+            deadline = time.time() + wait
+            while time.time() < deadline:
+                if args.symbol in take_changes(deadline - time.time()):
+                    if args.debounce_ms > 0: time.sleep(args.debounce_ms/1000.0)
+                    take_changes(0)
+                    break
         except KeyboardInterrupt:
             logging.warning(cwarn("User stop"))
             break
-        except Exception as e:
-            logging.error(cbad(f"Loop error: {e}"))
-            state = None
-            time.sleep(args.cooldown_sec)
-            continue
+    if JOURNAL is not None: JOURNAL.close()
+
+# ---------- portfolio (หลายคู่ในโปรเซสเดียว) ----------
+def parse_pairs(spec, args):
+    """"SYM[:ASSET[:CAPITAL[:TARGET]]],..." → [Namespace ต่อคู่] (ค่าที่ไม่ระบุใช้จาก args)"""
+    out = []
+    for item in filter(None, (x.strip() for x in spec.split(","))):
+        f = item.split(":")
+        sym = f[0].upper()
+        a = argparse.Namespace(**vars(args))
+        a.symbol = sym
+        a.asset = (f[1] if len(f)>1 and f[1] else sym[:-4] if sym.endswith("USDT") else sym).upper()
+        if len(f)>2 and f[2]: a.capital = float(f[2])
+        if len(f)>3 and f[3]: a.target_profit = float(f[3])
+        out.append(a)
+    if not out: raise RuntimeError("--pairs ว่าง")
+    return out
+
+def allocate_usdt(pairs, budget):
+    """ถ้าทุนรวมที่ขอ > budget → ลดทุนทุกคู่ตามสัดส่วน"""
+    want = sum(a.capital for a in pairs)
+    scale = min(1.0, budget/want) if want>0 and budget>0 else 1.0
+    for a in pairs:
+        a.capital = a.capital*scale
+        logging.info(cinfo(f"alloc {a.symbol}: {a.capital:.2f} USDT"))
+    return scale
+
+def portfolio_budget(pairs):
+    """USDT free + มูลค่า asset ที่ถืออยู่ (ราคา last) จาก /account ครั้งเดียว"""
+    d = spot_account()
+    total = float(_asset_row(d, "USDT").get("free","0"))
+    for a in pairs:
+        b = _asset_row(d, a.asset)
+        qty = float(b.get("free","0")) + float(b.get("locked","0"))
+        if qty > 0: total += qty*FILTERS.get(SAPI, a.symbol).grid.p(spot_last(a.symbol))
+    return total
+
+def run_portfolio(args):
+    global SNAPSHOT_TTL
+    pairs = parse_pairs(args.pairs, args)
+    _start_shared(args, [a.symbol for a in pairs])
+    SNAPSHOT_TTL = args.snapshot_ttl
+    budget = args.portfolio_capital or portfolio_budget(pairs)
+    allocate_usdt(pairs, budget)
+    bots = [PairBot(a, f"{a.symbol} ") for a in pairs]
+    for b in bots: b.setup()
+
+    # scheduler: heap ของเวลาครบกำหนดแต่ละคู่ → ส่งเข้า worker pool
+    # (--event: คู่ที่ราคาเปลี่ยนถูกเลื่อนมาทำหลัง debounce; heap ใช้ lazy delete ผ่าน due[i])
+    by_symbol = {a.symbol: i for i, a in enumerate(pairs)}
+    due = [time.time()]*len(bots)
+    heap = [(t, i) for i, t in enumerate(due)]
+    heapq.heapify(heap)
+    running, finished = set(), []
+    def on_done(i, f):
+        with WAKE:
+            finished.append((i, f))
+            WAKE.notify_all()
+    with ThreadPoolExecutor(max_workers=max(1, min(args.workers, len(bots))), thread_name_prefix="pair") as ex:
+        try:
+            while True:
+                now = time.time()
+                while heap and heap[0][0] <= now:
+                    t, i = heapq.heappop(heap)
+                    if t != due[i] or i in running: continue
+                    running.add(i)
+                    ex.submit(bots[i].safe_step).add_done_callback(lambda f, i=i: on_done(i, f))
+                with WAKE:
+                    if not finished and not (args.event and CHANGED):
+                        WAKE.wait(max(0.0, heap[0][0] - time.time()) if heap else None)
+                    done, finished[:] = list(finished), []
+                    changed = set(CHANGED) if args.event else set()
+                    if args.event: CHANGED.clear()
+                now = time.time()
+                for i, f in done:
+                    running.discard(i)
+                    due[i] = now + f.result()
+                    heapq.heappush(heap, (due[i], i))
+                for sym in changed:
+                    i = by_symbol.get(sym)
+                    if i is None or i in running or not bots[i].interruptible: continue
+                    t = now + args.debounce_ms/1000.0
+                    if t < due[i]:
+                        due[i] = t
+                        heapq.heappush(heap, (t, i))
+        except KeyboardInterrupt:
+            logging.warning(cwarn("User stop"))
+    if JOURNAL is not None: JOURNAL.close()
+
+# ---------- market-data recorder ----------
+REC_MAGIC = b"AMR1"
+REC_COLUMNS = ("ts","s_bid","s_ask","s_ask_q2","f_bid","f_ask","f_bid_q2","s_last","mark")
+
+class Recorder:
+    """top-of-book Spot/Futures + last/mark → ไฟล์ columnar: header JSON แล้วตามด้วย chunk
+    (uint32 จำนวนแถว + แต่ละคอลัมน์เป็น float64 little-endian ต่อกัน)
+    เขียน chunk เมื่อครบ chunk แถว หรือครบ flush_sec วินาที (โปรเซสตายกลางคันเสียไม่เกินช่วงนั้น)"""
+    def __init__(self, path, meta, chunk=4096, flush_sec=5.0):
+        self.fh = open(path, "ab")
+        if self.fh.tell() == 0:
+            hdr = json.dumps({"columns": REC_COLUMNS, **meta}).encode()
+            self.fh.write(REC_MAGIC + struct.pack("<I", len(hdr)) + hdr)
+            self.fh.flush()
+        self.chunk = chunk
+        self.flush_sec = flush_sec
+        self.rows = 0
+        self._flushed = time.monotonic()
+        self._new_cols()
+
+    def _new_cols(self):
+        self.cols = [array("d") for _ in REC_COLUMNS]
+
+    def add(self, row):
+        for c, v in zip(self.cols, row): c.append(v)
+        if len(self.cols[0]) >= self.chunk or time.monotonic() - self._flushed >= self.flush_sec: self.flush()
+
+    def flush(self):
+        self._flushed = time.monotonic()
+        n = len(self.cols[0])
+        if n == 0: return
+        self.fh.write(struct.pack("<I", n))
+        for c in self.cols:
+            if sys.byteorder == "big": c.byteswap()
+            self.fh.write(c.tobytes())
+        self.fh.flush()
+        self.rows += n
+        self._new_cols()
+
+    def close(self):
+        self.flush()
+        self.fh.close()
+
+def read_recording(path):
+    """→ (meta, {column: array('d')}) รวมทุก chunk"""
+    with open(path, "rb") as fh:
+        buf = fh.read()
+    if buf[:4] != REC_MAGIC: raise RuntimeError(f"not a recording: {path}")
+    hlen = struct.unpack_from("<I", buf, 4)[0]
+    meta = json.loads(buf[8:8+hlen])
+    cols = {c: array("d") for c in meta["columns"]}
+    off = 8 + hlen
+    while off + 4 <= len(buf):
+        n = struct.unpack_from("<I", buf, off)[0]
+        off += 4
+        if off + 8*n*len(cols) > len(buf): break  # chunk สุดท้ายเขียนไม่จบ
+        for c in meta["columns"]:
+            cols[c].frombytes(buf[off:off+8*n])
+            off += 8*n
+    if sys.byteorder == "big":
+        for a in cols.values(): a.byteswap()
+    return meta, cols
+
+def _top_row(symbol):
+    (sbids,sasks), (fbids,fasks), _ = run_legs(lambda: depth(SAPI,symbol,5), lambda: depth(FAPI,symbol,5))
+    if not (sbids and sasks and fbids and fasks): return None
+    sg, fg = FILTERS.get(SAPI, symbol).grid, FILTERS.get(FAPI, symbol).grid
+    return (time.time(), sg.p(s_bid(sbids)), sg.p(s_ask(sasks)), sg.q(sum(n for _,n in sasks[:2])),
+            fg.p(f_bid(fbids)), fg.p(f_ask(fasks)), fg.q(sum(n for _,n in fbids[:2])),
+            sg.p(spot_last(symbol)), float(mark_price(symbol)))
+
+def run_recorder(args):
+    symbols = [a.symbol for a in parse_pairs(args.pairs, args)] if args.pairs else [args.symbol]
+    _start_shared(args, symbols, trading=False)
+    os.makedirs(args.record, exist_ok=True)
+    recs = {}
+    for sym in symbols:
+        sf, ff = FILTERS.get(SAPI, sym), FILTERS.get(FAPI, sym)
+        meta = {"symbol": sym, "s_tick": str(sf.tick), "s_step": str(sf.step), "s_min_notional": str(sf.min_notional),
+                "f_tick": str(ff.tick), "f_step": str(ff.step), "f_min_notional": str(ff.min_notional)}
+        recs[sym] = Recorder(os.path.join(args.record, f"{sym}.amr"), meta, flush_sec=args.record_flush_sec)
+    logging.info(cinfo(f"recording {','.join(symbols)} → {args.record} every {args.record_ms}ms"))
+    period = args.record_ms/1000.0
+    try:
+        while True:
+            t0 = time.time()
+            for sym, rec in recs.items():
+                try:
+                    row = _top_row(sym)
+                    if row: rec.add(row)
+                except Exception as e:
+                    logging.warning(cwarn(f"record {sym} fail: {e}"))
+            time.sleep(max(0.0, period - (time.time()-t0)))
+    except KeyboardInterrupt:
+        logging.warning(cwarn("User stop"))
+    finally:
+        for rec in recs.values(): rec.close()
+        logging.info(cinfo("recorded rows: " + " ".join(f"{k}={r.rows}" for k,r in recs.items())))
 
 # ---------- argparse ----------
-def parse_args():
+def build_parser():
     ap = argparse.ArgumentParser(description="AsterDex Maker v15 (roll with net profit)")
     ap.add_argument("--symbol", default="ASTERUSDT")
     ap.add_argument("--asset",  default="ASTER")
     ap.add_argument("--capital", type=float, default=300.0, help="USDT ต่อรอบ")
     ap.add_argument("--whole-qty", action="store_true", help="ปัดจำนวนให้เป็นเลขจำนวนเต็ม (เช่น ไม่เอาเศษทศนิยม)")
 
+    # portfolio: หลายคู่ในโปรเซสเดียว (แชร์ HTTP pool / account snapshot / market data)
+    ap.add_argument("--pairs", default="",
+                    help="SYM[:ASSET[:CAPITAL[:TARGET]]] คั่นด้วย , เช่น ASTERUSDT:ASTER:120:1,BNBUSDT::200")
+    ap.add_argument("--portfolio-capital", type=float, default=0.0,
+                    help="USDT รวมที่แบ่งให้ทุกคู่ (0 = USDT free + มูลค่า asset ที่ถืออยู่)")
+    ap.add_argument("--workers", type=int, default=4, help="จำนวน worker ที่รันคู่พร้อมกัน")
+    ap.add_argument("--snapshot-ttl", type=float, default=1.0,
+                    help="วินาทีที่แชร์ผล /account และ positionRisk ระหว่างคู่ (portfolio เท่านั้น)")
+
     # maker/taker fees & slippage bps
     ap.add_argument("--maker-spot-bps", type=float, default=0.0)
     ap.add_argument("--maker-fut-bps",  type=float, default=0.0)
     ap.add_argument("--taker-spot-bps", type=float, default=5.0)
     ap.add_argument("--taker-fut-bps",  type=float, default=5.0)
-    ap.add_argument("--slippage-bps",   type=float, default=3.0)
+    ap.add_argument("--slippage-bps",   type=float, default=3.0, help="ใช้กับ --close-model flat (และเมื่อเด็ปธ์ไม่พอ)")
 
     # open behavior
     ap.add_argument("--depth-limit", type=int, default=5)
@@ -504,7 +2797,11 @@ def parse_args():
     ap.add_argument("--max-close-spread-bps", type=float, default=20.0,
                     help="สเปรด (Spot ask - Fut bid)/mid เป็น bps สูงสุดที่ยอมให้ปิด")
     ap.add_argument("--min-close-depth-mult", type=float, default=1.2,
-                    help="เด็ปธ์รวมระดับ 2 ชั้น ≥ qty*mult ทั้งสองฝั่ง ก่อนปิด")
+                    help="เด็ปธ์ของแต่ละขาปิด ≥ qty*mult ก่อนปิด (flat: 2 ชั้น Spot ask/Fut bid; "
+                         "depth: ทุกชั้นที่ดึงมา (--close-depth) ฝั่ง taker Spot bid/Fut ask)")
+    ap.add_argument("--close-model", choices=["depth","flat"], default="depth",
+                    help="ประมาณขาปิด: depth = VWAP กินเด็ปธ์จริงทั้งสองขา, flat = last/mark + --slippage-bps คงที่")
+    ap.add_argument("--close-depth", type=int, default=50, help="จำนวนระดับเด็ปธ์ที่ใช้ประเมินขาปิด (--close-model depth)")
     ap.add_argument("--close-mode", choices=["maker","taker"], default="taker",
                     help="ปิดแบบ maker-first แล้ว fallback เป็น taker หรือไม่ (แนะนำ taker)")
 
@@ -517,13 +2814,96 @@ def parse_args():
     ap.add_argument("--cooldown-sec", type=int, default=2)
     ap.add_argument("--always-reopen", action="store_true",
                     help="ปิดแล้วเปิดใหม่ทันทีโดยไม่รอ cooldown")
+    ap.add_argument("--event", action="store_true",
+                    help="ประเมินใหม่ทันทีเมื่อราคาดีสุด/last/mark เปลี่ยน (ต้องใช้ --ws); --poll กลายเป็น idle fallback")
+    ap.add_argument("--debounce-ms", type=int, default=50, help="รวม event ที่มาติดกันก่อนประเมิน (ms)")
+    ap.add_argument("--confirm-ms", type=int, default=0,
+                    help="ยืนยันกำไรแบบเวลา: ต้องถึงเป้าต่อเนื่องกี่ ms (0 = ใช้ --confirm-hits; --event ค่าเริ่มต้น 1000)")
+
+    # recorder (สำหรับ aster-replay.py)
+    ap.add_argument("--record", default="", help="โฟลเดอร์บันทึก market data (<SYMBOL>.amr) — โหมดบันทึกอย่างเดียว ไม่เทรด")
+    ap.add_argument("--record-ms", type=int, default=250, help="ระยะห่างการบันทึกแต่ละแถว (ms)")
+    ap.add_argument("--record-flush-sec", type=float, default=5.0, help="เขียนแถวที่บันทึกลงไฟล์อย่างน้อยทุกกี่วินาที")
+
+    # http
+    ap.add_argument("--http-pool", type=int, default=4, help="จำนวน connection ใน pool ต่อ host")
+    ap.add_argument("--http-retries", type=int, default=2, help="retry ตอน connect ไม่ติด (ไม่ยิงซ้ำหลังส่งแล้ว)")
+    ap.add_argument("--no-keepalive", action="store_true", help="ปิด keep-alive (เปิด connection ใหม่ทุกคำขอ)")
+
+    # endpoints (ค่าเริ่มต้นจาก ENV ASTERDEX_SAPI/ASTERDEX_FAPI หรือของจริง)
+    ap.add_argument("--sapi", default=SAPI, help="Spot REST base URL")
+    ap.add_argument("--fapi", default=FAPI, help="Futures REST base URL")
+
+    # streaming market data
+    ap.add_argument("--ws", action="store_true", help="ใช้ websocket order book แทนการ poll REST depth")
+    ap.add_argument("--ticker-ttl", type=float, default=1.0,
+                    help="วินาทีที่ใช้ตาราง last/mark ของทุกคู่ (ดึงแบบไม่ระบุ symbol ครั้งเดียวต่อ venue) ก่อนดึงใหม่ "
+                         "— ใช้เมื่อดูหลายคู่เท่านั้น (0 = ถามราย symbol เสมอ)")
+    ap.add_argument("--ws-snapshot-limit", type=int, default=100, help="จำนวนระดับของ REST snapshot ตอน resync")
+    ap.add_argument("--spot-ws", default=SPOT_WS)
+    ap.add_argument("--fut-ws",  default=FUT_WS)
+
+    ap.add_argument("--user-stream", action="store_true",
+                    help="ติดตามยอด/โพสิชัน/fill ผ่าน listenKey user data stream แทนการ poll REST")
+
+    # fill-triggered hedging
+    ap.add_argument("--hedge", action="store_true",
+                    help="ขาหนึ่งถูกเติม → ตามอีกขาทันที (maker ที่ touch แล้ว IOC) แทนการรอรอบ --poll (ควรใช้กับ --user-stream)")
+    ap.add_argument("--hedge-chase-ms", type=int, default=100, help="ไล่ราคา hedge ตาม touch ทุกกี่ ms")
+    ap.add_argument("--hedge-ioc-ms", type=int, default=1500, help="เสีย balance นานเกินนี้ (ms) → IOC ส่วนที่เหลือ")
+
+    # checkpoint / warm restart
+    ap.add_argument("--state-file", default="",
+                    help="checkpoint state คู่/margin/ออเดอร์ค้าง เพื่อเริ่มต่อหลังรีสตาร์ท เช่น .aster-state-ASTERUSDT.json "
+                         "(ไฟล์ละโปรเซส; '' = ไม่ใช้ ค่าเริ่มต้น)")
+
+    # exchangeInfo cache
+    ap.add_argument("--filters-cache", default=".aster-filters.json",
+                    help="ไฟล์ cache ของ exchangeInfo ('' = ไม่เขียนไฟล์)")
+    ap.add_argument("--filters-ttl", type=int, default=3600, help="อายุ cache (วินาที) ก่อน refresh เบื้องหลัง")
+
+    # rate limit (ต่อ venue)
+    ap.add_argument("--weight-limit", type=int, default=1200, help="request weight สูงสุดต่อนาที")
+    ap.add_argument("--order-limit", type=int, default=50, help="จำนวนออเดอร์สูงสุดต่อ 10 วินาที")
+    ap.add_argument("--md-reserve", type=float, default=0.2,
+                    help="สัดส่วน weight ที่กันไว้ให้ order/cancel (market data ใช้ไม่ได้)")
+
+    # execution
+    ap.add_argument("--parallel", action="store_true",
+                    help="ยิงขา Spot/Futures (และดึง depth/ยอดคงเหลือ) พร้อมกัน แทนทีละขา")
+    ap.add_argument("--batch-orders", action="store_true",
+                    help="รวมออเดอร์ Futures ของคู่ที่รันรอบพร้อมกัน (--pairs) เป็น batchOrders ครั้งละ ≤5")
+    ap.add_argument("--batch-window-ms", type=float, default=25.0,
+                    help="เวลารอสูงสุดให้รอบอื่นที่ยังรันอยู่ส่งออเดอร์เข้าชุด (ครบทุกรอบแล้วส่งทันที)")
+    ap.add_argument("--requote-ticks", type=int, default=0,
+                    help="ออเดอร์ maker ที่ค้างห่างราคาใหม่ไม่เกินกี่ tick ให้คงไว้ (ไม่ cancel/วางใหม่)")
+
+    # journal
+    ap.add_argument("--journal", default="", help="โฟลเดอร์ journal JSONL (decision/order/fill/close) — '' = ปิด")
+    ap.add_argument("--journal-max-mb", type=float, default=64.0, help="หมุนไฟล์เมื่อใหญ่เกิน (MB)")
+    ap.add_argument("--journal-rotate-sec", type=int, default=86400, help="หมุนไฟล์ทุกกี่วินาที (0 = ตามขนาดอย่างเดียว)")
+    ap.add_argument("--journal-no-gzip", action="store_true", help="ไม่ gzip ไฟล์ที่หมุนแล้ว")
+
+    # metrics
+    ap.add_argument("--metrics-port", type=int, default=0,
+                    help="เปิด Prometheus endpoint ที่ /metrics (และ /metrics.json) บนพอร์ตนี้ (0 = ปิด)")
+    ap.add_argument("--metrics-host", default="127.0.0.1")
+    ap.add_argument("--metrics-json", default="", help="เขียน metrics เป็น JSON ลงไฟล์นี้เป็นระยะ")
+    ap.add_argument("--metrics-interval", type=float, default=10.0, help="วินาทีระหว่างการเขียน --metrics-json")
 
     ap.add_argument("--log-level", default="INFO", choices=["DEBUG","INFO","WARNING","ERROR"])
-    return ap.parse_args()
+    return ap
+
+def parse_args(argv=None):
+    return build_parser().parse_args(argv)
+
+def _on_sigterm(signum, frame):
+    raise KeyboardInterrupt  # kill/nohup → หยุดทางเดียวกับ Ctrl+C (ปิด recorder/journal ให้ครบ)
 
 if __name__=="__main__":
     args = parse_args()
     logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.INFO),
                         format="%(asctime)s | %(levelname)s | %(message)s")
+    signal.signal(signal.SIGTERM, _on_sigterm)
     run(args)
 
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+aster-replay.py  (offline replay / backtest)
+- เล่นซ้ำไฟล์ที่บันทึกด้วย `aster-maker15.py --record DIR` (DIR/<SYMBOL>.amr)
+- ใช้ตรรกะตัดสินใจเดียวกับบอทที่รัน --close-model flat (ไฟล์บันทึกมีเด็ปธ์แค่ 2 ชั้น → จำลอง depth ไม่ได้;
+  ผล replay/sweep ใช้กับบอทค่าเริ่มต้น --close-model depth ตรง ๆ ไม่ได้): open basis (maker fee), close estimate (taker fee + slippage บน last/mark),
+  close-guard (สเปรด Spot ask/Fut bid + เด็ปธ์ 2 ชั้น), confirm-hits ตามรอบ --poll, max-hold, cooldown/always-reopen
+- fill model: maker BUY Spot @bid / SELL Fut @ask
+    through = เติมเมื่อราคาวิ่งผ่านระดับเรา (ฝั่งตรงข้ามมาแตะ หรือระดับเราถูกกินหมด)
+    instant = เติมที่ tick ถัดไปทันที (มองโลกในแง่ดี)
+  ปิดแบบ taker: ขาย Spot @bid / ซื้อ Fut @ask + taker fee
+- คำนวณเป็น batch ด้วย NumPy (เงื่อนไขทุก tick คำนวณครั้งเดียวทั้งไฟล์, หา fill/close ด้วย argmax ทีละช่วง)
+
+ตัวอย่าง:
+python3 aster-replay.py rec/ASTERUSDT.amr --capital 120 --target-profit 1 --confirm-hits 2 --poll 3
+"""
+
+import os, time, math, importlib.util
+import numpy as np
+
+def _load_maker():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "aster-maker15.py")
+    spec = importlib.util.spec_from_file_location("aster_maker15", path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+mk = _load_maker()
+
+# ---------- data ----------
+def load(path):
+    """→ (meta, {column: np.ndarray float64}) — array('d') ถูกแชร์ buffer ไม่คัดลอก"""
+    meta, cols = mk.read_recording(path)
+    return meta, {k: np.frombuffer(v, dtype=np.float64) for k,v in cols.items()}
+
+def _floor(x, step):
+    return math.floor(x/step + 1e-9)*step if step > 0 else x
+
+# ---------- per-tick vectors (คำนวณครั้งเดียวทั้งไฟล์) ----------
+def precompute(c, p):
+    ts = c["ts"]
+    bucket = np.floor(ts / max(p.poll, 1e-9))
+    ev = np.empty(len(ts), dtype=bool)
+    ev[:1] = True
+    ev[1:] = bucket[1:] != bucket[:-1]          # tick แรกของแต่ละรอบ --poll = จุดที่บอทประเมิน
+    sa, fb, sl, mp = c["s_ask"], c["f_bid"], c["s_last"], c["mark"]
+    mid = (sa + fb)/2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        spread = np.where((sa > 0) & (fb > 0) & (mid > 0), (sa - fb)/mid*1e4, 99999.0)
+    # est_close_gain_minus_fee_slip(q, sl, mark) = q*g
+    g = ((sl - mp) - sl*p.taker_spot_bps/1e4 - mp*p.taker_fut_bps/1e4
+         - (sl + mp)/2*p.slippage_bps/1e4)
+    return {"ev": ev, "spread_ok": spread <= p.max_close_spread_bps, "g": g}
+
+# ---------- search helpers ----------
+def _first(mask_fn, start, n, batch):
+    """index แรก ≥ start ที่ mask เป็นจริง (ขยายช่วงทีละเท่าตัวจนถึง batch) หรือ None"""
+    a, w = start, 256
+    while a < n:
+        b = min(n, a + w)
+        m = mask_fn(slice(a, b))
+        k = int(np.argmax(m))
+        if m[k]: return a + k
+        a, w = b, min(w*2, batch)
+    return None
+
+def _close_index(c, pre, p, j1, q, open_basis, batch):
+    """tick ที่บอทจะสั่งปิด: confirm-hits ติดกันบนจุดประเมิน หรือถือเกิน max-hold"""
+    ts, n = c["ts"], len(c["ts"])
+    need = q*p.min_close_depth_mult
+    carry, a, w = 0, j1, 256
+    while a < n:
+        b = min(n, a + w)
+        sl = slice(a, b)
+        ev = pre["ev"][sl].copy()
+        if a == j1: ev[0] = True                  # บอทประเมินทันทีที่คู่พร้อม
+        idx = np.flatnonzero(ev)
+        if len(idx):
+            hit = ((open_basis + q*pre["g"][sl][idx] >= p.target_profit) & pre["spread_ok"][sl][idx]
+                   & (c["s_ask_q2"][sl][idx] >= need) & (c["f_bid_q2"][sl][idx] >= need))
+            cs = np.cumsum(hit)
+            streak = cs - np.maximum.accumulate(np.where(~hit, cs, 0))
+            ff = int(np.argmax(~hit)) if (~hit).any() else len(hit)
+            streak[:ff] += carry
+            done = streak >= p.confirm_hits
+            if p.max_hold_sec > 0:
+                done |= (ts[sl][idx] - ts[j1]) > p.max_hold_sec
+            k = int(np.argmax(done))
+            if done[k]: return a + int(idx[k])
+            carry = int(streak[-1])
+        a, w = b, min(w*2, batch)
+    return None
+
+# ---------- simulation ----------
+def simulate(c, p, meta, batch=1<<16, pre=None):
+    """เดินตาม state machine ของบอท: open → (fill) → รอปิด → ปิด → cooldown → open ใหม่"""
+    ts, sb, sa, fb, fa = c["ts"], c["s_bid"], c["s_ask"], c["f_bid"], c["f_ask"]
+    n = len(ts)
+    pre = pre or precompute(c, p)
+    s_step, f_step = float(meta["s_step"]), float(meta["f_step"])
+    s_min = float(meta.get("s_min_notional", 5)); f_min = float(meta.get("f_min_notional", 5))
+    instant = getattr(p, "fill", "through") == "instant"
+    trades = []
+    i = 0
+    while i < n - 1:
+        P, Q = sb[i], fa[i]
+        if P <= 0 or Q <= 0:
+            i += 1; continue
+        q = p.capital/P
+        if p.whole_qty: q = float(int(q))
+        q = _floor(_floor(q, s_step), f_step)
+        if q <= 0 or q*P < s_min or q*Q < f_min: break
+        if instant:
+            js = jf = i + 1
+        else:
+            js = _first(lambda s: (sa[s] <= P) | (sb[s] < P), i+1, n, batch)
+            jf = _first(lambda s: (fb[s] >= Q) | (fa[s] > Q), i+1, n, batch)
+        if js is None or jf is None: break
+        j1 = max(js, jf)
+        # state["open_basis"] ของบอทใช้ราคา book ตอนคู่พร้อม; pnl จริงใช้ราคาที่ถูกเติม
+        open_basis = q*(fa[j1] - sb[j1]) - q*sb[j1]*p.maker_spot_bps/1e4 - q*fa[j1]*p.maker_fut_bps/1e4
+        real_open  = q*(Q - P) - q*P*p.maker_spot_bps/1e4 - q*Q*p.maker_fut_bps/1e4
+        jc = _close_index(c, pre, p, j1, q, open_basis, batch)
+        if jc is None: break
+        real_close = q*(sb[jc] - fa[jc]) - q*sb[jc]*p.taker_spot_bps/1e4 - q*fa[jc]*p.taker_fut_bps/1e4
+        trades.append((ts[i], ts[j1], ts[jc], q, open_basis + q*pre["g"][jc], real_open + real_close))
+        wait = 0 if p.always_reopen else p.cooldown_sec
+        i = max(jc + 1, int(np.searchsorted(ts, ts[jc] + wait)))
+    return summarize(trades, ts)
+
+def summarize(trades, ts):
+    t = np.array(trades, dtype=np.float64).reshape(-1, 6)
+    pnl = t[:,5]
+    cum = np.cumsum(pnl)
+    dd = float(np.max(np.maximum.accumulate(np.r_[0.0, cum]) - np.r_[0.0, cum])) if len(cum) else 0.0
+    days = max((ts[-1] - ts[0])/86400.0, 1e-9) if len(ts) else 1e-9
+    return {
+        "trips": len(t),
+        "pnl": float(cum[-1]) if len(cum) else 0.0,
+        "est": float(t[:,4].sum()),
+        "win_rate": float((pnl > 0).mean()) if len(pnl) else 0.0,
+        "avg_hold_sec": float((t[:,2] - t[:,1]).mean()) if len(t) else 0.0,
+        "max_drawdown": dd,
+        "trips_per_day": len(t)/days,
+        "days": days,
+        "trades": t,
+    }
+
+# ---------- CLI ----------
+def build_parser():
+    ap = mk.build_parser()
+    ap.description = "AsterDex Maker v15 offline replay"
+    ap.add_argument("recording", help="ไฟล์ .amr จาก --record")
+    ap.add_argument("--fill", choices=["through","instant"], default="through")
+    ap.add_argument("--batch", type=int, default=1<<16, help="จำนวน tick สูงสุดต่อ batch")
+    ap.add_argument("--trades-out", default="", help="เขียนรายการเทรดเป็น CSV")
+    return ap
+
+def main():
+    p = build_parser().parse_args()
+    t0 = time.perf_counter()
+    meta, c = load(p.recording)
+    t1 = time.perf_counter()
+    r = simulate(c, p, meta, p.batch)
+    t2 = time.perf_counter()
+    n = len(c["ts"])
+    print(f"{meta['symbol']} ticks={n} days={r['days']:.2f} load={t1-t0:.2f}s sim={t2-t1:.2f}s "
+          f"({n/max(t2-t1,1e-9):,.0f} ticks/s)")
+    print(f"trips={r['trips']} ({r['trips_per_day']:.1f}/day) pnl={r['pnl']:.4f} est={r['est']:.4f} "
+          f"win={r['win_rate']*100:.1f}% hold={r['avg_hold_sec']:.0f}s maxDD={r['max_drawdown']:.4f}")
+    if p.trades_out:
+        np.savetxt(p.trades_out, r["trades"], delimiter=",", fmt="%.8f",
+                   header="t_open,t_ready,t_close,qty,est_net,pnl", comments="")
+
+if __name__=="__main__":
+    main()
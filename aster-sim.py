@@ -0,0 +1,631 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+aster-sim.py  (local simulated AsterDex)
+- เซิร์ฟเวอร์ REST จำลองสำหรับวัด throughput / latency / พฤติกรรม fallback ของ aster-maker15.py แบบ offline
+- Spot บน --port และ Futures บน --port+1 (บอทแยก venue ด้วย base URL; ทั้งสองพอร์ตตอบได้ทุก path): time, exchangeInfo, depth, ticker/price,
+  ticker/bookTicker, premiumIndex, account, positionRisk, order (POST/GET/DELETE), openOrders,
+  marginType, leverage, listenKey, /sim/stats
+- websocket บนพอร์ตเดียวกัน (บอท --spot-ws ws://HOST:PORT --fut-ws ws://HOST:PORT+1): /stream?streams=... หรือ /ws/<stream>
+  <sym>@depth@100ms (diff ทุก step ต่อจาก lastUpdateId ของ REST depth: Spot U = id+1, Futures U <= id < u และ pu), <sym>@aggTrade,
+  <sym>@markPrice@1s; --ws-gap-p = โอกาสทิ้ง diff ต่อ event ต่อ connection (sequence ขาด → บอทต้อง resync)
+- user data stream: /ws/<listenKey> (listenKey = sim-spot / sim-fut): executionReport + outboundAccountPosition (Spot),
+  ORDER_TRADE_UPDATE + ACCOUNT_UPDATE (Futures) ทุกครั้งที่ออเดอร์ถูกวาง/เติม/ยกเลิก/หมดอายุ
+- ราคา random walk ทุก --step-ms, Futures = Spot * (1 + basis); book สังเคราะห์ --levels ชั้น
+- matching: GTX (ถ้าจะกินคิว → -5022), IOC (กินตาม book แล้วยกเลิกส่วนที่เหลือ), MARKET, reduceOnly (-2022)
+  order ที่พักไว้จะถูกเติมเมื่อราคาวิ่งผ่าน; ตรวจกริด (-1111), notional ขั้นต่ำ, ยอดเงิน (-2010)
+- ตรวจลายเซ็น HMAC + X-MBX-APIKEY + timestamp/recvWindow (-1022/-2015/-1021)
+- หน่วงเวลา (--latency-ms/--jitter-ms) และสุ่ม error (--p-1021/--p-429/--p-5022)
+
+ตัวอย่าง:
+ASTERDEX_API_KEY=sim ASTERDEX_API_SECRET=sim python3 aster-sim.py --port 8900 --symbols ASTERUSDT --latency-ms 20
+ASTERDEX_API_KEY=sim ASTERDEX_API_SECRET=sim python3 aster-maker15.py --sapi http://127.0.0.1:8900 --fapi http://127.0.0.1:8901 ...
+    --ws --spot-ws ws://127.0.0.1:8900 --fut-ws ws://127.0.0.1:8901
+"""
+
+import os, time, hmac, hashlib, json, random, argparse, logging, threading, itertools, base64, struct, socket, queue
+from decimal import Decimal, ROUND_DOWN
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl, unquote
+from collections import Counter
+
+def D(x): return Decimal(str(x))
+
+class ApiError(Exception):
+    def __init__(self, code, msg, status=400, headers=None):
+        super().__init__(msg)
+        self.code, self.msg, self.status, self.headers = code, msg, status, headers or {}
+
+# ---------- market ----------
+class Market:
+    """ราคา/กริดของหนึ่ง symbol บนหนึ่ง venue; ราคาเก็บเป็นจำนวน tick (int)"""
+    def __init__(self, symbol, venue, mid, tick, step, min_notional, levels, level_qty):
+        self.symbol, self.venue = symbol, venue
+        self.tick, self.step, self.min_notional = D(tick), D(step), D(min_notional)
+        self.levels, self.level_qty = levels, level_qty
+        self.update_id = 1
+        self.set_mid(mid)
+
+    def set_mid(self, mid):
+        t = float(self.tick)
+        self.bid = max(1, int(mid/t))
+        self.ask = self.bid + 1
+        self.update_id += 1
+
+    def px(self, n): return self.tick*n
+
+    def qty_at(self, i):
+        # ปริมาณต่อชั้นคงที่แต่ไม่เท่ากัน (deterministic ต่อระดับ)
+        return (D(self.level_qty)*(1 + D((i*7919) % 97)/D(50))).quantize(self.step, rounding=ROUND_DOWN)
+
+    def book(self, limit):
+        n = min(limit, self.levels)
+        bids = [[str(self.px(self.bid - i)), str(self.qty_at(i))] for i in range(n) if self.bid - i > 0]
+        asks = [[str(self.px(self.ask + i)), str(self.qty_at(i))] for i in range(n)]
+        return {"lastUpdateId": self.update_id, "E": int(time.time()*1000), "bids": bids, "asks": asks}
+
+    def levels_map(self):
+        """ทุกชั้นของ book → ({tick: qty} bids, {tick: qty} asks)"""
+        bids = {self.bid - i: self.qty_at(i) for i in range(self.levels) if self.bid - i > 0}
+        asks = {self.ask + i: self.qty_at(i) for i in range(self.levels)}
+        return bids, asks
+
+    def diff(self, before):
+        """book ก่อนขยับ (levels_map) → (b, a) แบบ diff-depth: [[price, qty]] ที่เปลี่ยน, qty "0" = ลบระดับ"""
+        out = []
+        for old, new in zip(before, self.levels_map()):
+            rows = [[str(self.px(n)), str(q)] for n, q in new.items() if old.get(n) != q]
+            rows += [[str(self.px(n)), "0"] for n in old if n not in new]
+            out.append(rows)
+        return out
+
+    def sweep(self, side, qty, limit_px=None):
+        """กินฝั่งตรงข้ามตาม book → (filled, avg_px)"""
+        left, cost, i = qty, D(0), 0
+        while left > 0 and i < self.levels:
+            n = self.ask + i if side == "BUY" else self.bid - i
+            if n <= 0: break
+            p = self.px(n)
+            if limit_px is not None and ((side == "BUY" and p > limit_px) or (side == "SELL" and p < limit_px)): break
+            take = min(left, self.qty_at(i))
+            cost += take*p
+            left -= take
+            i += 1
+        filled = qty - left
+        return filled, (cost/filled if filled > 0 else D(0))
+
+# ---------- exchange ----------
+class Exchange:
+    def __init__(self, a):
+        self.a = a
+        self.lock = threading.RLock()
+        self.markets = {}
+        self.basis = {}
+        self.mid = {}
+        for sym in a.symbols:
+            self.mid[sym] = a.mid
+            self.basis[sym] = a.basis_bps/1e4
+            self.markets[("spot", sym)] = Market(sym, "spot", a.mid, a.tick, a.step, a.min_notional, a.levels, a.level_qty)
+            self.markets[("fut", sym)] = Market(sym, "fut", a.mid*(1+self.basis[sym]), a.tick, a.step,
+                                                a.min_notional, a.levels, a.level_qty)
+        self.spot = {"USDT": [D(a.usdt), D(0)]}          # asset -> [free, locked]
+        for sym in a.symbols: self.spot.setdefault(sym[:-4] if sym.endswith("USDT") else sym, [D(0), D(0)])
+        self.fut_wallet = D(a.fut_usdt)
+        self.pos = {sym: [D(0), D(0)] for sym in a.symbols}  # symbol -> [amt, entry]
+        self.leverage = {sym: 4 for sym in a.symbols}
+        self.orders = {}                                   # orderId -> order dict (ที่ยังพักอยู่)
+        self.history = {}                                  # orderId -> ทุกออเดอร์ (query สถานะหลังจบ)
+        self.ids = itertools.count(1)
+        self.stats = Counter()
+        self.subs = []                                     # [(venue, set(stream), queue)] ของ websocket ที่ต่ออยู่
+
+    # ----- websocket fan-out -----
+    def subscribe(self, venue, streams):
+        q = queue.Queue(maxsize=10000)
+        with self.lock: self.subs.append((venue, streams, q))
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock: self.subs = [s for s in self.subs if s[2] is not q]
+
+    def publish(self, venue, stream, data):
+        for v, streams, q in self.subs:
+            if v == venue and stream in streams:
+                try: q.put_nowait((stream, data))
+                except queue.Full: pass  # client ช้าเกิน → ขาด sequence เอง (เหมือน server จริงตัดทิ้ง)
+
+    def _publish_step(self, m, prev_id, before):
+        E = int(time.time()*1000)
+        sym = m.symbol.lower()
+        b, a = m.diff(before)
+        ev = {"e": "depthUpdate", "E": E, "s": m.symbol, "U": prev_id + 1, "u": m.update_id, "b": b, "a": a}
+        if m.venue == "fut":
+            # Futures: id ไม่ต่อเนื่อง event แรกหลัง snapshot ต้องคร่อม lastUpdateId (U <= id < u) → U เริ่มที่ u ของ event ก่อน
+            ev["U"], ev["pu"] = prev_id, prev_id
+        self.publish(m.venue, f"{sym}@depth@100ms", ev)
+        if m.venue == "spot":
+            self.publish("spot", f"{sym}@aggTrade", {"e": "aggTrade", "E": E, "s": m.symbol, "p": str(m.px(m.bid)),
+                                                     "q": str(m.qty_at(0)), "T": E})
+        else:
+            self.publish("fut", f"{sym}@markPrice@1s", {"e": "markPriceUpdate", "E": E, "s": m.symbol,
+                                                         "p": str((m.px(m.bid) + m.px(m.ask))/2)})
+
+    # ----- price process -----
+    def step(self):
+        with self.lock:
+            for sym in self.mid:
+                self.mid[sym] *= 1 + random.gauss(0, self.a.vol_bps/1e4)
+                self.basis[sym] += random.gauss(0, self.a.basis_vol_bps/1e4) - 0.01*(self.basis[sym] - self.a.basis_bps/1e4)
+                for venue, mid in (("spot", self.mid[sym]), ("fut", self.mid[sym]*(1+self.basis[sym]))):
+                    m = self.markets[(venue, sym)]
+                    before, prev_id = (m.levels_map(), m.update_id) if self.subs else (None, None)
+                    m.set_mid(mid)
+                    if before is not None: self._publish_step(m, prev_id, before)
+            self._match_resting()
+
+    def _match_resting(self):
+        for oid, o in list(self.orders.items()):
+            m = self.markets[(o["venue"], o["symbol"])]
+            crossed = (o["side"] == "BUY" and m.px(m.ask) <= o["price"]) or (o["side"] == "SELL" and m.px(m.bid) >= o["price"])
+            if crossed:
+                del self.orders[oid]
+                self._fill(o, o["origQty"] - o["executedQty"], o["price"])
+
+    # ----- user data stream -----
+    def _report(self, o, exec_type, last_qty=D(0), last_px=D(0)):
+        """executionReport (Spot) / ORDER_TRADE_UPDATE (Futures) ของออเดอร์ o → stream ของ listenKey"""
+        if exec_type == "TRADE": o["status"] = "FILLED" if o["executedQty"] >= o["origQty"] else "PARTIALLY_FILLED"
+        if not self.subs: return
+        E, ex = int(time.time()*1000), o["executedQty"]
+        ev = {"s": o["symbol"], "c": o["clientOrderId"], "S": o["side"], "o": o["type"], "f": o["timeInForce"],
+              "q": str(o["origQty"]), "p": str(o["price"]), "x": exec_type, "X": o["status"], "i": o["orderId"],
+              "l": str(last_qty), "z": str(ex), "L": str(last_px), "T": o["updateTime"]}
+        if o["venue"] == "spot":
+            ev.update({"e": "executionReport", "E": E, "C": o["clientOrderId"] if exec_type == "CANCELED" else "",
+                       "Z": str(o["cumQuote"])})
+            self.publish("spot", "sim-spot", ev)
+        else:
+            ev.update({"ap": str(o["cumQuote"]/ex if ex > 0 else D(0)), "R": o["reduceOnly"]})
+            self.publish("fut", "sim-fut", {"e": "ORDER_TRADE_UPDATE", "E": E, "T": E, "o": ev})
+
+    def _report_balance(self, o):
+        """ยอดที่เปลี่ยนจาก o: outboundAccountPosition (Spot USDT + asset) / ACCOUNT_UPDATE (wallet + โพสิชัน)"""
+        if not self.subs: return
+        E = int(time.time()*1000)
+        if o["venue"] == "spot":
+            B = [{"a": k, "f": str(self.spot[k][0]), "l": str(self.spot[k][1])} for k in ("USDT", self._base(o["symbol"]))]
+            self.publish("spot", "sim-spot", {"e": "outboundAccountPosition", "E": E, "u": E, "B": B})
+        else:
+            amt, entry = self.pos[o["symbol"]]
+            self.publish("fut", "sim-fut", {"e": "ACCOUNT_UPDATE", "E": E, "T": E, "a": {"m": "ORDER",
+                "B": [{"a": "USDT", "wb": str(self.fut_wallet), "cw": str(self.fut_wallet)}],
+                "P": [{"s": o["symbol"], "pa": str(amt), "ep": str(entry), "ps": "BOTH"}]}})
+
+    # ----- accounting -----
+    def _base(self, sym): return sym[:-4] if sym.endswith("USDT") else sym
+
+    def _fill(self, o, qty, px):
+        if qty <= 0: return
+        sym, side = o["symbol"], o["side"]
+        o["executedQty"] += qty
+        o["cumQuote"] += qty*px
+        o["updateTime"] = int(time.time()*1000)
+        self.stats["fills"] += 1
+        if o["venue"] == "spot":
+            usdt, asset = self.spot["USDT"], self.spot[self._base(sym)]
+            if side == "BUY":
+                if o["resting"]: usdt[1] -= qty*o["price"]; usdt[0] += qty*(o["price"] - px)
+                else: usdt[0] -= qty*px
+                asset[0] += qty
+            else:
+                if o["resting"]: asset[1] -= qty
+                else: asset[0] -= qty
+                usdt[0] += qty*px
+        else:
+            amt, entry = self.pos[sym]
+            signed = qty if side == "BUY" else -qty
+            new = amt + signed
+            if amt == 0 or (amt > 0) == (signed > 0):
+                entry = (abs(amt)*entry + qty*px)/abs(new)
+            else:
+                closed = min(abs(amt), qty)
+                self.fut_wallet += closed*(px - entry)*(1 if amt > 0 else -1)
+                if abs(signed) > abs(amt): entry = px
+            self.pos[sym] = [new, entry if new != 0 else D(0)]
+        self._report(o, "TRADE", qty, px)
+        self._report_balance(o)
+
+    # ----- orders -----
+    def new_order(self, venue, q):
+        sym = q.get("symbol", "")
+        m = self.markets.get((venue, sym))
+        if m is None: raise ApiError(-1121, "Invalid symbol.")
+        side, typ, tif = q.get("side"), q.get("type"), q.get("timeInForce", "GTC")
+        qty = D(q.get("quantity", "0"))
+        if qty <= 0 or qty % m.step != 0: raise ApiError(-1111, "Precision is over the maximum defined for this asset.")
+        price = None
+        if typ == "LIMIT":
+            price = D(q.get("price", "0"))
+            if price <= 0 or price % m.tick != 0: raise ApiError(-1111, "Precision is over the maximum defined for this asset.")
+        ref = price if price is not None else (m.px(m.ask) if side == "BUY" else m.px(m.bid))
+        if qty*ref < m.min_notional: raise ApiError(-1013 if venue == "spot" else -4164, "Order's notional must be no smaller than min notional")
+        reduce_only = str(q.get("reduceOnly", "false")).lower() == "true"
+        if venue == "fut" and reduce_only:
+            amt = self.pos[sym][0]
+            if amt == 0 or (amt > 0) == (side == "BUY"): raise ApiError(-2022, "ReduceOnly Order is rejected.")
+            qty = min(qty, abs(amt))
+        oid = next(self.ids)
+        o = {"venue": venue, "symbol": sym, "orderId": oid, "clientOrderId": q.get("newClientOrderId") or f"sim{oid}",
+             "side": side, "type": typ, "timeInForce": tif if typ == "LIMIT" else "GTC", "price": price or D(0),
+             "origQty": qty, "executedQty": D(0), "cumQuote": D(0), "status": "NEW", "reduceOnly": reduce_only,
+             "resting": False, "updateTime": int(time.time()*1000)}
+        self.stats[f"order_{typ}_{o['timeInForce']}"] += 1
+        best_opp = m.px(m.ask) if side == "BUY" else m.px(m.bid)
+        crosses = price is not None and ((side == "BUY" and price >= best_opp) or (side == "SELL" and price <= best_opp))
+        if typ == "LIMIT" and tif == "GTX":
+            if crosses or random.random() < self.a.p_5022:
+                self.stats["rejected_5022"] += 1
+                raise ApiError(-5022, "Due to the order could not be executed as maker, the Post Only order will be rejected.")
+        if venue == "spot":
+            self._check_spot_funds(o, ref)
+        self.history[oid] = o
+        self._report(o, "NEW")
+        if typ == "MARKET" or tif in ("IOC", "FOK") or (typ == "LIMIT" and tif == "GTC" and crosses):
+            filled, avg = m.sweep(side, qty, price)
+            if tif == "FOK" and filled < qty: filled = D(0)
+            self._fill(o, filled, avg)
+            o["status"] = "FILLED" if filled == qty else ("EXPIRED" if filled == 0 or typ == "MARKET" or tif != "GTC"
+                                                        else "PARTIALLY_FILLED")
+            if o["status"] == "PARTIALLY_FILLED": self._rest(o)
+            if o["status"] == "EXPIRED": self._report(o, "EXPIRED")
+        else:
+            self._rest(o)
+            if venue == "spot": self._report_balance(o)  # ยอด locked เปลี่ยน
+        return o
+
+    def _check_spot_funds(self, o, ref):
+        usdt, asset = self.spot["USDT"], self.spot[self._base(o["symbol"])]
+        need_usdt = o["origQty"]*ref if o["side"] == "BUY" else D(0)
+        if (o["side"] == "BUY" and usdt[0] < need_usdt) or (o["side"] == "SELL" and asset[0] < o["origQty"]):
+            raise ApiError(-2010, "Account has insufficient balance for requested action.")
+
+    def _rest(self, o):
+        left = o["origQty"] - o["executedQty"]
+        o["resting"] = True
+        if o["venue"] == "spot":
+            if o["side"] == "BUY":
+                u = self.spot["USDT"]; u[0] -= left*o["price"]; u[1] += left*o["price"]
+            else:
+                a = self.spot[self._base(o["symbol"])]; a[0] -= left; a[1] += left
+        self.orders[o["orderId"]] = o
+
+    def cancel(self, venue, q):
+        o = self._find(venue, q)
+        if o is None or o["orderId"] not in self.orders: raise ApiError(-2011, "Unknown order sent.")
+        del self.orders[o["orderId"]]
+        left = o["origQty"] - o["executedQty"]
+        if venue == "spot":
+            if o["side"] == "BUY":
+                u = self.spot["USDT"]; u[1] -= left*o["price"]; u[0] += left*o["price"]
+            else:
+                a = self.spot[self._base(o["symbol"])]; a[1] -= left; a[0] += left
+        o["status"] = "CANCELED"
+        self._report(o, "CANCELED")
+        if venue == "spot": self._report_balance(o)
+        return o
+
+    def _find(self, venue, q):
+        if q.get("orderId"): return self.history.get(int(q["orderId"]))
+        cid = q.get("origClientOrderId")
+        return next((o for o in reversed(self.history.values()) if o["venue"] == venue and o["clientOrderId"] == cid), None)
+
+    @staticmethod
+    def order_json(o):
+        out = {"symbol": o["symbol"], "orderId": o["orderId"], "clientOrderId": o["clientOrderId"],
+               "price": str(o["price"]), "origQty": str(o["origQty"]), "executedQty": str(o["executedQty"]),
+               "status": o["status"], "timeInForce": o["timeInForce"], "type": o["type"], "side": o["side"],
+               "updateTime": o["updateTime"]}
+        if o["venue"] == "fut":
+            ex = o["executedQty"]
+            out.update({"avgPrice": str(o["cumQuote"]/ex if ex > 0 else D(0)), "cumQuote": str(o["cumQuote"]),
+                        "reduceOnly": o["reduceOnly"]})
+        else:
+            out["cummulativeQuoteQty"] = str(o["cumQuote"])
+        return out
+
+# ---------- HTTP ----------
+PUBLIC = {"/api/v1/time", "/fapi/v1/time", "/api/v1/exchangeInfo", "/fapi/v1/exchangeInfo", "/api/v1/depth",
+          "/fapi/v1/depth", "/api/v1/ticker/price", "/fapi/v1/ticker/price", "/api/v1/ticker/bookTicker",
+          "/fapi/v1/ticker/bookTicker", "/fapi/v1/premiumIndex", "/sim/stats"}
+KEY_ONLY = {"/api/v1/listenKey", "/fapi/v1/listenKey"}
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    ex = None     # Exchange
+    cfg = None    # argparse.Namespace
+
+    def log_message(self, *a): pass
+
+    def _send(self, status, obj, headers=None):
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-MBX-USED-WEIGHT-1M", str(WEIGHT.used()))
+        for k, v in (headers or {}).items(): self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, method):
+        c = self.cfg
+        u = urlsplit(self.path)
+        path, raw = u.path, u.query
+        n = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(n).decode() if n else ""
+        q = dict(parse_qsl(raw))
+        q.update(dict(parse_qsl(body)))
+        self.ex.stats[f"{method} {path}"] += 1
+        WEIGHT.add(1)
+        if c.latency_ms or c.jitter_ms:
+            time.sleep((c.latency_ms + random.uniform(0, c.jitter_ms))/1000.0)
+        try:
+            if path != "/sim/stats":
+                if random.random() < c.p_429:
+                    self.ex.stats["injected_429"] += 1
+                    raise ApiError(-1003, "Too many requests; injected.", 429, {"Retry-After": "1"})
+                if path not in PUBLIC: self._auth(path, raw, body, q)
+            self._send(200, self._route(method, path, q))
+        except ApiError as e:
+            self.ex.stats[f"error_{e.code}"] += 1
+            self._send(e.status, {"code": e.code, "msg": e.msg}, e.headers)
+        except Exception as e:
+            logging.exception("sim error")
+            self._send(500, {"code": -1000, "msg": str(e)})
+
+    def _auth(self, path, raw, body, q):
+        if self.headers.get("X-MBX-APIKEY") != self.cfg.api_key:
+            raise ApiError(-2015, "Invalid API-key, IP, or permissions for action.", 401)
+        if path in KEY_ONLY: return
+        payload = raw if raw else body
+        if "&signature=" not in payload: raise ApiError(-1102, "Mandatory parameter 'signature' was not sent.")
+        unsigned, sig = payload.rsplit("&signature=", 1)
+        want = hmac.new(self.cfg.api_secret.encode(), unsigned.encode(), hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(want, sig): raise ApiError(-1022, "Signature for this request is not valid.")
+        now = int(time.time()*1000) + self.cfg.clock_skew_ms
+        ts, rw = int(q.get("timestamp", 0)), int(q.get("recvWindow", 5000))
+        if random.random() < self.cfg.p_1021 or ts > now + 1000 or now - ts > rw:
+            self.ex.stats["rejected_1021"] += 1
+            raise ApiError(-1021, "Timestamp for this request is outside of the recvWindow.")
+
+    def _route(self, method, path, q):
+        ex = self.ex
+        venue = "fut" if path.startswith("/fapi") else "spot"
+        sym = q.get("symbol")
+        with ex.lock:
+            if path.endswith("/time"):
+                return {"serverTime": int(time.time()*1000) + self.cfg.clock_skew_ms}
+            if path.endswith("/exchangeInfo"):
+                return {"symbols": [{"symbol": m.symbol, "status": "TRADING", "filters": [
+                    {"filterType": "PRICE_FILTER", "tickSize": str(m.tick)},
+                    {"filterType": "LOT_SIZE", "stepSize": str(m.step), "minQty": str(m.step)},
+                    {"filterType": "MIN_NOTIONAL", "minNotional": str(m.min_notional), "notional": str(m.min_notional)}]}
+                    for (v, _), m in ex.markets.items() if v == venue]}
+            if path.endswith("/depth"):
+                return self._market(venue, sym).book(int(q.get("limit", 100)))
+            if path.endswith("/ticker/price"):
+                rows = [{"symbol": m.symbol, "price": str(m.px(m.bid))} for (v,_), m in ex.markets.items() if v == venue]
+                return self._one(rows, sym)
+            if path.endswith("/ticker/bookTicker"):
+                rows = [{"symbol": m.symbol, "bidPrice": str(m.px(m.bid)), "bidQty": str(m.qty_at(0)),
+                         "askPrice": str(m.px(m.ask)), "askQty": str(m.qty_at(0))}
+                        for (v,_), m in ex.markets.items() if v == venue]
+                return self._one(rows, sym)
+            if path == "/fapi/v1/premiumIndex":
+                rows = [{"symbol": m.symbol, "markPrice": str((m.px(m.bid)+m.px(m.ask))/2),
+                         "indexPrice": str(ex.markets[("spot", m.symbol)].px(ex.markets[("spot", m.symbol)].bid)),
+                         "time": int(time.time()*1000)} for (v,_), m in ex.markets.items() if v == "fut"]
+                return self._one(rows, sym)
+            if path == "/sim/stats":
+                return dict(ex.stats)
+            if path == "/api/v1/account":
+                return {"balances": [{"asset": k, "free": str(v[0]), "locked": str(v[1])} for k, v in ex.spot.items()]}
+            if path == "/fapi/v2/positionRisk":
+                rows = [{"symbol": s, "positionAmt": str(p[0]), "entryPrice": str(p[1]),
+                         "markPrice": str(ex.markets[("fut", s)].px(ex.markets[("fut", s)].bid)),
+                         "leverage": str(ex.leverage[s]), "liquidationPrice": "0", "positionSide": "BOTH"}
+                        for s, p in ex.pos.items() if not sym or s == sym]
+                return rows
+            if path == "/fapi/v2/account":
+                return {"totalWalletBalance": str(ex.fut_wallet), "availableBalance": str(ex.fut_wallet)}
+            if path in ("/api/v1/order", "/fapi/v1/order"):
+                if method == "POST": return ex.order_json(ex.new_order(venue, q))
+                if method == "DELETE": return ex.order_json(ex.cancel(venue, q))
+                o = ex._find(venue, q)
+                if o is None: raise ApiError(-2013, "Order does not exist.")
+                return ex.order_json(o)
+            if path == "/fapi/v1/batchOrders" and method == "POST":
+                out = []
+                for o in json.loads(q.get("batchOrders") or "[]")[:5]:
+                    try: out.append(ex.order_json(ex.new_order("fut", {k: str(v) for k, v in o.items()})))
+                    except ApiError as e: out.append({"code": e.code, "msg": e.msg})
+                return out
+            if path in ("/api/v1/openOrders", "/fapi/v1/openOrders"):
+                return [ex.order_json(o) for o in ex.orders.values() if o["venue"] == venue and (not sym or o["symbol"] == sym)]
+            if path == "/fapi/v1/marginType":
+                return {"code": 200, "msg": "success"}
+            if path == "/fapi/v1/leverage":
+                ex.leverage[sym] = int(q.get("leverage", 4))
+                return {"symbol": sym, "leverage": ex.leverage[sym]}
+            if path in KEY_ONLY:
+                return {} if method in ("PUT", "DELETE") else {"listenKey": f"sim-{venue}"}
+        raise ApiError(-1000, f"Unsupported endpoint {method} {path}", 404)
+
+    def _market(self, venue, sym):
+        m = self.ex.markets.get((venue, sym))
+        if m is None: raise ApiError(-1121, "Invalid symbol.")
+        return m
+
+    @staticmethod
+    def _one(rows, sym):
+        if not sym: return rows
+        r = next((x for x in rows if x["symbol"] == sym), None)
+        if r is None: raise ApiError(-1121, "Invalid symbol.")
+        return r
+
+    # ----- websocket -----
+    WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+    def _ws(self):
+        """upgrade → ส่ง event ของ stream ที่ขอจนกว่า client จะปิด (ทิ้ง depthUpdate ตาม --ws-gap-p)"""
+        u = urlsplit(self.path)
+        venue = "fut" if self.server.server_port == self.ex.fut_port else "spot"
+        if u.path.startswith("/ws/"): streams = {unquote(u.path[4:])}
+        else: streams = set(filter(None, dict(parse_qsl(u.query)).get("streams", "").split("/")))
+        combined = not u.path.startswith("/ws/")
+        accept = base64.b64encode(hashlib.sha1((self.headers["Sec-WebSocket-Key"] + self.WS_GUID).encode()).digest())
+        q = self.ex.subscribe(venue, streams)  # ก่อนตอบ 101: snapshot ที่ client ดึงหลังต่อติดต้องไม่ใหม่กว่า diff แรก
+        self.send_response(101, "Switching Protocols")
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept.decode())
+        self.end_headers()
+        self.ex.stats[f"ws_connect_{venue}"] += 1
+        closed = threading.Event()
+        threading.Thread(target=self._ws_reader, args=(closed,), name="sim-ws-read", daemon=True).start()
+        try:
+            while not closed.is_set():
+                try: stream, data = q.get(timeout=0.5)
+                except queue.Empty: continue
+                if data.get("e") == "depthUpdate" and random.random() < self.cfg.ws_gap_p:
+                    self.ex.stats["ws_gaps"] += 1
+                    continue
+                msg = {"stream": stream, "data": data} if combined else data
+                self._ws_send(json.dumps(msg).encode())
+        except OSError:
+            pass
+        finally:
+            self.ex.unsubscribe(q)
+            self.close_connection = True
+
+    def _ws_send(self, payload, opcode=1):
+        n = len(payload)
+        if n < 126: hdr = struct.pack("!BB", 0x80 | opcode, n)
+        elif n < 65536: hdr = struct.pack("!BBH", 0x80 | opcode, 126, n)
+        else: hdr = struct.pack("!BBQ", 0x80 | opcode, 127, n)
+        with self._ws_lock: self.wfile.write(hdr + payload)
+
+    def _ws_reader(self, closed):
+        """อ่าน frame จาก client (masked): close → ปิด, ping → pong; ข้อความอื่นไม่ใช้"""
+        r = self.rfile
+        try:
+            while True:
+                h = r.read(2)
+                if len(h) < 2: break
+                op, n = h[0] & 0x0F, h[1] & 0x7F
+                if n == 126: n = struct.unpack("!H", r.read(2))[0]
+                elif n == 127: n = struct.unpack("!Q", r.read(8))[0]
+                mask = r.read(4) if h[1] & 0x80 else b"\0\0\0\0"
+                data = bytes(b ^ mask[i % 4] for i, b in enumerate(r.read(n)))
+                if op == 8:
+                    try: self._ws_send(data[:2], 8)
+                    except OSError: pass
+                    break
+                if op == 9: self._ws_send(data, 10)
+        except (OSError, ValueError, struct.error):
+            pass
+        finally:
+            closed.set()
+            try: self.connection.shutdown(socket.SHUT_RDWR)
+            except OSError: pass
+
+    def do_GET(self):
+        if self.headers.get("Upgrade", "").lower() == "websocket":
+            self._ws_lock = threading.Lock()
+            return self._ws()
+        self._handle("GET")
+    def do_POST(self): self._handle("POST")
+    def do_PUT(self): self._handle("PUT")
+    def do_DELETE(self): self._handle("DELETE")
+
+class _Weight:
+    """นับ request ต่อนาที (สำหรับ header X-MBX-USED-WEIGHT-1M)"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.minute, self.n = 0, 0
+    def add(self, w):
+        with self.lock:
+            m = int(time.time()//60)
+            if m != self.minute: self.minute, self.n = m, 0
+            self.n += w
+    def used(self):
+        return self.n
+
+WEIGHT = _Weight()
+
+# ---------- main ----------
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Local simulated AsterDex (spot + futures REST/websocket)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8900, help="Spot; Futures ใช้ port+1")
+    ap.add_argument("--symbols", default="ASTERUSDT", help="คั่นด้วย ,")
+    ap.add_argument("--mid", type=float, default=1.0)
+    ap.add_argument("--basis-bps", type=float, default=30.0, help="Futures premium เฉลี่ย")
+    ap.add_argument("--basis-vol-bps", type=float, default=2.0)
+    ap.add_argument("--vol-bps", type=float, default=3.0, help="ความผันผวนต่อ step")
+    ap.add_argument("--step-ms", type=int, default=200, help="ระยะห่างการขยับราคา")
+    ap.add_argument("--tick", default="0.0001")
+    ap.add_argument("--step", default="0.01")
+    ap.add_argument("--min-notional", default="5")
+    ap.add_argument("--levels", type=int, default=50)
+    ap.add_argument("--level-qty", type=float, default=500.0)
+    ap.add_argument("--usdt", type=float, default=1000.0, help="USDT เริ่มต้นฝั่ง Spot")
+    ap.add_argument("--fut-usdt", type=float, default=1000.0)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--p-1021", type=float, default=0.0, help="โอกาส inject -1021 ต่อคำขอ signed")
+    ap.add_argument("--p-429", type=float, default=0.0, help="โอกาส inject HTTP 429 ต่อคำขอ")
+    ap.add_argument("--p-5022", type=float, default=0.0, help="โอกาส reject GTX (-5022) แม้ไม่กินคิว")
+    ap.add_argument("--ws-gap-p", type=float, default=0.0, help="โอกาสทิ้ง depth diff ต่อ event ต่อ websocket (ทดสอบ resync)")
+    ap.add_argument("--clock-skew-ms", type=int, default=0, help="เวลาเซิร์ฟเวอร์เร็ว/ช้ากว่าเครื่องจริง")
+    ap.add_argument("--api-key", default=os.environ.get("ASTERDEX_API_KEY", "sim"))
+    ap.add_argument("--api-secret", default=os.environ.get("ASTERDEX_API_SECRET", "sim"))
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--log-level", default="INFO", choices=["DEBUG","INFO","WARNING","ERROR"])
+    a = ap.parse_args(argv)
+    a.symbols = [s.strip().upper() for s in a.symbols.split(",") if s.strip()]
+    return a
+
+def serve(a):
+    """สร้างเซิร์ฟเวอร์ Spot/Futures (thread ละตัว) + thread ขยับราคา → (spot_url, fut_url, exchange)
+    ใช้ในโปรเซสเดียวกันได้ (เช่น benchmark); --port 0 = สุ่มพอร์ตว่าง"""
+    if a.seed is not None: random.seed(a.seed)
+    ex = Exchange(a)
+    handler = type("SimHandler", (Handler,), {"ex": ex, "cfg": a})
+    urls = []
+    for port in (a.port, a.port + 1 if a.port else 0):
+        srv = ThreadingHTTPServer((a.host, port), handler)
+        srv.daemon_threads = True
+        threading.Thread(target=srv.serve_forever, name=f"sim-http-{srv.server_port}", daemon=True).start()
+        urls.append(f"http://{a.host}:{srv.server_port}")
+    ex.fut_port = srv.server_port  # websocket แยก venue ตามพอร์ตที่ต่อเข้ามา
+    def ticker():
+        while True:
+            time.sleep(a.step_ms/1000.0)
+            ex.step()
+    threading.Thread(target=ticker, name="sim-price", daemon=True).start()
+    return urls[0], urls[1], ex
+
+def main():
+    a = parse_args()
+    logging.basicConfig(level=getattr(logging, a.log_level), format="%(asctime)s | %(levelname)s | %(message)s")
+    spot_url, fut_url, ex = serve(a)
+    logging.info(f"aster-sim spot={spot_url} fut={fut_url} symbols={','.join(a.symbols)}")
+    try:
+        while True: time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logging.info("stats: " + json.dumps(dict(ex.stats), sort_keys=True))
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+aster-sweep.py  (parallel parameter sweep)
+- โหลดไฟล์ .amr ครั้งเดียวลง shared memory แล้วให้ worker หลายโปรเซสอ่านร่วมกัน (ไม่คัดลอกข้อมูลต่อ config)
+- ทดลองทุก config แบบ grid (--param ชื่อ=ค่า,ค่า / lo:hi:step) หรือสุ่ม (--random N) ด้วย simulate() ของ aster-replay.py
+- จัดอันดับตาม pnl / trips ต่อวัน / max drawdown แล้วพิมพ์ top-N (+ CSV ทุก config ถ้าระบุ --out)
+- --nth ใช้ไม่ได้: ไฟล์บันทึกมีแค่ราคาดีสุด (และปริมาณ 2 ชั้น) จึงจำลองระดับที่ N ไม่ได้
+- จำลองแบบ --close-model flat เท่านั้น: parameter ที่ได้ไม่ตรงกับบอทค่าเริ่มต้น (--close-model depth) → รันบอทด้วย --close-model flat
+
+ตัวอย่าง:
+python3 aster-sweep.py rec/ASTERUSDT.amr --capital 120 --poll 3 \
+    --param target_profit=0.5:2:0.25 --param confirm_hits=1,2,3 --param max_close_spread_bps=10,20,40 \
+    --param min_close_depth_mult=1,1.2,2 --param max_hold_sec=600,1800,3600 --jobs 8
+"""
+
+import os, csv, time, random, argparse, itertools, importlib.util
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+def _load_replay():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "aster-replay.py")
+    spec = importlib.util.spec_from_file_location("aster_replay", path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+rp = _load_replay()
+
+# ---------- shared memory ----------
+def share(cols):
+    """คอลัมน์ทั้งหมดต่อกันใน SharedMemory ก้อนเดียว → (shm, layout [(name, offset)], n)"""
+    names = list(cols)
+    n = len(cols[names[0]])
+    shm = shared_memory.SharedMemory(create=True, size=max(8, 8*n*len(names)))
+    layout = []
+    for i, k in enumerate(names):
+        np.ndarray(n, dtype=np.float64, buffer=shm.buf, offset=8*n*i)[:] = cols[k]
+        layout.append((k, 8*n*i))
+    return shm, layout, n
+
+_W = {}  # สถานะของ worker: shm, cols, meta, base args, cache ของ precompute
+
+def _attach(name, layout, n, meta, base):
+    shm = shared_memory.SharedMemory(name=name)
+    cols = {k: np.ndarray(n, dtype=np.float64, buffer=shm.buf, offset=off) for k, off in layout}
+    for a in cols.values(): a.flags.writeable = False
+    _W.update(shm=shm, cols=cols, meta=meta, base=base, pre={})
+
+# ---------- evaluation ----------
+PRE_KEYS = ("poll", "taker_spot_bps", "taker_fut_bps", "slippage_bps", "max_close_spread_bps")
+
+def _run(cfg):
+    """หนึ่ง config (dict ของค่าที่ override) → dict ผลลัพธ์ (precompute ถูก cache ตามค่าที่มันใช้)"""
+    p = argparse.Namespace(**{**_W["base"], **cfg})
+    key = tuple(getattr(p, k) for k in PRE_KEYS)
+    pre = _W["pre"].get(key)
+    if pre is None:
+        if len(_W["pre"]) >= 16: _W["pre"].clear()
+        pre = _W["pre"][key] = rp.precompute(_W["cols"], p)
+    r = rp.simulate(_W["cols"], p, _W["meta"], p.batch, pre)
+    return {**cfg, "trips": r["trips"], "pnl": r["pnl"], "est": r["est"], "win_rate": r["win_rate"],
+            "trips_per_day": r["trips_per_day"], "max_drawdown": r["max_drawdown"], "avg_hold_sec": r["avg_hold_sec"]}
+
+def _run_chunk(cfgs):
+    return [_run(c) for c in cfgs]
+
+# ---------- search space ----------
+def parse_values(spec, cast):
+    """"a,b,c" หรือ "lo:hi:step" (รวม hi) → list"""
+    if ":" in spec:
+        lo, hi, step = (float(x) for x in spec.split(":"))
+        if step <= 0: raise ValueError(f"step ต้อง > 0: {spec}")
+        vals, k = [], 0
+        while lo + k*step <= hi + step*1e-9:
+            vals.append(round(lo + k*step, 10))
+            k += 1
+    else:
+        vals = [x for x in spec.split(",") if x != ""]
+    return [cast(v) for v in vals]
+
+def space(params, base):
+    """[(name, [values])] ตามชนิดของค่าเดิมใน args"""
+    out = []
+    for item in params:
+        name, _, spec = item.partition("=")
+        name = name.strip().lstrip("-").replace("-", "_")
+        if name not in base: raise SystemExit(f"ไม่รู้จักพารามิเตอร์: {name}")
+        if name == "nth": raise SystemExit("--nth จำลองไม่ได้: ไฟล์บันทึกมีแค่ราคาดีสุด")
+        cur = base[name]
+        cast = (lambda v: str(v).lower() in ("1","true","yes")) if isinstance(cur, bool) else \
+               (lambda v: int(float(v))) if isinstance(cur, int) else float
+        out.append((name, sorted(set(parse_values(spec, cast)))))
+    return out
+
+def configs(sp, n_random, seed):
+    names = [k for k, _ in sp]
+    total = 1
+    for _, v in sp: total *= len(v)
+    if n_random and n_random < total:
+        r = random.Random(seed)
+        picks = sorted(r.sample(range(total), n_random))  # สุ่มโดยไม่ซ้ำจาก index ของ grid
+        out = []
+        for idx in picks:
+            cfg = {}
+            for name, vals in reversed(sp):
+                idx, j = divmod(idx, len(vals))
+                cfg[name] = vals[j]
+            out.append({k: cfg[k] for k in names})
+        return out, total
+    return [dict(zip(names, combo)) for combo in itertools.product(*(v for _, v in sp))], total
+
+SORTS = {
+    "pnl":   lambda r: (-r["pnl"], -r["trips_per_day"], r["max_drawdown"]),
+    "trips": lambda r: (-r["trips_per_day"], -r["pnl"], r["max_drawdown"]),
+    "dd":    lambda r: (r["max_drawdown"], -r["pnl"], -r["trips_per_day"]),
+}
+
+# ---------- CLI ----------
+def build_parser():
+    ap = rp.build_parser()
+    ap.description = "AsterDex Maker v15 parameter sweep (shared-memory replay)"
+    ap.add_argument("--param", action="append", default=[],
+                    help="ชื่อ=ค่า,ค่า หรือ ชื่อ=lo:hi:step (ระบุซ้ำได้) เช่น target_profit=0.5:2:0.25")
+    ap.add_argument("--random", type=int, default=0, help="สุ่ม N config จาก grid แทนการลองทั้งหมด")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="จำนวนโปรเซส")
+    ap.add_argument("--chunk", type=int, default=0, help="config ต่องานที่ส่งให้ worker (0 = อัตโนมัติ)")
+    ap.add_argument("--sort", choices=sorted(SORTS), default="pnl")
+    ap.add_argument("--min-trips", type=int, default=1, help="ไม่จัดอันดับ config ที่เทรดน้อยกว่านี้")
+    ap.add_argument("--top", type=int, default=20)
+    ap.add_argument("--out", default="", help="เขียนผลทุก config เป็น CSV")
+    return ap
+
+def main():
+    p = build_parser().parse_args()
+    base = {k: v for k, v in vars(p).items() if k not in ("param", "random", "seed", "jobs", "chunk", "sort",
+                                                          "min_trips", "top", "out", "trades_out")}
+    sp = space(p.param, base)
+    if not sp: raise SystemExit("ต้องระบุ --param อย่างน้อยหนึ่งตัว")
+    cfgs, total = configs(sp, p.random, p.seed)
+
+    t0 = time.perf_counter()
+    meta, c = rp.load(p.recording)
+    shm, layout, n = share(c)
+    del c
+    t1 = time.perf_counter()
+    print(f"{meta['symbol']} ticks={n} configs={len(cfgs)}/{total} jobs={p.jobs} load={t1-t0:.2f}s")
+    try:
+        chunk = p.chunk or max(1, min(64, len(cfgs)//(p.jobs*8) or 1))
+        chunks = [cfgs[i:i+chunk] for i in range(0, len(cfgs), chunk)]
+        res = []
+        with ProcessPoolExecutor(p.jobs, initializer=_attach, initargs=(shm.name, layout, n, meta, base)) as ex:
+            for k, part in enumerate(ex.map(_run_chunk, chunks), 1):
+                res.extend(part)
+                if k % max(1, len(chunks)//10) == 0 or k == len(chunks):
+                    el = time.perf_counter() - t1
+                    print(f"  {len(res)}/{len(cfgs)} configs {el:.1f}s ({len(res)/max(el,1e-9):.1f}/s)")
+    finally:
+        shm.close()
+        shm.unlink()
+    t2 = time.perf_counter()
+
+    names = [k for k, _ in sp]
+    ranked = sorted((r for r in res if r["trips"] >= p.min_trips), key=SORTS[p.sort])
+    print(f"sweep {t2-t1:.1f}s ({len(res)/max(t2-t1,1e-9):.1f} configs/s); ranked {len(ranked)} by {p.sort}")
+    wid = {k: max(8, len(k)) for k in names}
+    head = " ".join(f"{k:>{wid[k]}}" for k in names)
+    print(f"{'#':>3} {head} {'pnl':>10} {'trips/d':>8} {'maxDD':>9} {'win%':>6} {'hold':>7}")
+    for i, r in enumerate(ranked[:p.top], 1):
+        vals = " ".join(f"{r[k]:>{wid[k]}g}" if not isinstance(r[k], bool) else f"{str(r[k]):>{wid[k]}}" for k in names)
+        print(f"{i:>3} {vals} {r['pnl']:>10.4f} {r['trips_per_day']:>8.1f} {r['max_drawdown']:>9.4f} "
+              f"{r['win_rate']*100:>5.1f}% {r['avg_hold_sec']:>6.0f}s")
+    if p.out:
+        cols = names + ["trips", "trips_per_day", "pnl", "est", "win_rate", "max_drawdown", "avg_hold_sec"]
+        with open(p.out, "w", newline="") as fh:
+            w = csv.DictWriter(fh, fieldnames=cols, extrasaction="ignore")
+            w.writeheader()
+            for r in sorted(res, key=SORTS[p.sort]): w.writerow(r)
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""สคริปต์ชื่อมีขีด → โหลดผ่าน importlib (แบบเดียวกับ aster-journal.py/aster-replay.py) ใหม่ทุกเทสต์ ให้ global ไม่ปนกัน"""
+
+import os, importlib.util
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load(filename, name):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, filename))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+@pytest.fixture
+def mk():
+    return load("aster-maker15.py", "aster_maker15")
+
+@pytest.fixture
+def filters(mk):
+    """ASTERUSDT บนทั้งสอง venue: tick 0.0001, step Spot 0.01 / Futures 0.1, notional ขั้นต่ำ 5"""
+    def put(base, symbol, tick, step, mn=5):
+        g = mk.Grid(tick, step, mn)
+        mk.FILTERS.filters[(base, symbol)] = mk.SymbolFilters(mk.D(tick), mk.D(step), mk.D(step), mk.D(mn), g)
+        return g
+    return {"spot": put(mk.SAPI, "ASTERUSDT", "0.0001", "0.01"), "fut": put(mk.FAPI, "ASTERUSDT", "0.0001", "0.1"),
+            "put": put}
+
+@pytest.fixture
+def sim():
+    """aster-sim.py ในโปรเซสนี้ (พอร์ตสุ่ม): .a (แก้ค่าได้ระหว่างเทสต์ เช่น ws_gap_p), .spot/.fut (http URL), .ex (Exchange)"""
+    s = load("aster-sim.py", "aster_sim")
+    a = s.parse_args(["--port", "0", "--step-ms", "50", "--api-key", "k", "--api-secret", "s", "--seed", "1"])
+    s.a = a
+    s.spot, s.fut, s.ex = s.serve(a)
+    return s
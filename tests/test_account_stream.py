@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""AccountState/OrderManager กับ user data stream ของ aster-sim.py: ยอด/โพสิชัน/fill มาจาก event ไม่ต้องถาม REST"""
+import time
+import pytest
+
+pytest.importorskip("websocket")
+
+SYM = "ASTERUSDT"
+
+def _wait(cond, timeout=5.0):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if cond(): return True
+        time.sleep(0.02)
+    return False
+
+@pytest.fixture
+def acct(mk, sim):
+    mk.SAPI, mk.FAPI = sim.spot, sim.fut
+    mk.SPOT_WS, mk.FUT_WS = sim.spot.replace("http:", "ws:"), sim.fut.replace("http:", "ws:")
+    mk.API_KEY, mk.API_SECRET = "k", b"s"
+    mk.ORDERS = mk.OrderManager(0)
+    acct = mk.ACCOUNT = mk.AccountState().start()
+    assert _wait(lambda: acct.live(mk.SAPI) and acct.live(mk.FAPI))
+    yield acct
+    acct.stop()
+
+def _grids(mk):
+    return mk.FILTERS.get(mk.SAPI, SYM).grid, mk.FILTERS.get(mk.FAPI, SYM).grid
+
+def test_resting_order_filled_by_stream(mk, sim, acct):
+    sg, _ = _grids(mk)
+    (bids, _), rest = mk.depth(mk.SAPI, SYM, 1), sim.ex.stats["GET /api/v1/order"]
+    px, qty = bids[0][0], sg.qty("20")
+    mk.ORDERS.submit(mk.SAPI, SYM, "BUY", qty, px, sg, lambda q, cid: mk.spot_limit_gtx(SYM, "BUY", q, px, sg, cid), "open")
+    o = mk.ORDERS.working(mk.SAPI, SYM, "BUY")[0]
+    assert _wait(lambda: acct.balances.get("USDT", (0, 0))[1] == sg.value(qty, px))  # เงินถูกล็อก (outboundAccountPosition)
+    with sim.ex.lock:  # ราคาลงมาชนออเดอร์ที่พักไว้ → เติมที่ราคาออเดอร์
+        m = sim.ex.markets[("spot", SYM)]
+        m.set_mid(float(sg.p(px)) - 0.001)
+        sim.ex._match_resting()
+    assert _wait(lambda: o["status"] == "FILLED")
+    assert o["filled"] == qty and o["quote"] == pytest.approx(sg.q(qty)*sg.p(px))
+    assert _wait(lambda: acct.spot_total("ASTER") == mk.D("20.00") and acct.balances["USDT"][1] == 0)
+    f = acct.fills[-1]
+    assert (f["venue"], f["side"], f["qty"], f["status"]) == ("spot", "BUY", mk.D("20.00"), "FILLED")
+    assert f["price"] == mk.D(sg.fmt_px(px))
+    assert sim.ex.stats["GET /api/v1/order"] == rest  # ไม่ต้อง query REST
+
+def test_taker_fill_and_position(mk, sim, acct):
+    _, fg = _grids(mk)
+    _, asks = mk.depth(mk.FAPI, SYM, 1)
+    qty = fg.qty("30")
+    mk.ORDERS.submit(mk.FAPI, SYM, "BUY", qty, asks[0][0], fg,
+                     lambda q, cid: mk.fut_limit_ioc(SYM, "BUY", q, asks[0][0], fg, False, cid), "hedge", taker=True)
+    assert _wait(lambda: (acct.position(SYM) or {}).get("qty") == mk.D("30.00"))
+    assert _wait(lambda: any(f["venue"] == "fut" for f in acct.fills))
+    f = next(f for f in acct.fills if f["venue"] == "fut")
+    assert f["price"] == mk.D(fg.fmt_px(asks[0][0])) and f["qty"] == mk.D("30.00")
+    led = mk.ORDERS.ledger_take(SYM)
+    assert led["fut"] == pytest.approx(30.0) and set(led["vol"]) == {"fut_taker"} and led["unpriced"] == 0
+
+def test_cancel_event(mk, sim, acct):
+    sg, _ = _grids(mk)
+    bids, _ = mk.depth(mk.SAPI, SYM, 1)
+    px = bids[0][0] - 10
+    mk.ORDERS.submit(mk.SAPI, SYM, "BUY", sg.qty("20"), px, sg, lambda q, cid: mk.spot_limit_gtx(SYM, "BUY", q, px, sg, cid), "open")
+    o = mk.ORDERS.working(mk.SAPI, SYM, "BUY")[0]
+    with sim.ex.lock:  # ยกเลิกฝั่ง exchange (เช่น วางมือ/ระบบ) → รู้จาก stream
+        sim.ex.cancel("spot", {"origClientOrderId": o["cid"]})
+    assert _wait(lambda: o["status"] == "CANCELED")
+    assert _wait(lambda: acct.balances["USDT"][1] == 0)
+
+def test_listen_key_expired_reconnects(mk, sim, acct):
+    n = sim.ex.stats["ws_connect_spot"]
+    with sim.ex.lock: sim.ex.publish("spot", "sim-spot", {"e": "listenKeyExpired", "E": 0})
+    assert _wait(lambda: sim.ex.stats["ws_connect_spot"] == n + 1 and acct.live(mk.SAPI), timeout=8)
+    assert acct.spot_free("USDT") == mk.D(str(sim.a.usdt))  # reconcile ผ่าน REST หลังต่อใหม่
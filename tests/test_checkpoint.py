@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import json
+
+def _place(status="NEW", executed="0", quote=None):
+    row = {"status": status, "orderId": 7, "executedQty": executed}
+    if quote is not None: row["cummulativeQuoteQty"] = quote
+    return lambda q, cid: row
+
+def test_round_trip(mk, filters, tmp_path):
+    path = str(tmp_path / "state.json")
+    sg, fg = filters["spot"], filters["fut"]
+    om = mk.ORDERS = mk.OrderManager(0)
+    om.submit(mk.SAPI, "ASTERUSDT", "BUY", sg.qty("100"), sg.px("0.7"), sg, _place("PARTIALLY_FILLED", "40", "28"), "open")
+    om.submit(mk.FAPI, "ASTERUSDT", "SELL", fg.qty("100"), fg.px("0.7012"), fg, _place(), "open")
+    om.submit(mk.FAPI, "ASTERUSDT", "BUY", fg.qty("10"), fg.px("0.69"), fg, _place("FILLED", "10"), "trim")  # จบแล้ว → ไม่เก็บ
+    cp = mk.Checkpoint(path, ["ASTERUSDT"])
+    cp.set_pair("ASTERUSDT", {"qty": "100", "open_basis": 0.12, "t0": 1.0})
+    cp.set_margin("ASTERUSDT", True, 4)
+    assert cp.save()
+    assert not cp.save()  # เนื้อหาไม่เปลี่ยน → ไม่เขียนซ้ำ
+
+    saved = om.export()
+    mk.ORDERS = mk.OrderManager(0)
+    cp2 = mk.Checkpoint(path, ["ASTERUSDT"])
+    assert cp2.pairs == {"ASTERUSDT": {"qty": "100", "open_basis": 0.12, "t0": 1.0}}
+    assert cp2.margin_ok("ASTERUSDT", True, 4) and not cp2.margin_ok("ASTERUSDT", False, 4)
+    assert mk.ORDERS.restore(cp2.orders) == 2
+    assert mk.ORDERS.export() == saved
+    o = next(o for o in mk.ORDERS.orders.values() if o["base"] == mk.SAPI)
+    assert (o["qty"], o["px"], o["filled"], o["quote"], o["tag"]) == (sg.qty("100"), sg.px("0.7"), sg.qty("40"), 28.0, "open")
+    assert (mk.SAPI, "ASTERUSDT") not in mk.ORDERS.synced  # ต้อง refresh จาก REST ก่อนใช้
+
+def test_only_own_symbols(mk, filters, tmp_path):
+    path = tmp_path / "state.json"
+    row = lambda sym: {"cid": f"am15x-{sym}", "venue": "fut", "symbol": sym, "side": "SELL", "tag": "open",
+                       "qty": "10.0", "px": "0.7000", "filled": "0.0", "quote": 0.0, "order_id": 1}
+    path.write_text(json.dumps({"version": mk.Checkpoint.VERSION, "sapi": mk.SAPI, "fapi": mk.FAPI,
+                                "pairs": {"ASTERUSDT": {"qty": "1"}, "BNBUSDT": {"qty": "2"}},
+                                "margin": {"BNBUSDT": [True, 4]},
+                                "orders": [row("ASTERUSDT"), row("BNBUSDT")]}))
+    cp = mk.Checkpoint(str(path), ["ASTERUSDT"])
+    assert list(cp.pairs) == ["ASTERUSDT"] and cp.margin == {}
+    assert [r["symbol"] for r in cp.orders] == ["ASTERUSDT"]
+
+def test_other_endpoint_is_cold_start(mk, tmp_path):
+    path = tmp_path / "state.json"
+    path.write_text(json.dumps({"version": mk.Checkpoint.VERSION, "sapi": "http://127.0.0.1:1", "fapi": mk.FAPI,
+                                "pairs": {"ASTERUSDT": {"qty": "1"}}, "margin": {}, "orders": []}))
+    assert mk.Checkpoint(str(path), ["ASTERUSDT"]).pairs == {}
+
+def test_unreadable_is_cold_start(mk, tmp_path):
+    path = tmp_path / "state.json"
+    path.write_text("{not json")
+    cp = mk.Checkpoint(str(path), ["ASTERUSDT"])
+    assert (cp.pairs, cp.margin, cp.orders) == ({}, {}, [])
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""Grid (int tick/step) ต้องให้ผลตรงกับ Decimal เดิม (_quant_floor/_fmt) ทุกหลัก"""
+import random
+from decimal import Decimal, ROUND_DOWN
+import pytest
+
+GRIDS = [("0.0001", "0.01"), ("0.01", "0.001"), ("0.5", "1"), ("1", "0.1"), ("0.00000001", "1000"), ("0.0025", "0.05")]
+
+def _values(rng, n=300):
+    out = ["0", "1", "0.00009999", "123456.789", "1e-5", "2.5E+3"]
+    out += [f"{rng.uniform(0, 5000):.{rng.randint(0, 10)}f}" for _ in range(n)]
+    return out
+
+@pytest.mark.parametrize("tick,step", GRIDS)
+def test_floor_and_format_match_decimal(mk, tick, step):
+    g, rng = mk.Grid(tick, step), random.Random(f"{tick}/{step}")
+    for x in _values(rng):
+        assert g.fmt_px(g.px(x)) == mk._fmt(Decimal(x), Decimal(tick)), x
+        assert g.fmt_qty(g.qty(x)) == mk._fmt(Decimal(x), Decimal(step)), x
+        assert Decimal(g.fmt_px(g.px(x))) == mk._quant_floor(Decimal(x), Decimal(tick))
+
+@pytest.mark.parametrize("tick,step", GRIDS)
+def test_qty_up(mk, tick, step):
+    g, rng = mk.Grid(tick, step), random.Random(step)
+    for x in _values(rng):
+        want = (Decimal(x)/Decimal(step)).to_integral_value(rounding="ROUND_CEILING")
+        assert g.qty(x, up=True) == int(want), x
+
+@pytest.mark.parametrize("tick,step", GRIDS)
+def test_fast_parse_round_trips(mk, tick, step):
+    g, rng = mk.Grid(tick, step), random.Random(tick)
+    for _ in range(500):
+        t, n = rng.randint(1, 10**9), rng.randint(0, 10**9)
+        assert g.ticks(g.fmt_px(t)) == t and g.steps(g.fmt_qty(n)) == n
+        assert g.p(t) == float(Decimal(g.fmt_px(t))) and g.q(n) == float(Decimal(g.fmt_qty(n)))
+
+def test_value_and_notional(mk):
+    g = mk.Grid("0.0001", "0.01", min_notional="5")
+    t, n = g.px("0.7003"), g.qty("7.14")
+    assert g.value(n, t) == Decimal("0.7003")*Decimal("7.14")
+    assert g.notional_ok(n, t)                       # 5.000142
+    assert not g.notional_ok(g.qty("7.13"), t)       # 4.993139
+    assert not g.notional_ok(0, t)
+    assert mk.Grid("0.1", "1", min_notional="0.05").mn_u == 1  # ปัดขึ้นเป็นหน่วย 10^-(pd+qd)
+
+@pytest.mark.parametrize("tick,step", GRIDS)
+def test_qty_for(mk, tick, step):
+    g, rng = mk.Grid(tick, step), random.Random(tick + step)
+    for _ in range(300):
+        amount, t = f"{rng.uniform(1, 10000):.{rng.randint(0, 6)}f}", rng.randint(1, 10**6)
+        price = Decimal(g.fmt_px(t))
+        want = (Decimal(amount)/price/Decimal(step)).to_integral_value(rounding=ROUND_DOWN)
+        assert g.qty_for(amount, t) == int(want), (amount, t)
+        whole = (Decimal(amount)/price).to_integral_value(rounding=ROUND_DOWN)
+        assert g.qty_for(amount, t, whole=True) == int(_floor_steps(whole, Decimal(step))), (amount, t)
+    assert g.qty_for("100", 0) == 0
+
+def _floor_steps(x, step):
+    return (x/step).to_integral_value(rounding=ROUND_DOWN)
+
+def test_steps_from(mk):
+    spot, fut = mk.Grid("0.0001", "0.01"), mk.Grid("0.0001", "0.1")
+    assert fut.steps_from(spot, 12345) == 1234           # 123.45 → 123.4
+    assert fut.steps_from(spot, 12345, up=True) == 1235  # → 123.5
+    assert spot.steps_from(fut, 1234) == 12340
+    assert mk.Grid("1", "5").steps_from(mk.Grid("1", "2"), 7) == 2  # 14 → 10
+
+def test_bad_grid(mk):
+    with pytest.raises(RuntimeError): mk.Grid("0", "0.01")
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Hedger._plan: ขาที่ต้องตาม/จำนวน step จาก resid, หัก trim ของขาที่นำ, ปิดรอบเมื่อครบ (ไม่เริ่ม thread)"""
+import time
+import pytest
+
+SYM = "ASTERUSDT"
+
+@pytest.fixture
+def hg(mk, filters):
+    mk.ORDERS = mk.OrderManager(0)
+    return mk.Hedger()
+
+def _fill(mk, h, g, base, side, qty, tag="open"):
+    h.on_fill({"base": base, "symbol": SYM, "side": side, "tag": tag, "grid": g}, g.qty(qty))
+
+def _trim(mk, base, side, qty, g):
+    cid = f"am15-trim-{len(mk.ORDERS.orders)}"
+    mk.ORDERS.orders[cid] = {"base": base, "symbol": SYM, "side": side, "tag": "trim", "status": "NEW",
+                             "qty": g.qty(qty), "filled": 0, "grid": g}
+
+def test_spot_fill_plans_fut_leg(mk, filters, hg):
+    _fill(mk, hg, filters["spot"], mk.SAPI, "BUY", "10")
+    assert hg.residual(SYM) == 10.0
+    venue, side, base, g, qty, since = hg._plan(SYM)
+    assert (venue, side, base, g) == ("fut", "SELL", mk.FAPI, filters["fut"])
+    assert qty == filters["fut"].qty("10") and since is not None
+
+def test_round_closes_when_matched(mk, filters, hg):
+    _fill(mk, hg, filters["spot"], mk.SAPI, "BUY", "10")
+    _fill(mk, hg, filters["fut"], mk.FAPI, "SELL", "6", "hedge")
+    assert hg._plan(SYM)[4] == filters["fut"].qty("4")
+    assert hg.stats["hedged"] == 0
+    _fill(mk, hg, filters["fut"], mk.FAPI, "SELL", "4", "hedge")
+    assert hg._plan(SYM) == ("fut", "SELL", mk.FAPI, filters["fut"], 0, None)
+    assert hg.stats["hedged"] == 1 and hg.state[SYM]["leg"] is None
+    assert hg._plan(SYM) is None
+
+def test_overshoot_flips_leg(mk, filters, hg):
+    _fill(mk, hg, filters["spot"], mk.SAPI, "BUY", "10")
+    _fill(mk, hg, filters["fut"], mk.FAPI, "SELL", "12", "hedge")
+    venue, side, _, g, qty, since = hg._plan(SYM)
+    assert (venue, side) == ("spot", "BUY") and g is filters["spot"]
+    assert qty == filters["spot"].qty("2") and since is not None
+
+def test_working_trim_on_lead_reduces_plan(mk, filters, hg):
+    _fill(mk, hg, filters["spot"], mk.SAPI, "BUY", "10")
+    _trim(mk, mk.SAPI, "SELL", "3", filters["spot"])  # ขาที่นำ (Spot BUY) กำลังถูกดึงกลับ 3
+    assert hg._plan(SYM)[4] == filters["fut"].qty("7")
+    _trim(mk, mk.SAPI, "SELL", "9", filters["spot"])
+    qty, since = hg._plan(SYM)[4:]
+    assert qty == 0 and since is not None  # trim ยังค้าง → ยังไม่ปิดรอบ
+    assert hg.stats["hedged"] == 0
+    _trim(mk, mk.FAPI, "BUY", "5", filters["fut"])  # trim ของขาที่ตามไม่เกี่ยว
+    assert hg._plan(SYM)[4] == 0
+
+def test_trim_fill_only_pulls_lead_back(mk, filters, hg):
+    _fill(mk, hg, filters["spot"], mk.SAPI, "BUY", "10")
+    _fill(mk, hg, filters["spot"], mk.SAPI, "SELL", "3", "trim")
+    assert hg.residual(SYM) == 7.0
+    _fill(mk, hg, filters["spot"], mk.SAPI, "SELL", "20", "trim")
+    assert hg.residual(SYM) == 0.0  # ไม่เลยไปอีกฝั่ง
+    _fill(mk, hg, filters["spot"], mk.SAPI, "SELL", "5", "trim")
+    assert hg.residual(SYM) == 0.0
+    _fill(mk, hg, filters["spot"], mk.SAPI, "BUY", "5", "adopted")
+    assert hg.residual(SYM) == 0.0 and hg.stats["fills"] == 4
+
+def test_reconcile_caps_after_settle(mk, filters, hg):
+    _fill(mk, hg, filters["spot"], mk.SAPI, "BUY", "10")
+    at = hg.state[SYM]["fill_at"]
+    hg.reconcile(SYM, 4, 0, at)  # ยอดที่อ่านอาจยังไม่รวม fill → ไม่แตะ
+    assert hg.residual(SYM) == 10.0
+    hg.reconcile(SYM, 4, 0, at + hg.SETTLE + 0.1)
+    assert hg.residual(SYM) == 4.0 and hg.stats["reconciled"] == 1
+    assert hg._plan(SYM)[4] == filters["fut"].qty("4")
+    hg.reconcile(SYM, 0, 1, time.perf_counter() + hg.SETTLE)  # imbalance จริงสวนทิศ → 0
+    assert hg.residual(SYM) == 0.0
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+def _ev(U, u, b=(), a=(), pu=None):
+    ev = {"e": "depthUpdate", "U": U, "u": u, "b": [list(x) for x in b], "a": [list(x) for x in a]}
+    if pu is not None: ev["pu"] = pu
+    return ev
+
+SNAP = {"lastUpdateId": 100, "bids": [["0.7000", "10"], ["0.6999", "5"]], "asks": [["0.7001", "8"], ["0.7002", "3"]]}
+
+@pytest.fixture
+def spot(mk):
+    book = mk.LocalBook(False, mk.Grid("0.0001", "0.01"))
+    assert book.load_snapshot(SNAP)
+    return book
+
+@pytest.fixture
+def fut(mk):
+    book = mk.LocalBook(True, mk.Grid("0.0001", "0.01"))
+    assert book.load_snapshot(SNAP)
+    return book
+
+def test_snapshot_on_grid(spot):
+    g = spot.grid
+    assert spot.bids == {7000: g.steps("10"), 6999: g.steps("5")}
+    assert spot.best == (7000, 7001) and spot.top_changed
+    assert spot.top(1) == ([(7000, 1000)], [(7001, 800)])
+
+def test_spot_sequence(spot):
+    assert spot.apply(_ev(95, 100))                      # เก่ากว่า snapshot → ข้าม
+    assert spot.apply(_ev(99, 101, b=[("0.7000", "12")]))  # แรกหลัง snapshot คร่อม lastUpdateId
+    assert spot.bids[7000] == 1200 and not spot.top_changed
+    assert spot.apply(_ev(102, 103, b=[("0.7000", "0")], a=[("0.7001", "0")]))
+    assert spot.best == (6999, 7002) and spot.top_changed and spot.last_id == 103
+    assert not spot.apply(_ev(105, 106))                 # 104 หาย → gap
+    assert spot.last_id == 103
+
+def test_spot_first_event_must_connect(spot):
+    assert not spot.apply(_ev(102, 103))
+
+def test_fut_sequence(fut):
+    assert fut.apply(_ev(100, 104, pu=99))               # แรกหลัง snapshot: U <= id < u (ไม่ดู pu)
+    assert fut.apply(_ev(105, 108, a=[("0.7001", "1")], pu=104))
+    assert fut.asks[7001] == 100
+    assert not fut.apply(_ev(110, 112, pu=109))          # pu ไม่ต่อกับ u ก่อนหน้า → gap
+    assert fut.last_id == 108
+
+def test_fut_first_event_must_straddle(fut):
+    assert not fut.apply(_ev(101, 104, pu=100))
+
+def test_unsynced_rejects(spot):
+    spot.synced = False
+    assert not spot.apply(_ev(101, 101))
+
+def test_snapshot_replays_pending(mk, spot):
+    spot.synced = False
+    spot.pending.extend([_ev(99, 101), _ev(102, 102, b=[("0.7003", "1")]), _ev(103, 103, a=[("0.7002", "0")])])
+    assert spot.load_snapshot({**SNAP, "lastUpdateId": 101})  # ตัวแรกเก่ากว่า snapshot → ข้าม ที่เหลือเล่นต่อ
+    assert spot.last_id == 103 and spot.best == (7003, 7001) and spot.top_changed
+    assert not spot.pending
+
+def test_snapshot_pending_gap(spot):
+    spot.synced = False
+    spot.pending.extend([_ev(105, 106)])
+    assert not spot.load_snapshot(SNAP)                  # diff ที่ค้างไม่ต่อกับ snapshot → ต้อง resync ใหม่
+    assert not spot.synced and not spot.pending
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""MarketData กับ websocket ของ aster-sim.py: sync จาก snapshot + diff, gap → resync, และ fallback ไป REST depth"""
+import time
+import pytest
+
+pytest.importorskip("websocket")
+
+SYM = "ASTERUSDT"
+
+@pytest.fixture
+def md(mk, sim):
+    mk.SAPI, mk.FAPI = sim.spot, sim.fut
+    mk.SPOT_WS, mk.FUT_WS = sim.spot.replace("http:", "ws:"), sim.fut.replace("http:", "ws:")
+    md = mk.MD = mk.MarketData([SYM]).start()
+    yield md
+    md.stop()
+
+def _wait(cond, timeout=5.0):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if cond(): return True
+        time.sleep(0.02)
+    return False
+
+def _matches(md, sim, base, venue, timeout=5.0):
+    """book ในหน่วยความจำ = book ของ sim ที่ update id เดียวกัน (หยุดราคาไว้ด้วย ex.lock ระหว่างรอ diff ล่าสุด)"""
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        with sim.ex.lock:
+            m = sim.ex.markets[(venue, SYM)]
+            stop = time.monotonic() + 0.5
+            while time.monotonic() < stop:
+                with md.lock:
+                    b = md.books[(base, SYM)]
+                    if b.synced and b.last_id == m.update_id:
+                        bids, asks = m.levels_map()
+                        g = b.grid
+                        return b.bids == {n: g.steps(q) for n, q in bids.items()} and \
+                               b.asks == {n: g.steps(q) for n, q in asks.items()}
+                time.sleep(0.01)
+        time.sleep(0.05)
+    return False
+
+def test_sync_and_follow_diffs(mk, sim, md):
+    assert _wait(lambda: all(f.connected for f in md.feeds.values()))
+    for base, venue in ((mk.SAPI, "spot"), (mk.FAPI, "fut")):
+        assert _matches(md, sim, base, venue)
+    first = md.books[(mk.SAPI, SYM)].last_id
+    assert _wait(lambda: md.books[(mk.SAPI, SYM)].last_id > first + 5)  # ตามราคาที่ขยับต่อโดยไม่ต้อง snapshot ใหม่
+    assert md.resyncs == 2
+    assert _wait(lambda: md.spot_last(SYM) is not None and md.mark_price(SYM) is not None)
+
+def test_gap_triggers_resync(mk, sim, md):
+    assert _wait(lambda: md.resyncs == 2 and all(b.synced for b in md.books.values()))
+    md.RESYNC_SEC = 0.2
+    sim.a.ws_gap_p = 0.2
+    assert _wait(lambda: sim.ex.stats["ws_gaps"] >= 5 and md.resyncs >= 4, timeout=10)
+    sim.a.ws_gap_p = 0.0
+    for base, venue in ((mk.SAPI, "spot"), (mk.FAPI, "fut")):
+        assert _matches(md, sim, base, venue)
+
+def test_rest_fallback(mk, sim, md):
+    assert _wait(lambda: all(b.synced for b in md.books.values()))
+    md.stop()
+    assert _wait(lambda: not any(f.connected for f in md.feeds.values()))
+    assert md.depth(mk.FAPI, SYM, 5) is None and md.spot_last(SYM) is None
+    before = sim.ex.stats["GET /fapi/v1/depth"]
+    bids, asks = mk.depth(mk.FAPI, SYM, 5)
+    assert sim.ex.stats["GET /fapi/v1/depth"] == before + 1
+    assert len(bids) == 5 and bids[0][0] < asks[0][0]
+
+def test_unsynced_book_not_served(mk, sim):
+    mk.SAPI, mk.FAPI = sim.spot, sim.fut
+    md = mk.MarketData([SYM])  # ไม่ start: ตั้ง connected เองเพื่อดูเฉพาะเงื่อนไข synced
+    md.feeds[mk.SAPI].connected = True
+    assert md.depth(mk.SAPI, SYM, 5) is None
+    md.books[(mk.SAPI, SYM)].load_snapshot(mk.depth_snapshot(mk.SAPI, SYM, 100))
+    bids, asks = md.depth(mk.SAPI, SYM, 5)
+    assert len(bids) == len(asks) == 5
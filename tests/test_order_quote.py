@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""OrderManager.quote: คงออเดอร์ที่ตรงอยู่แล้ว / ยกเลิกแล้ววางใหม่เมื่อราคา-จำนวนเปลี่ยน / ไม่แตะ "foreign" """
+from collections import Counter
+import pytest
+
+SYM = "ASTERUSDT"
+
+class Venue:
+    """แทน _req: ออเดอร์ตาม clientOrderId ฝั่ง exchange + นับคำขอ; fill_on_cancel[cid] = step ที่ถูกเติมก่อนยกเลิกทัน"""
+    def __init__(self, mk, g):
+        self.mk, self.g = mk, g
+        self.rows, self.calls, self.fill_on_cancel = {}, Counter(), {}
+
+    def __call__(self, base, path, method="GET", params=None, signed=False, **kw):
+        self.calls[(method, path.rsplit("/", 1)[-1])] += 1
+        if path.endswith("openOrders"):
+            return [dict(r) for r in self.rows.values() if r["status"] in self.mk.WORKING]
+        r = self.rows.get(params["origClientOrderId"])
+        if method == "DELETE":
+            if r is None or r["status"] not in self.mk.WORKING: raise self.mk.ApiError({"code": -2011, "msg": "Unknown order sent."})
+            self.fill(r["clientOrderId"], self.fill_on_cancel.pop(r["clientOrderId"], 0))
+            r["status"] = "CANCELED"
+        return dict(r)
+
+    def add(self, cid, side, qty, px, status="NEW"):
+        g = self.g
+        self.rows[cid] = {"clientOrderId": cid, "orderId": len(self.rows) + 1, "side": side, "status": status,
+                          "origQty": g.fmt_qty(qty), "price": g.fmt_px(px), "executedQty": g.fmt_qty(0)}
+        return dict(self.rows[cid])
+
+    def fill(self, cid, n):
+        r = self.rows[cid]
+        done = self.g.qty(r["executedQty"]) + n
+        r["executedQty"] = self.g.fmt_qty(done)
+        if done: r["status"] = "FILLED" if done >= self.g.qty(r["origQty"]) else "PARTIALLY_FILLED"
+
+    def placer(self, side, px):
+        return lambda q, cid: self.add(cid, side, q, px)
+
+@pytest.fixture
+def env(mk, filters):
+    g = filters["spot"]
+    v = Venue(mk, g)
+    mk._req = v
+    return mk.OrderManager(0), v, g
+
+def _quote(om, v, g, qty, px, side="BUY", tag="open"):
+    return om.quote(v.mk.SAPI, SYM, side, qty, px, g, v.placer(side, px), tag)
+
+def test_keep_same_quote(env):
+    om, v, g = env
+    q, px = g.qty("100"), g.px("0.7")
+    assert _quote(om, v, g, q, px) == q
+    assert _quote(om, v, g, q, px) == 0
+    assert om.stats == {"placed": 1, "kept": 1, "replaced": 0, "canceled": 0}
+    assert v.calls[("DELETE", "order")] == 0 and len(v.rows) == 1
+
+def test_replace_on_price_or_qty(env):
+    om, v, g = env
+    q, px = g.qty("100"), g.px("0.7")
+    _quote(om, v, g, q, px)
+    first = next(iter(v.rows))
+    assert _quote(om, v, g, q, px - 1) == q
+    assert v.rows[first]["status"] == "CANCELED" and om.orders[first]["status"] == "CANCELED"
+    assert _quote(om, v, g, g.qty("90"), px - 1) == g.qty("90")
+    assert om.stats["replaced"] == om.stats["canceled"] == 2
+    live = om.working(v.mk.SAPI, SYM, "BUY")
+    assert len(live) == 1 and (live[0]["qty"], live[0]["px"]) == (g.qty("90"), px - 1)
+
+def test_requote_ticks_tolerance(mk, env):
+    _, v, g = env
+    om = mk.OrderManager(2)
+    q, px = g.qty("100"), g.px("0.7")
+    _quote(om, v, g, q, px)
+    assert _quote(om, v, g, q, px + 2) == 0  # ห่าง ≤ 2 tick → คงตัวเดิม (ราคาเดิม)
+    assert om.working(v.mk.SAPI, SYM, "BUY")[0]["px"] == px
+    assert _quote(om, v, g, q, px + 3) == q
+
+def test_partial_fill_counts_toward_quote(env):
+    om, v, g = env
+    q, px = g.qty("100"), g.px("0.7")
+    _quote(om, v, g, q, px)
+    cid = next(iter(v.rows))
+    v.fill(cid, g.qty("30"))
+    assert _quote(om, v, g, g.qty("70"), px) == 0  # refresh เห็น fill 30 → ที่เหลือ 70 ตรงกับที่ต้องการ
+    assert om.orders[cid]["filled"] == g.qty("30")
+    v.fill_on_cancel[cid] = g.qty("10")             # เติมอีก 10 ก่อนยกเลิกทัน → วางใหม่แค่ 60
+    assert _quote(om, v, g, g.qty("70"), px - 5) == g.qty("60")
+    assert om.orders[cid]["filled"] == g.qty("40")
+
+def test_foreign_untouched_adopted_replaced(env):
+    om, v, g = env
+    px = g.px("0.7")
+    v.add("manual-1", "BUY", g.qty("50"), px)
+    v.add(om.PREFIX + "999-1", "BUY", g.qty("50"), px)
+    assert _quote(om, v, g, g.qty("100"), px) == g.qty("100")
+    assert om.orders["manual-1"]["tag"] == "foreign" and v.rows["manual-1"]["status"] == "NEW"
+    assert om.orders[om.PREFIX + "999-1"]["tag"] == "adopted" and v.rows[om.PREFIX + "999-1"]["status"] == "CANCELED"
+    assert _quote(om, v, g, g.qty("100"), px) == 0  # ตัวใหม่ตรงแล้ว; foreign ไม่นับเป็นของเรา
+
+def test_below_min_notional_not_placed(env):
+    om, v, g = env
+    assert _quote(om, v, g, g.qty("1"), g.px("0.7")) == 0
+    assert not v.rows and om.stats["placed"] == 0
+
+def test_rejected_submit_is_not_working(mk, env):
+    om, v, g = env
+    def reject(q, cid): raise mk.ApiError({"code": -5022, "msg": "post only"})
+    with pytest.raises(mk.ApiError):
+        om.quote(mk.SAPI, SYM, "BUY", g.qty("100"), g.px("0.7"), g, reject, "open")
+    assert not om.working(mk.SAPI, SYM) and (mk.SAPI, SYM) in om.synced
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""RateLimiter: ช่องทางด่วนของคำสั่ง order/cancel — market-data ไม่แตะ reserve และหลีกทางเมื่อมีคำสั่งรอ"""
+import threading
+
+BASE = "https://venue"
+
+def _bg(fn, *a):
+    t = threading.Thread(target=fn, args=a, daemon=True)
+    t.start()
+    return t
+
+def _refill(lim, kind):
+    with lim.cv:
+        b = lim._bucket(BASE, kind)
+        b.tokens = b.capacity
+        lim.cv.notify_all()
+
+def test_market_data_keeps_reserve_for_orders(mk):
+    lim = mk.RateLimiter(weight_1m=60, orders_10s=50, reserve=0.5)  # 1 weight/s, reserve 30
+    lim.acquire(BASE, 30)
+    md = _bg(lim.acquire, BASE, 1)
+    md.join(0.2)
+    assert md.is_alive()  # เหลือ 30 = reserve พอดี → market-data ต้องรอ
+    lim.acquire(BASE, 30, order=1)  # คำสั่งใช้ reserve ได้ทันที
+    assert lim._bucket(BASE, "weight").tokens < 1
+    _refill(lim, "weight")
+    md.join(2)
+    assert not md.is_alive()
+
+def test_market_data_yields_to_waiting_order(mk):
+    lim = mk.RateLimiter(weight_1m=1200, orders_10s=1, reserve=0.2)
+    lim.acquire(BASE, 1, order=1)
+    done = []
+    od = _bg(lambda: (lim.acquire(BASE, 1, order=1), done.append("order")))
+    od.join(0.2)
+    assert od.is_alive() and lim.hi_waiting == 1  # ติด limit ออเดอร์/10s
+    md = _bg(lambda: (lim.acquire(BASE, 1), done.append("md")))
+    md.join(0.2)
+    assert md.is_alive()  # weight เหลือเฟือแต่มีคำสั่งรอ → หลีกทาง
+    _refill(lim, "order")
+    od.join(2); md.join(2)
+    assert done == ["order", "md"] and lim.hi_waiting == 0
+
+def test_batch_counts_each_order(mk):
+    lim = mk.RateLimiter(weight_1m=1200, orders_10s=5, reserve=0.2)
+    lim.acquire(BASE, 5, order=5)
+    t = _bg(lim.acquire, BASE, 1, 1)
+    t.join(0.2)
+    assert t.is_alive()
+    _refill(lim, "order")
+    t.join(2)
+    assert not t.is_alive()
+
+def test_penalize_blocks_orders_too(mk):
+    lim = mk.RateLimiter()
+    lim.penalize(BASE, 0.3)
+    t = _bg(lim.acquire, BASE, 1, 1)
+    t.join(0.1)
+    assert t.is_alive()
+    t.join(2)
+    assert not t.is_alive()
+    lim.acquire("https://other", 1)  # venue อื่นไม่โดน